@@ -1,7 +1,9 @@
-﻿from fastapi import FastAPI, Depends, HTTPException, status
+﻿from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Optional
+import base64
+import binascii
 import models
 import database
 from pydantic import BaseModel
@@ -14,7 +16,7 @@ class ProductBase(BaseModel):
     description: str = ""
     category: str = ""
     stock_quantity: int = 1
-    image_url: str = ""
+    image_url: Optional[str] = ""
 
 class ProductCreate(ProductBase):
     store_id: int
@@ -48,6 +50,14 @@ class StoreResponse(StoreBase):
     class Config:
         from_attributes = True
 
+class ProductPage(BaseModel):
+    items: List[ProductResponse]
+    next_cursor: Optional[str] = None
+
+class StorePage(BaseModel):
+    items: List[StoreResponse]
+    next_cursor: Optional[str] = None
+
 # Initialize FastAPI
 app = FastAPI(title="Dundalk Market API", version="2.0.0")
 
@@ -62,6 +72,55 @@ app.add_middleware(
 
 # Create database tables
 models.Base.metadata.create_all(bind=database.engine)
+# create_all skips indexes on tables that already exist, so add any new ones
+for table in models.Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=database.engine, checkfirst=True)
+
+# ============ PAGINATION ============
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    try:
+        value = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Ids are never negative
+    if value < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+def paginate(query, id_column, cursor: Optional[str], limit: int):
+    """Keyset pagination on the primary key: WHERE id > :cursor ORDER BY id LIMIT n"""
+    after_id = decode_cursor(cursor)
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def filter_products(query, category: Optional[str], min_price: Optional[float], max_price: Optional[float]):
+    if category:
+        query = query.filter(models.Product.category == category)
+    if min_price is not None:
+        query = query.filter(models.Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(models.Product.price <= max_price)
+    return query
+
+# ============ LOADING STRATEGIES ============
+
+# Load a page of stores' active products in one extra SELECT ... WHERE store_id IN (...)
+# instead of one lazy load per store, and keep inactive products out of the response
+ACTIVE_PRODUCTS = selectinload(models.Store.products.and_(models.Product.is_active == True))
 
 # ============ STORE ENDPOINTS ============
 
@@ -91,14 +150,22 @@ def health_check(db: Session = Depends(database.get_db)):
         "timestamp": datetime.utcnow().isoformat()
     }
 
-@app.get("/stores", response_model=List[StoreResponse])
-def get_stores(db: Session = Depends(database.get_db)):
-    stores = db.query(models.Store).filter(models.Store.is_approved == True).all()
-    return stores
+@app.get("/stores", response_model=StorePage)
+def get_stores(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    db: Session = Depends(database.get_db)
+):
+    query = db.query(models.Store).options(ACTIVE_PRODUCTS).filter(models.Store.is_approved == True)
+    if category:
+        query = query.filter(models.Store.category == category)
+    stores, next_cursor = paginate(query, models.Store.id, cursor, limit)
+    return {"items": stores, "next_cursor": next_cursor}
 
 @app.get("/stores/{store_id}", response_model=StoreResponse)
 def get_store(store_id: int, db: Session = Depends(database.get_db)):
-    store = db.query(models.Store).filter(models.Store.id == store_id).first()
+    store = db.query(models.Store).options(ACTIVE_PRODUCTS).filter(models.Store.id == store_id).first()
     if not store:
         raise HTTPException(status_code=404, detail="Store not found")
     return store
@@ -118,18 +185,40 @@ def create_store(store: StoreCreate, db: Session = Depends(database.get_db)):
 
 # ============ PRODUCT ENDPOINTS ============
 
-@app.get("/products", response_model=List[ProductResponse])
-def get_products(db: Session = Depends(database.get_db)):
-    products = db.query(models.Product).filter(models.Product.is_active == True).all()
-    return products
+@app.get("/products", response_model=ProductPage)
+def get_products(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    store_id: Optional[int] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    db: Session = Depends(database.get_db)
+):
+    query = db.query(models.Product).filter(models.Product.is_active == True)
+    if store_id is not None:
+        query = query.filter(models.Product.store_id == store_id)
+    query = filter_products(query, category, min_price, max_price)
+    products, next_cursor = paginate(query, models.Product.id, cursor, limit)
+    return {"items": products, "next_cursor": next_cursor}
 
-@app.get("/stores/{store_id}/products", response_model=List[ProductResponse])
-def get_store_products(store_id: int, db: Session = Depends(database.get_db)):
-    products = db.query(models.Product).filter(
+@app.get("/stores/{store_id}/products", response_model=ProductPage)
+def get_store_products(
+    store_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    db: Session = Depends(database.get_db)
+):
+    query = db.query(models.Product).filter(
         models.Product.store_id == store_id,
         models.Product.is_active == True
-    ).all()
-    return products
+    )
+    query = filter_products(query, category, min_price, max_price)
+    products, next_cursor = paginate(query, models.Product.id, cursor, limit)
+    return {"items": products, "next_cursor": next_cursor}
 
 @app.post("/products", response_model=ProductResponse)
 def create_product(product: ProductCreate, db: Session = Depends(database.get_db)):
@@ -1,4 +1,4 @@
-﻿from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+﻿from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -12,6 +12,9 @@ class Store(Base):
     email = Column(String(100), unique=True, index=True)
     phone = Column(String(20))
     address = Column(Text)
+    # Geocoded from address (geo.py); indexed by the spatial index, not a B-tree
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     description = Column(Text)
     category = Column(String(50))
     stripe_account_id = Column(String(100), nullable=True)
@@ -21,6 +24,11 @@ class Store(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     products = relationship("Product", back_populates="store")
+    
+    # Keyset pagination over approved stores (GET /stores)
+    __table_args__ = (
+        Index("ix_stores_approved_id", "is_approved", "id"),
+    )
 
 class Product(Base):
     __tablename__ = "products"
@@ -38,3 +46,111 @@ class Product(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     store = relationship("Store", back_populates="products")
+    
+    # Keyset pagination indexes: each listing filter seeks straight to the cursor
+    __table_args__ = (
+        Index("ix_products_active_id", "is_active", "id"),
+        Index("ix_products_store_active_id", "store_id", "is_active", "id"),
+        Index("ix_products_category_active_id", "category", "is_active", "id"),
+        # min/max price per group, for the stats triggers' recomputes
+        Index("ix_products_store_active_price", "store_id", "is_active", "price"),
+        Index("ix_products_category_active_price", "category", "is_active", "price"),
+    )
+
+# Aggregates over active products, kept current by the triggers in stats.py
+class StoreStats(Base):
+    __tablename__ = "store_stats"
+    
+    store_id = Column(Integer, primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    price_sum = Column(Float, nullable=False, default=0)
+    min_price = Column(Float)
+    max_price = Column(Float)
+    total_stock = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class CategoryStats(Base):
+    __tablename__ = "category_stats"
+    
+    category = Column(String(50), primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    price_sum = Column(Float, nullable=False, default=0)
+    min_price = Column(Float)
+    max_price = Column(Float)
+    total_stock = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class Order(Base):
+    __tablename__ = "orders"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    # reserved -> confirmed, or reserved -> cancelled / expired (stock released)
+    status = Column(String(20), nullable=False, default="reserved")
+    customer_email = Column(String(100))
+    total = Column(Float, nullable=False, default=0)
+    expires_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    items = relationship("OrderItem", back_populates="order")
+    
+    # The expiry sweeper looks up reserved orders past their deadline
+    __table_args__ = (
+        Index("ix_orders_status_expires", "status", "expires_at"),
+    )
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_price = Column(Float, nullable=False)
+    
+    order = relationship("Order", back_populates="items")
+
+# Responses to POSTs sent with an Idempotency-Key, shared between workers
+# (IDEMPOTENCY_BACKEND=database); see idempotency.py
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(400), primary_key=True)
+    fingerprint = Column(String(64))
+    # NULL while the first request with this key is still running
+    status_code = Column(Integer)
+    headers = Column(Text)
+    body = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+# Background work (seeding, imports, aggregate rebuilds) claimed by the workers in jobs.py
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String(50), nullable=False)
+    # queued -> running -> succeeded / failed / cancelled; failed attempts go back to queued
+    status = Column(String(20), nullable=False, default="queued")
+    params = Column(Text)
+    result = Column(Text)
+    error = Column(Text)
+    progress = Column(Float, nullable=False, default=0)
+    message = Column(String(200))
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    # Not claimed before this (retry backoff)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    worker = Column(String(100))
+    # Refreshed while running; a stale heartbeat means the worker died
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Workers claim the oldest due job of a type and count the running ones
+    __table_args__ = (
+        Index("ix_jobs_type_status_run_after", "type", "status", "run_after"),
+    )
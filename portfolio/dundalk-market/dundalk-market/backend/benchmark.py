@@ -0,0 +1,893 @@
+"""Load benchmarks for the Dundalk Market API.
+
+Starts the API under uvicorn against a throwaway SQLite database and drives it
+with concurrent HTTP clients.
+
+    python benchmark.py concurrency --clients 200 --duration 10
+    python benchmark.py mixed --readers 50 --writers 10 --duration 10
+    python benchmark.py --output results.json endpoints --scales sample 100:10000 1000:100000
+    python benchmark.py orders --clients 300 --stock 2000 --duration 10
+    python benchmark.py coldstart --runs 7 --budget-ms 1500
+    python benchmark.py near --stores 100000 --radii 1 5 10
+    python benchmark.py replicas --clients 50 --duration 5
+    python benchmark.py compression --codings identity gzip br zstd --duration 5
+    python benchmark.py events --clients 2000 --events 200 --stalled 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ============ SERVER ============
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def api_server(env_overrides: dict, database_url: str, poll_interval: float = 0.2):
+    """Run main:app under uvicorn in a subprocess and yield its base URL"""
+    port = free_port()
+    # Throwaway databases: let the app create its own schema unless told otherwise
+    env = dict(os.environ, DATABASE_URL=database_url, DB_AUTO_MIGRATE="true")
+    env.update(env_overrides)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    api_server.pid = process.pid
+    try:
+        deadline = time.monotonic() + 30
+        # One client for all attempts: building one per poll costs ~100 ms (TLS context)
+        with httpx.Client(timeout=1) as client:
+            while True:
+                try:
+                    client.get(f"{base_url}/")
+                    break
+                except httpx.TransportError:
+                    if process.poll() is not None or time.monotonic() > deadline:
+                        raise RuntimeError("API server did not start")
+                    time.sleep(poll_interval)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+async def run_job(client: httpx.AsyncClient, path: str, poll_interval: float = 0.1) -> dict:
+    """POST a job endpoint such as /seed and poll GET /jobs/{id} until it finishes; raises unless it succeeded"""
+    response = await client.post(path)
+    response.raise_for_status()
+    job = response.json()
+    while job["status"] not in ("succeeded", "failed", "cancelled"):
+        await asyncio.sleep(poll_interval)
+        job = (await client.get(f"/jobs/{job['id']}")).json()
+    if job["status"] != "succeeded":
+        raise RuntimeError(f"{path} job {job['id']} {job['status']}: {job['error']}")
+    return job
+
+def seed(base_url: str, path: str = "/seed") -> dict:
+    async def seed_and_wait():
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            return await run_job(client, path)
+    return asyncio.run(seed_and_wait())
+
+# ============ LOAD GENERATION ============
+
+async def drive(base_url: str, roles: dict, duration: float, transport=None) -> dict:
+    """Run every role's clients back to back until the deadline.
+    
+    roles maps a name to (clients, send) where send(client, i) awaits one request.
+    Pass an httpx.ASGITransport to call the app in-process instead of over TCP.
+    Returns a summary per role.
+    """
+    latencies = {name: [] for name in roles}
+    errors = {name: 0 for name in roles}
+    total_clients = sum(clients for clients, _ in roles.values())
+    limits = httpx.Limits(max_connections=total_clients, max_keepalive_connections=total_clients)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30, transport=transport) as client:
+        deadline = time.monotonic() + duration
+
+        async def worker(name: str, send, offset: int):
+            i = offset
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await send(client, i)
+                    if response.status_code >= 400:
+                        errors[name] += 1
+                except httpx.HTTPError:
+                    errors[name] += 1
+                latencies[name].append(time.perf_counter() - started)
+                i += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(
+            worker(name, send, i)
+            for name, (clients, send) in roles.items()
+            for i in range(clients)
+        ))
+        elapsed = time.monotonic() - started
+
+    return {name: summarize(latencies[name], errors[name], elapsed) for name in roles}
+
+def get_paths(paths):
+    async def send(client, i):
+        return await client.get(paths[i % len(paths)])
+    return send
+
+def post_products(store_ids):
+    async def send(client, i):
+        return await client.post("/products", json={
+            "store_id": store_ids[i % len(store_ids)],
+            "name": f"Benchmark item {i}",
+            "price": 9.99,
+            "category": "Benchmark",
+        })
+    return send
+
+def peak_rss_mb(pid=None):
+    """High-water resident set size of a process (this one by default), in MB"""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if pid is None:
+        import resource
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return None
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies, errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "requests_per_sec": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2) if ordered else 0.0,
+    }
+
+# ============ SCENARIOS ============
+
+def run_concurrency(args) -> list:
+    """Same read mix against the sync (threadpool) and async handler paths"""
+    results = []
+    env_base = {"REQUEST_LOG": "false", **({} if args.cache else {"CACHE_MAX_ENTRIES": "0"})}
+    for label, env in (("sync", {"DATABASE_ASYNC": "false"}), ("async", {"DATABASE_ASYNC": "true"})):
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            with api_server({**env_base, **env}, database_url) as base_url:
+                seed(base_url)
+                roles = {"read": (args.clients, get_paths(args.paths))}
+                result = asyncio.run(drive(base_url, roles, args.duration))["read"]
+        result.update(mode=label, clients=args.clients)
+        print(f"   {label:<6} {result['requests_per_sec']:>9} req/s   p50 {result['p50_ms']} ms   p99 {result['p99_ms']} ms   errors {result['errors']}")
+        results.append(result)
+    return results
+
+def run_mixed(args) -> list:
+    """Readers on the listings while writers create products, per SQLite pragma profile"""
+    results = []
+    env_base = {"REQUEST_LOG": "false", **({} if args.cache else {"CACHE_MAX_ENTRIES": "0"})}
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            with api_server({**env_base, "SQLITE_PRAGMA_PROFILE": profile}, database_url) as base_url:
+                seed(base_url)
+                store_ids = [store["id"] for store in httpx.get(f"{base_url}/stores/summary").json()["items"]]
+                roles = {
+                    "read": (args.readers, get_paths(args.paths)),
+                    "write": (args.writers, post_products(store_ids)),
+                }
+                summary = asyncio.run(drive(base_url, roles, args.duration))
+        for role, result in summary.items():
+            result.update(profile=profile, role=role, clients=roles[role][0])
+            print(f"   {profile:<8} {role:<6} {result['requests_per_sec']:>9} req/s   p50 {result['p50_ms']} ms   p99 {result['p99_ms']} ms   errors {result['errors']}")
+            results.append(result)
+    return results
+
+def run_orders(args) -> list:
+    """Hundreds of buyers racing for one hot product, then an oversell audit of the database"""
+    results = []
+    for label, env in (("sync", {"DATABASE_ASYNC": "false"}), ("async", {"DATABASE_ASYNC": "true"})):
+        with tempfile.TemporaryDirectory() as tmp:
+            database_path = os.path.join(tmp, "bench.db")
+            with api_server({"REQUEST_LOG": "false", **env}, f"sqlite:///{database_path}") as base_url:
+                seed(base_url)
+                store_id = httpx.get(f"{base_url}/stores/summary").json()["items"][0]["id"]
+                product_id = httpx.post(f"{base_url}/products", json={
+                    "store_id": store_id, "name": "Hot product", "price": 5.0, "stock_quantity": args.stock,
+                }).json()["id"]
+                outcomes = {"orders_placed": 0, "units_reserved": 0, "sold_out": 0}
+
+                async def buy(client, i):
+                    quantity = 1 + i % args.max_quantity
+                    response = await client.post("/orders", json={"items": [{"product_id": product_id, "quantity": quantity}]})
+                    if response.status_code == 201:
+                        outcomes["orders_placed"] += 1
+                        outcomes["units_reserved"] += quantity
+                    elif response.status_code == 409:
+                        outcomes["sold_out"] += 1
+                    return response
+
+                result = asyncio.run(drive(base_url, {"buy": (args.clients, buy)}, args.duration))["buy"]
+            # Audit from the database itself once the server has stopped
+            with sqlite3.connect(database_path) as conn:
+                stock_left = conn.execute("SELECT stock_quantity FROM products WHERE id = ?", (product_id,)).fetchone()[0]
+                units_in_orders = conn.execute(
+                    "SELECT coalesce(sum(quantity), 0) FROM order_items WHERE product_id = ?", (product_id,)
+                ).fetchone()[0]
+        result.update(
+            mode=label,
+            clients=args.clients,
+            initial_stock=args.stock,
+            stock_left=stock_left,
+            units_in_orders=units_in_orders,
+            oversold=max(0, units_in_orders - args.stock),
+            consistent=stock_left >= 0 and stock_left + units_in_orders == args.stock == stock_left + outcomes["units_reserved"],
+            **outcomes,
+        )
+        print(
+            f"   {label:<6} {result['requests_per_sec']:>9} req/s   p50 {result['p50_ms']} ms   p99 {result['p99_ms']} ms   "
+            f"orders {result['orders_placed']}   sold out {result['sold_out']}   stock left {stock_left}   "
+            f"oversold {result['oversold']}   consistent {result['consistent']}"
+        )
+        results.append(result)
+    return results
+
+ENDPOINTS = ["/stores", "/stores/{store_id}", "/products", "/stores/{store_id}/products", "/health", "POST /products"]
+
+def parse_scale(scale: str) -> str:
+    """'sample' or 'STORES:PRODUCTS' -> the /seed URL that builds it"""
+    if scale == "sample":
+        return "/seed"
+    stores, products = scale.split(":")
+    return f"/seed?stores={int(stores)}&products={int(products)}"
+
+def endpoint_sender(endpoint: str, store_ids: list):
+    if endpoint == "POST /products":
+        return post_products(store_ids)
+    return get_paths([endpoint.format(store_id=store_id) for store_id in store_ids[:50]])
+
+async def seed_scale(base_url: str, scale: str, transport=None) -> list:
+    """Reseed at this scale; returns some approved store ids to aim requests at"""
+    async with httpx.AsyncClient(base_url=base_url, timeout=3600, transport=transport) as client:
+        await run_job(client, parse_scale(scale))
+        return [store["id"] for store in (await client.get("/stores/summary")).json()["items"]]
+
+async def bench_endpoints(base_url: str, scale: str, args, transport=None, count_queries=None, pid=None) -> list:
+    """Each endpoint on its own for args.duration seconds at this scale"""
+    store_ids = await seed_scale(base_url, scale, transport)
+    results = []
+    for endpoint in args.endpoints:
+        before = count_queries() if count_queries else 0
+        result = (await drive(base_url, {endpoint: (args.clients, endpoint_sender(endpoint, store_ids))}, args.duration, transport))[endpoint]
+        queries = count_queries() - before if count_queries else None
+        result.update(
+            transport="asgi" if transport else "uvicorn",
+            scale=scale,
+            endpoint=endpoint,
+            clients=args.clients,
+            queries_per_request=round(queries / result["requests"], 2) if queries is not None and result["requests"] else None,
+            peak_rss_mb=peak_rss_mb(pid),
+        )
+        print(f"   {result['transport']:<8} {scale:<14} {endpoint:<28} {result['requests_per_sec']:>9} req/s   p50 {result['p50_ms']} ms   p99 {result['p99_ms']} ms   queries {result['queries_per_request']}   rss {result['peak_rss_mb']} MB   errors {result['errors']}")
+        results.append(result)
+    return results
+
+async def run_in_process(args, database_url: str, env: dict) -> list:
+    """Drive main:app through ASGITransport, counting SQL statements on its engines"""
+    os.environ.update(env, DATABASE_URL=database_url, DB_AUTO_MIGRATE="true")
+    sys.path.insert(0, BACKEND_DIR)
+    from sqlalchemy import event
+    import database
+    import main as api
+
+    queries = [0]
+    def count(*_):
+        queries[0] += 1
+    event.listen(database.engine, "before_cursor_execute", count)
+    if database.async_engine is not None:
+        event.listen(database.async_engine.sync_engine, "before_cursor_execute", count)
+
+    results = []
+    transport = httpx.ASGITransport(app=api.app)
+    async with api.app.router.lifespan_context(api.app):
+        for scale in args.scales:
+            results += await bench_endpoints("http://asgi", scale, args, transport, count_queries=lambda: queries[0])
+    return results
+
+def run_endpoints(args) -> list:
+    """Every main route at several database sizes, in-process and over uvicorn.
+    
+    Query counts come from the in-process run, where the engine is reachable.
+    In-process RSS includes the load generator; uvicorn RSS is the server alone.
+    """
+    results = []
+    env = {"REQUEST_LOG": "false", **({} if args.cache else {"CACHE_MAX_ENTRIES": "0"})}
+    with tempfile.TemporaryDirectory() as tmp:
+        if "uvicorn" in args.transports:
+            for scale in args.scales:
+                database_url = f"sqlite:///{os.path.join(tmp, f'uvicorn-{len(results)}.db')}"
+                with api_server(env, database_url) as base_url:
+                    results += asyncio.run(bench_endpoints(base_url, scale, args, pid=api_server.pid))
+        if "asgi" in args.transports:
+            results += asyncio.run(run_in_process(args, f"sqlite:///{os.path.join(tmp, 'asgi.db')}", env))
+    return results
+
+# ============ READ REPLICAS ============
+
+def copy_sqlite(source: str, target: str):
+    """Snapshot a SQLite database into another file: a replica that never catches up"""
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+def replica_status(base_url: str) -> dict:
+    return {replica["name"]: replica for replica in httpx.get(f"{base_url}/metrics/pool").json()["replicas"]}
+
+def run_replicas(args) -> list:
+    """GET traffic over SQLite file copies standing in for read replicas.
+    
+    The copies are snapshots, so a store created during the run exists only on
+    the primary: the writer must still read it back (read-your-writes) while a
+    client that never wrote must not (its reads went to a replica). One replica
+    starts unreachable and is restored mid-run to exercise ejection and
+    recovery. Everything is one uvicorn process, so req/s shows routing
+    overhead, not the scaling real replicas on other hosts give.
+    """
+    results = []
+    failures = []
+    env = {"REQUEST_LOG": "false", "CACHE_MAX_ENTRIES": "0"}
+    with tempfile.TemporaryDirectory() as tmp:
+        primary = os.path.join(tmp, "primary.db")
+        with api_server(env, f"sqlite:///{primary}") as base_url:
+            seed(base_url, parse_scale(args.scale))
+            paths = [f"/stores/{store['id']}" for store in httpx.get(f"{base_url}/stores/summary").json()["items"]]
+            baseline = asyncio.run(drive(base_url, {"read": (args.clients, get_paths(args.paths + paths))}, args.duration))["read"]
+        baseline.update(setup="primary only", clients=args.clients)
+        results.append(baseline)
+        print(f"   primary only       {baseline['requests_per_sec']:>9} req/s   p50 {baseline['p50_ms']} ms   p99 {baseline['p99_ms']} ms   errors {baseline['errors']}")
+
+        copies = [os.path.join(tmp, f"replica-{i}.db") for i in range(1, args.replicas + 1)]
+        for copy in copies:
+            copy_sqlite(primary, copy)
+        # Unreachable until its directory exists
+        late = os.path.join(tmp, "late", "replica.db")
+        replica_urls = ",".join(f"sqlite:///{path}" for path in copies + [late])
+        env.update(DATABASE_REPLICA_URLS=replica_urls, REPLICA_SELECTION=args.selection, REPLICA_HEALTH_SECONDS="0.5")
+        with api_server(env, f"sqlite:///{primary}", poll_interval=0.05) as base_url:
+            late_name = f"replica-{len(copies) + 1}"
+            if replica_status(base_url)[late_name]["healthy"]:
+                failures.append(f"{late_name} is unreachable but was left in rotation")
+
+            with httpx.Client(base_url=base_url) as writer, httpx.Client(base_url=base_url) as stranger:
+                store = writer.post("/stores", json={"name": "Replica check", "email": f"replica-{time.time()}@example.com"}).json()
+                if writer.get(f"/stores/{store['id']}").status_code != 200:
+                    failures.append("the writer could not read its own store back (read-your-writes)")
+                if stranger.get(f"/stores/{store['id']}").status_code != 404:
+                    failures.append("a client that never wrote read from the primary, not a replica")
+                if stranger.get(f"/stores/{store['id']}", headers={"X-Read-Consistency": "primary"}).status_code != 200:
+                    failures.append("X-Read-Consistency: primary did not read from the primary")
+
+            routed = asyncio.run(drive(base_url, {"read": (args.clients, get_paths(args.paths + paths))}, args.duration))["read"]
+            reads = {name: replica["reads"] for name, replica in replica_status(base_url).items()}
+
+            os.makedirs(os.path.dirname(late))
+            copy_sqlite(primary, late)
+            deadline = time.monotonic() + 10
+            while not replica_status(base_url)[late_name]["healthy"]:
+                if time.monotonic() > deadline:
+                    failures.append(f"{late_name} was not restored after it came back")
+                    break
+                time.sleep(0.1)
+            asyncio.run(drive(base_url, {"read": (args.clients, get_paths(args.paths + paths))}, 1.0))
+            restored_reads = replica_status(base_url)[late_name]["reads"] - reads[late_name]
+        if routed["errors"]:
+            failures.append(f"{routed['errors']} failed reads with an unreachable replica configured")
+        if restored_reads == 0:
+            failures.append(f"{late_name} got no reads after it was restored")
+
+    routed.update(
+        setup=f"{len(copies)} replicas + 1 unreachable ({args.selection})",
+        clients=args.clients,
+        replica_reads=reads,
+        reads_after_restore=restored_reads,
+        failures=failures,
+    )
+    results.append(routed)
+    print(f"   with replicas      {routed['requests_per_sec']:>9} req/s   p50 {routed['p50_ms']} ms   p99 {routed['p99_ms']} ms   errors {routed['errors']}")
+    print(f"   reads per replica  {reads}   {late_name} after restore: {restored_reads}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return results
+
+# ============ COMPRESSION ============
+
+def compression_counters(base_url: str) -> dict:
+    """{coding: bytes fed to the codec} from /metrics"""
+    counters = {}
+    for line in httpx.get(f"{base_url}/metrics", headers={"Accept-Encoding": "identity"}).text.splitlines():
+        if line.startswith("http_compression_input_bytes_total{"):
+            labels, value = line.rsplit(" ", 1)
+            counters[labels.split('"')[1]] = float(value)
+    return counters
+
+def get_encoded(paths, coding: str):
+    async def send(client, i):
+        return await client.get(paths[i % len(paths)], headers={"Accept-Encoding": coding})
+    return send
+
+def run_compression(args) -> list:
+    """Wire bytes and cached-hit latency per Accept-Encoding on the listing endpoints.
+    
+    Every coding must decode to the identity body, and once the cache is warm
+    the load phase must not compress anything again: hits are served from the
+    variants stored with each cache entry.
+    """
+    results = []
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        with api_server({"REQUEST_LOG": "false"}, database_url) as base_url:
+            seed(base_url, parse_scale(args.scale))
+            with httpx.Client(base_url=base_url, timeout=30) as client:
+                identity = {path: client.get(path, headers={"Accept-Encoding": "identity"}).content for path in args.paths}
+                for coding in args.codings:
+                    result = {"coding": coding, "paths": {}}
+                    for path in args.paths:
+                        with client.stream("GET", path, headers={"Accept-Encoding": coding}) as response:
+                            body = response.read()
+                            wire_bytes = response.num_bytes_downloaded
+                            served = response.headers.get("content-encoding", "identity")
+                        if served != coding:
+                            failures.append(f"{path} asked for {coding} but got {served}")
+                        if body != identity[path]:
+                            failures.append(f"{path} in {coding} does not decode to the identity body")
+                        result["paths"][path] = {"bytes": wire_bytes, "ratio": round(len(identity[path]) / wire_bytes, 1)}
+                    results.append(result)
+
+            for result in results:
+                before = compression_counters(base_url)
+                load = asyncio.run(drive(base_url, {"read": (args.clients, get_encoded(args.paths, result["coding"]))}, args.duration))["read"]
+                compressed = compression_counters(base_url).get(result["coding"], 0) - before.get(result["coding"], 0)
+                if compressed:
+                    failures.append(f"{result['coding']} hits compressed {int(compressed)} bytes again instead of using the cached variants")
+                result.update(load, clients=args.clients, bytes_compressed_under_load=compressed)
+                sizes = "   ".join(f"{path} {entry['bytes']} B ({entry['ratio']}x)" for path, entry in result["paths"].items())
+                print(f"   {result['coding']:<9} {sizes}   {load['requests_per_sec']:>9} req/s   p50 {load['p50_ms']} ms   p99 {load['p99_ms']} ms")
+    results[-1]["failures"] = failures
+    for failure in failures:
+        print(f"❌ {failure}")
+    return results
+
+# ============ CHANGE FEED ============
+
+class FeedClient:
+    """A bare-socket SSE client for GET /events: cheap enough to run thousands in one process"""
+
+    def __init__(self):
+        self.arrivals = []  # (event id, data, perf_counter at arrival)
+        self.writer = None
+
+    async def connect(self, base_url: str, last_event_id: str = None, receive_buffer: int = None):
+        host, port = base_url.rsplit("//", 1)[1].split(":")
+        sock = socket.socket()
+        if receive_buffer:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, (host, int(port)))
+        self.reader, self.writer = await asyncio.open_connection(sock=sock)
+        resume = f"Last-Event-ID: {last_event_id}\r\n" if last_event_id else ""
+        self.writer.write(f"GET /events HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n{resume}\r\n".encode())
+        status = await self.reader.readline()
+        if b" 200 " not in status:
+            raise RuntimeError(f"GET /events answered {status.decode().strip()}")
+        await self.reader.readuntil(b"\r\n\r\n")
+
+    async def read_forever(self):
+        """Parse the chunked SSE body until the server closes it"""
+        pending = b""
+        try:
+            while True:
+                size = int((await self.reader.readline()).strip() or b"0", 16)
+                if size == 0:
+                    return
+                pending += (await self.reader.readexactly(size + 2))[:-2]
+                *frames, pending = pending.split(b"\n\n")
+                now = time.perf_counter()
+                for frame in frames:
+                    fields = dict(line.split(b": ", 1) for line in frame.split(b"\n") if b": " in line and not line.startswith(b":"))
+                    if b"data" in fields:
+                        self.arrivals.append((fields.get(b"id", b"").decode(), json.loads(fields[b"data"]), now))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def run_events(args) -> list:
+    """Idle SSE clients on GET /events while products change: memory per client, fan-out latency, resume, slow clients.
+    
+    Every write is a PATCH of one product's stock to a unique value, so each
+    client can match what it receives to the moment the write was sent. A
+    few clients stop reading with a tiny receive buffer; once large updates
+    fill their sockets, the server must drop them without holding up anyone
+    else.
+    """
+    failures = []
+    env = {
+        "REQUEST_LOG": "false",
+        "EVENTS_CLIENT_BUFFER": str(args.client_buffer),
+        "EVENTS_MAX_CLIENTS": str(args.clients + args.stalled + 10),
+        # Stuck clients are cut on the second keepalive tick after they overflow
+        "EVENTS_KEEPALIVE_SECONDS": "1",
+    }
+
+    async def feed_metrics(client) -> dict:
+        text = (await client.get("/metrics", headers={"Accept-Encoding": "identity"})).text
+        return {line.split()[0]: float(line.split()[1]) for line in text.splitlines() if line.startswith("events_")}
+
+    async def scenario(base_url: str) -> dict:
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            product = (await client.get("/products?limit=1")).json()["items"][0]
+            rss_before = peak_rss_mb(api_server.pid)
+            clients = [FeedClient() for _ in range(args.clients)]
+            for start in range(0, len(clients), 200):
+                await asyncio.gather(*(feed.connect(base_url) for feed in clients[start:start + 200]))
+            stalled = [FeedClient() for _ in range(args.stalled)]
+            await asyncio.gather(*(feed.connect(base_url, receive_buffer=4096) for feed in stalled))
+            readers = [asyncio.create_task(feed.read_forever()) for feed in clients]
+            await asyncio.sleep(1)
+            rss_after = peak_rss_mb(api_server.pid)
+
+            # Unique stock values, none equal to the current one (an unchanged PATCH publishes nothing)
+            first = product["stock_quantity"] + 1
+            expected = list(range(first, first + args.events))
+            sent = {}
+            resumer = clients[0]
+            for stock in expected:
+                if stock == expected[len(expected) // 2]:
+                    readers[0].cancel()
+                    resumer.close()
+                sent[stock] = time.perf_counter()
+                (await client.patch(f"/products/{product['id']}", json={"stock_quantity": stock})).raise_for_status()
+                await asyncio.sleep(args.interval)
+            await asyncio.sleep(1)
+
+            last_seen = resumer.arrivals[-1][0] if resumer.arrivals else None
+            resumed = FeedClient()
+            await resumed.connect(base_url, last_event_id=last_seen)
+            resume_reader = asyncio.create_task(resumed.read_forever())
+            await asyncio.sleep(1)
+            for feed_client in clients + [resumed]:
+                feed_client.close()
+            for task in readers + [resume_reader]:
+                task.cancel()
+
+            # Large updates until the stalled clients' socket buffers fill and their queues overflow
+            padding = "x" * 16384
+            slow_disconnects = 0
+            for i in range(args.max_burst):
+                await client.patch(f"/products/{product['id']}", json={"description": f"{i} {padding}"})
+                if i % 50 == 49:
+                    slow_disconnects = int((await feed_metrics(client))["events_slow_disconnects_total"])
+                    if slow_disconnects >= args.stalled:
+                        break
+            await asyncio.sleep(3)
+            still_stalled = int((await feed_metrics(client))["events_stalled_subscribers"])
+            for feed_client in stalled:
+                feed_client.close()
+
+        latencies = []
+        for feed_client in clients[1:]:
+            stock = [data["stock_quantity"] for _, data, _ in feed_client.arrivals if data["type"] == "product.stock"]
+            if stock != expected:
+                failures.append(f"a client received {len(stock)} of {args.events} stock events, or out of order")
+                break
+            latencies += [arrived - sent[data["stock_quantity"]] for _, data, arrived in feed_client.arrivals if data["type"] == "product.stock"]
+        before = [data["stock_quantity"] for _, data, _ in resumer.arrivals if data["type"] == "product.stock"]
+        after = [data["stock_quantity"] for _, data, _ in resumed.arrivals if data["type"] == "product.stock"]
+        if before + after != expected:
+            failures.append(f"resuming from {last_seen} did not pick up exactly the missed events")
+        if slow_disconnects < args.stalled:
+            failures.append(f"only {slow_disconnects} of {args.stalled} stalled clients were dropped")
+        if still_stalled:
+            failures.append(f"{still_stalled} stalled clients were still connected after two keepalive ticks")
+        latencies.sort()
+        return {
+            "clients": args.clients,
+            "stalled_clients": args.stalled,
+            "events": args.events,
+            "server_rss_mb": rss_after,
+            "rss_per_client_kb": round((rss_after - rss_before) * 1024 / (args.clients + args.stalled), 1) if rss_before and rss_after else None,
+            "delivery_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "delivery_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "delivery_max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+            "resumed_events": len(after),
+            "slow_disconnects": slow_disconnects,
+        }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with api_server(env, f"sqlite:///{os.path.join(tmp, 'bench.db')}") as base_url:
+            seed(base_url)
+            result = asyncio.run(scenario(base_url))
+            stopping = time.monotonic()
+        result["shutdown_seconds"] = round(time.monotonic() - stopping, 2)
+    result["failures"] = failures
+    print(f"   {result['clients']} clients   rss {result['server_rss_mb']} MB ({result['rss_per_client_kb']} KB/client)   "
+          f"delivery p50 {result['delivery_p50_ms']} ms  p99 {result['delivery_p99_ms']} ms  max {result['delivery_max_ms']} ms")
+    print(f"   resumed {result['resumed_events']} missed events   stalled clients dropped {result['slow_disconnects']}/{args.stalled}   shutdown {result['shutdown_seconds']}s")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return [result]
+
+# ============ STORES NEAR ============
+
+def run_near(args) -> list:
+    """Radius queries through the spatial index vs fetching every store and scanning with haversine.
+    
+    Runs in-process on a synthetic catalogue; query points are random stores,
+    so every query lands somewhere populated. Both paths must return the same stores.
+    """
+    import random
+    from sqlalchemy import select, text
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'near.db')}", REQUEST_LOG="false")
+        sys.path.insert(0, BACKEND_DIR)
+        import database
+        import geo
+        import migrate
+        import seed_data
+        import models
+        from main import STORE_COLUMNS
+
+        migrate.upgrade()
+        with database.SessionLocal() as session:
+            seeded = seed_data.seed_synthetic(session, args.stores, 0, args.seed)
+        print(f"   seeded {seeded['stores_created']} stores in {seeded['seconds']}s")
+
+        rng = random.Random(args.seed)
+        with database.SessionLocal() as session:
+            points = session.execute(text("SELECT latitude, longitude FROM stores WHERE latitude IS NOT NULL")).all()
+
+            def scan(latitude, longitude, radius_km):
+                rows = session.execute(select(models.Store.latitude, models.Store.longitude, *STORE_COLUMNS)
+                                       .where(models.Store.is_approved == True)).all()
+                found = [(geo.haversine_km(latitude, longitude, row[0], row[1]), row[2:]) for row in rows]
+                found = [item for item in found if item[0] <= radius_km]
+                found.sort(key=lambda item: item[0])
+                return found[:args.limit]
+
+            for radius in args.radii:
+                timings = {"index": [], "scan": []}
+                matched = 0
+                for _ in range(args.queries):
+                    latitude, longitude = rng.choice(points)
+                    started = time.perf_counter()
+                    indexed = geo.near(session, STORE_COLUMNS, latitude, longitude, radius, args.limit)
+                    timings["index"].append((time.perf_counter() - started) * 1000)
+                    started = time.perf_counter()
+                    scanned = scan(latitude, longitude, radius)
+                    timings["scan"].append((time.perf_counter() - started) * 1000)
+                    if [row for _, row in indexed] != [row for _, row in scanned]:
+                        raise AssertionError(f"index and scan disagree at ({latitude}, {longitude}) r={radius}")
+                    matched += len(indexed)
+                result = {"stores": args.stores, "radius_km": radius, "limit": args.limit, "queries": args.queries,
+                          "avg_results": round(matched / args.queries, 1)}
+                for label, values in timings.items():
+                    values.sort()
+                    result[f"{label}_p50_ms"] = round(percentile(values, 0.5), 2)
+                    result[f"{label}_p99_ms"] = round(percentile(values, 0.99), 2)
+                print(f"   r={radius:>5} km   index p50 {result['index_p50_ms']} ms  p99 {result['index_p99_ms']} ms   "
+                      f"scan p50 {result['scan_p50_ms']} ms  p99 {result['scan_p99_ms']} ms   results {result['avg_results']}")
+                results.append(result)
+    return results
+
+# ============ COLD START ============
+
+# Only needed by migrations, thumbnails or the async driver; `import main` must not load them
+DEFERRED_MODULES = ["alembic", "PIL", "multiprocessing", "sqlalchemy.ext.asyncio", "aiosqlite", "asyncpg", "redis"]
+
+def parse_importtime(stderr: str) -> dict:
+    """{module: (cumulative microseconds, nesting depth)} from python -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split(":", 1)[1].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(cumulative), depth)
+    return modules
+
+def run_coldstart(args) -> list:
+    """Import time of main (python -X importtime) and time to first response under uvicorn.
+    
+    Fails (exit status 1) when the median import exceeds --budget-ms, a module
+    in DEFERRED_MODULES is imported eagerly, or importing main touches the database.
+    """
+    imports = []
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database_path = os.path.join(tmp, "cold.db")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}")
+        for _ in range(args.runs):
+            completed = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", "import main"],
+                cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                raise RuntimeError(completed.stderr[-2000:])
+            imports.append(parse_importtime(completed.stderr))
+        if os.path.exists(database_path):
+            failures.append("importing main created the database")
+
+        # Migrate once, then time worker boots against the ready schema
+        with api_server({"REQUEST_LOG": "false"}, f"sqlite:///{database_path}"):
+            pass
+        first_response = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            with api_server({"REQUEST_LOG": "false", "DB_AUTO_MIGRATE": "false"}, f"sqlite:///{database_path}", poll_interval=0.01):
+                first_response.append((time.perf_counter() - started) * 1000)
+
+    import_ms = sorted(modules["main"][0] / 1000 for modules in imports)
+    eager = sorted({name for modules in imports for name in modules if name in DEFERRED_MODULES})
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+    median_ms = statistics.median(import_ms)
+    if args.budget_ms and median_ms > args.budget_ms:
+        failures.append(f"median import {median_ms:.0f} ms is over the {args.budget_ms} ms budget")
+    # Heaviest imports made directly by main in the last run, for spotting what regressed
+    slowest = sorted(((us, name) for name, (us, depth) in imports[-1].items() if depth == 1), reverse=True)[:args.top]
+
+    result = {
+        "runs": args.runs,
+        "import_ms_median": round(median_ms, 1),
+        "import_ms_max": round(import_ms[-1], 1),
+        "first_response_ms_median": round(statistics.median(first_response), 1),
+        "budget_ms": args.budget_ms,
+        "eager_deferred_modules": eager,
+        "slowest_imports_ms": {name: round(us / 1000, 1) for us, name in slowest},
+        "failures": failures,
+    }
+    print(f"   import main: median {result['import_ms_median']} ms, max {result['import_ms_max']} ms   "
+          f"first response: median {result['first_response_ms_median']} ms")
+    for name, ms in result["slowest_imports_ms"].items():
+        print(f"     {ms:>8} ms  {name}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return [result]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Dundalk Market API benchmarks")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+
+    concurrency = subparsers.add_parser("concurrency", help="sync vs async handlers under concurrent reads")
+    concurrency.add_argument("--clients", type=int, default=200)
+    concurrency.add_argument("--duration", type=float, default=10.0)
+    concurrency.add_argument("--paths", nargs="+", default=["/products", "/stores", "/stores/1", "/stores/1/products"])
+    concurrency.add_argument("--cache", action="store_true", help="leave the response cache enabled")
+    concurrency.set_defaults(run=run_concurrency)
+
+    mixed = subparsers.add_parser("mixed", help="concurrent readers and writers, default vs tuned SQLite pragmas")
+    mixed.add_argument("--readers", type=int, default=50)
+    mixed.add_argument("--writers", type=int, default=10)
+    mixed.add_argument("--duration", type=float, default=10.0)
+    mixed.add_argument("--paths", nargs="+", default=["/products", "/stores/1/products"])
+    mixed.add_argument("--profiles", nargs="+", default=["default", "tuned"])
+    mixed.add_argument("--cache", action="store_true", help="leave the response cache enabled")
+    mixed.set_defaults(run=run_mixed)
+
+    orders = subparsers.add_parser("orders", help="concurrent buyers on one hot product; checks for oversells")
+    orders.add_argument("--clients", type=int, default=300)
+    orders.add_argument("--stock", type=int, default=2000)
+    orders.add_argument("--max-quantity", type=int, default=3, help="orders cycle through 1..N units")
+    orders.add_argument("--duration", type=float, default=10.0)
+    orders.set_defaults(run=run_orders)
+
+    endpoints = subparsers.add_parser("endpoints", help="each route at several database sizes, in-process and over uvicorn")
+    endpoints.add_argument("--scales", nargs="+", default=["sample", "100:10000", "1000:100000"], help="'sample' or STORES:PRODUCTS")
+    endpoints.add_argument("--clients", type=int, default=20)
+    endpoints.add_argument("--duration", type=float, default=5.0, help="seconds per endpoint")
+    endpoints.add_argument("--endpoints", nargs="+", default=ENDPOINTS)
+    endpoints.add_argument("--transports", nargs="+", choices=["asgi", "uvicorn"], default=["asgi", "uvicorn"])
+    endpoints.add_argument("--cache", action="store_true", help="leave the response cache enabled")
+    endpoints.set_defaults(run=run_endpoints)
+
+    near = subparsers.add_parser("near", help="/stores/near radius queries: spatial index vs haversine scan")
+    near.add_argument("--stores", type=int, default=100_000)
+    near.add_argument("--radii", type=float, nargs="+", default=[1, 5, 10], help="kilometres")
+    near.add_argument("--queries", type=int, default=200, help="per radius")
+    near.add_argument("--limit", type=int, default=50)
+    near.add_argument("--seed", type=int, default=42)
+    near.set_defaults(run=run_near)
+
+    replicas = subparsers.add_parser("replicas", help="reads over SQLite replica copies: routing, read-your-writes, ejection")
+    replicas.add_argument("--replicas", type=int, default=2, help="healthy copies, plus one that starts unreachable")
+    replicas.add_argument("--selection", choices=["round_robin", "least_connections"], default="round_robin")
+    replicas.add_argument("--scale", default="100:10000", help="'sample' or STORES:PRODUCTS")
+    replicas.add_argument("--clients", type=int, default=50)
+    replicas.add_argument("--duration", type=float, default=5.0)
+    replicas.add_argument("--paths", nargs="+", default=["/stores/summary", "/products", "/stores/near?lat=54.0&lon=-6.4"])
+    replicas.set_defaults(run=run_replicas)
+
+    compression = subparsers.add_parser("compression", help="wire bytes and cached-hit latency per Accept-Encoding")
+    compression.add_argument("--codings", nargs="+", default=["identity", "gzip", "br", "zstd"])
+    compression.add_argument("--scale", default="100:10000", help="'sample' or STORES:PRODUCTS")
+    compression.add_argument("--clients", type=int, default=50)
+    compression.add_argument("--duration", type=float, default=5.0, help="seconds per coding")
+    compression.add_argument("--paths", nargs="+", default=["/products?limit=200", "/stores", "/stores/summary"])
+    compression.set_defaults(run=run_compression)
+
+    feed = subparsers.add_parser("events", help="idle SSE clients on /events: memory, fan-out latency, resume, slow clients")
+    feed.add_argument("--clients", type=int, default=2000)
+    feed.add_argument("--events", type=int, default=200)
+    feed.add_argument("--stalled", type=int, default=20, help="clients that stop reading")
+    feed.add_argument("--client-buffer", type=int, default=64, help="EVENTS_CLIENT_BUFFER for the server")
+    feed.add_argument("--interval", type=float, default=0.01, help="seconds between writes")
+    feed.add_argument("--max-burst", type=int, default=2000, help="most large updates sent to overflow the stalled clients")
+    feed.set_defaults(run=run_events)
+
+    coldstart = subparsers.add_parser("coldstart", help="import time and time to first response; fails over budget")
+    coldstart.add_argument("--runs", type=int, default=7)
+    coldstart.add_argument("--budget-ms", type=float, default=1500, help="max median import time of main (0 disables)")
+    coldstart.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    coldstart.set_defaults(run=run_coldstart)
+
+    args = parser.parse_args()
+    print(f"🏁 Running '{args.scenario}' benchmark...")
+    started_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    results = args.run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "scenario": args.scenario,
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "started_at": started_at,
+                "options": {key: value for key, value in vars(args).items() if key not in ("run", "output")},
+                "results": results,
+            }, f, indent=2)
+        print(f"📄 Results written to {args.output}")
+    if any(result.get("failures") for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import csv
+import json
+import os
+import tempfile
+from itertools import islice
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, Optional
+
+import anyio
+from sqlalchemy import insert
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+# Per-row errors beyond this are counted but not echoed back
+MAX_REPORTED_ERRORS = int(os.getenv("BULK_MAX_REPORTED_ERRORS", "1000"))
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines")
+CSV_TYPES = ("text/csv", "application/csv")
+
+def detect_format(content_type: str, requested: Optional[str]) -> Optional[str]:
+    if requested:
+        return requested.lower() if requested.lower() in ("ndjson", "csv") else None
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    if media_type in NDJSON_TYPES:
+        return "ndjson"
+    if media_type in CSV_TYPES:
+        return "csv"
+    return None
+
+class RecordReader:
+    """Turns lines into (row_number, record, error) for each non-blank data row.
+
+    CSV needs a header row; each record must sit on one line.
+    Empty CSV cells are dropped so the schema defaults apply.
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.header = None
+        self.row_number = 0
+
+    def read(self, line: str) -> Optional[tuple]:
+        if not line.strip():
+            return None
+        if self.fmt == "csv" and self.header is None:
+            self.header = [name.strip() for name in next(csv.reader([line]))]
+            return None
+        self.row_number += 1
+        if self.fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                return self.row_number, None, f"Invalid JSON: {e.msg}"
+            if not isinstance(record, dict):
+                return self.row_number, None, "Each line must be a JSON object"
+            return self.row_number, record, None
+        values = next(csv.reader([line]))
+        if len(values) != len(self.header):
+            return self.row_number, None, f"Expected {len(self.header)} columns, got {len(values)}"
+        return self.row_number, {name: value for name, value in zip(self.header, values) if value != ""}, None
+
+def insert_chunk(session, model, rows: list):
+    """One executemany INSERT in its own short transaction"""
+    session.execute(insert(model), rows)
+    session.commit()
+
+def next_chunk(rows: Iterator[dict], chunk_size: int = BULK_CHUNK_SIZE) -> list:
+    return list(islice(rows, chunk_size))
+
+def insert_in_chunks(session, model, rows: Iterable[dict], chunk_size: int = BULK_CHUNK_SIZE, on_chunk=None) -> int:
+    """insert_chunk for every chunk_size rows as rows yields them.
+    
+    Only one chunk is held at a time, so memory does not grow with the import,
+    and each chunk commits by itself, so no write lock outlives one INSERT.
+    """
+    rows = iter(rows)
+    inserted = 0
+    while chunk := next_chunk(rows, chunk_size):
+        insert_chunk(session, model, chunk)
+        inserted += len(chunk)
+        if on_chunk is not None:
+            on_chunk(inserted)
+    return inserted
+
+# ============ SPOOLED BODIES ============
+
+# Upload bodies are written here before any row is inserted; those of
+# ?background=true imports wait here until their job has run
+BULK_SPOOL_DIR = os.getenv("BULK_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bulk_uploads"))
+
+async def spool(chunks: AsyncIterator[bytes]) -> str:
+    """Write a streamed request body to a file in BULK_SPOOL_DIR; returns its path"""
+    os.makedirs(BULK_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=BULK_SPOOL_DIR, suffix=".upload")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                await anyio.to_thread.run_sync(f.write, chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path
+
+def read_records(f: BinaryIO, fmt: str) -> Iterator[tuple]:
+    """(row_number, record, error) for each data row of a spooled body (f.tell() gives progress)"""
+    reader = RecordReader(fmt)
+    for number, raw in enumerate(f):
+        line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+        if number == 0:
+            line = line.lstrip("\ufeff")
+        parsed = reader.read(line)
+        if parsed is not None:
+            yield parsed
+
+def remove_spooled(path: str):
+    if os.path.exists(path):
+        os.unlink(path)
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+# Tags used by the catalogue endpoints
+LISTINGS = "listings"
+
+def store_tag(store_id: int) -> str:
+    return f"store:{store_id}"
+
+class ResponseCache:
+    """In-process TTL + LRU cache of serialized JSON response bodies.
+
+    Entries carry tags so write endpoints can drop everything derived from a
+    store (or every listing) without knowing the exact query strings cached.
+    Each entry also keeps the compressed variants of its body, one per coding,
+    which leave with it.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, body, tags, {coding: compressed body})
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a read that started before a write
+        # cannot store its (now stale) body afterwards
+        self._generation = 0
+        self._invalidated_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self) -> int:
+        return self._generation
+
+    def seconds_since_invalidation(self) -> float:
+        return time.monotonic() - self._invalidated_at
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, body: bytes, tags: Iterable[str], generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, body, frozenset(tags), {})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_variant(self, key: str, coding: str) -> Optional[bytes]:
+        """The compressed body stored for key, if any (not counted as a hit or miss)"""
+        entry = self._entries.get(key)
+        return entry[3].get(coding) if entry is not None else None
+
+    def set_variant(self, key: str, body: bytes, coding: str, data: bytes):
+        """Store data as the coding variant of key, if key still holds this very body"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is body:
+                entry[3][coding] = data
+
+    def invalidate(self, *tags: str):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = time.monotonic()
+            stale = [key for key, entry in self._entries.items() if entry[2].intersection(tags)]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = time.monotonic()
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+response_cache = ResponseCache()
+
+def cache_key(path: str, query_params) -> str:
+    """Route path plus query params in a stable order"""
+    params = "&".join(f"{k}={v}" for k, v in sorted(query_params.multi_items()))
+    return f"{path}?{params}"
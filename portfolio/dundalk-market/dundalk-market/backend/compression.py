@@ -0,0 +1,161 @@
+"""Response compression negotiated from Accept-Encoding: brotli, zstd or gzip.
+
+CompressionMiddleware compresses any single-body response of a text type
+above COMPRESSION_MIN_BYTES. Responses that already carry a Content-Encoding
+pass through untouched. That covers gzip exports and the cached listings:
+cached_response in main.py stores each compressed variant next to the raw
+body in the response cache, so a listing is compressed once per coding per
+content version instead of once per request.
+
+Bodies above COMPRESSION_OFFLOAD_BYTES are compressed in a worker thread
+(zlib, brotli and zstandard release the GIL) so the event loop keeps serving.
+brotli (or brotlicffi) and zstandard are optional: without them only gzip is
+offered.
+"""
+import os
+import zlib
+from typing import Optional
+
+import anyio
+
+import instrumentation
+import metrics
+from database import env_flag
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_ENABLED = env_flag("COMPRESSION_ENABLED", "true")
+# Smaller bodies fit in a packet or two; compressing them only costs CPU
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_OFFLOAD_BYTES = int(os.getenv("COMPRESSION_OFFLOAD_BYTES", str(64 * 1024)))
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "6"))
+ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "10"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+def gzip_compress(data: bytes) -> bytes:
+    # wbits=31: gzip container with no file name or timestamp, so equal bodies compress equally
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+CODECS = {"gzip": gzip_compress}
+if zstandard is not None:
+    CODECS["zstd"] = lambda data: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+if brotli is not None:
+    CODECS["br"] = lambda data: brotli.compress(data, quality=BROTLI_QUALITY)
+
+# Server preference among codings the client rates equally
+PREFERENCE = [coding for coding in os.getenv("COMPRESSION_CODINGS", "br,zstd,gzip").split(",") if coding in CODECS]
+
+# ============ NEGOTIATION ============
+
+def accepted(accept_encoding: str) -> dict:
+    """Accept-Encoding as {coding: q-value}; "*" stands for anything not listed"""
+    qualities = {}
+    for part in accept_encoding.lower().split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        if not coding:
+            continue
+        quality = next((param[2:] for param in params if param.startswith("q=")), "1")
+        try:
+            qualities[coding] = float(quality)
+        except ValueError:
+            qualities[coding] = 0.0
+    return qualities
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The coding to use for this client, or None for identity"""
+    if not accept_encoding or not COMPRESSION_ENABLED:
+        return None
+    qualities = accepted(accept_encoding)
+    best, best_quality = None, 0.0
+    for coding in PREFERENCE:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+def compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+async def compress(data: bytes, coding: str) -> bytes:
+    """Compress with coding, in a worker thread when the body is large"""
+    with instrumentation.compressing():
+        if len(data) >= COMPRESSION_OFFLOAD_BYTES:
+            encoded = await anyio.to_thread.run_sync(CODECS[coding], data)
+        else:
+            encoded = CODECS[coding](data)
+    metrics.observe_compression(coding, len(data), len(encoded))
+    return encoded
+
+def weak_etag(etag: str) -> str:
+    """A compressed body is a different representation, so it cannot share a strong ETag"""
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+# ============ MIDDLEWARE ============
+
+class CompressionMiddleware:
+    """Compresses eligible responses for clients that accept it.
+
+    Pure ASGI: holds back http.response.start until the first body message
+    shows whether the response is a single body worth compressing. Streamed
+    responses (more_body) and anything already encoded pass through as sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD" or not COMPRESSION_ENABLED:
+            return await self.app(scope, receive, send)
+        accept_encoding = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"accept-encoding"), "")
+        coding = negotiate(accept_encoding)
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = {name.lower(): value for name, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                cache_control = headers.get(b"cache-control", b"").decode("latin-1")
+                if b"content-encoding" in headers or not compressible(content_type) or "no-transform" in cache_control:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            held, start = start, None
+            body = message.get("body", b"")
+            if message.get("more_body") or len(body) < COMPRESSION_MIN_BYTES:
+                await send(held)
+                await send(message)
+                return
+            headers = [(name, value) for name, value in held.get("headers", []) if name.lower() not in (b"content-length", b"vary")]
+            vary = [value for name, value in held.get("headers", []) if name.lower() == b"vary"]
+            headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+            if coding is not None:
+                body = await compress(body, coding)
+                headers = [
+                    (name, weak_etag(value.decode("latin-1")).encode("latin-1") if name.lower() == b"etag" else value)
+                    for name, value in headers
+                ]
+                headers.append((b"content-encoding", coding.encode()))
+            headers.append((b"content-length", str(len(body)).encode()))
+            await send({**held, "headers": headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, send_compressed)
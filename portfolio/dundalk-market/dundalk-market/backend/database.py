@@ -1,47 +1,424 @@
-﻿from sqlalchemy import create_engine
+﻿from sqlalchemy import create_engine, event, exc, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+import anyio
+import asyncio
+import contextvars
+import itertools
+import math
 import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
 from dotenv import load_dotenv
-
-print("📂 Current directory:", os.getcwd())
-print("📁 .env path:", os.path.join(os.getcwd(), '.env'))
-print("📄 .env exists:", os.path.exists('.env'))
+import metrics
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Debug: List all environment variables
-print("🔍 Checking DATABASE_URL...")
-DATABASE_URL = os.getenv("DATABASE_URL")
-print(f"   DATABASE_URL from os.getenv: {DATABASE_URL}")
+DATABASE_URL = os.getenv("DATABASE_URL") or "sqlite:///./dundalk_market.db"
 
-# Debug: Check all env vars starting with DATABASE
-for key, value in os.environ.items():
-    if 'DATABASE' in key or 'POSTGRES' in key:
-        print(f"   {key}: {value}")
+# ============ CONNECTION POOL ============
 
-if not DATABASE_URL:
-    print("⚠️  DATABASE_URL not found in .env, using SQLite")
-    DATABASE_URL = "sqlite:///./dundalk_market.db"
+def env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
 
-print(f"🔗 Final Database URL: {DATABASE_URL[:60]}...")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds, -1 disables
+DB_POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", "true")
+# "queue" pools file-backed SQLite connections; "static" shares one connection
+# (always used for in-memory databases, which exist per connection)
+SQLITE_POOL = os.getenv("SQLITE_POOL", "queue").lower()
 
-# Create engine
-if DATABASE_URL.startswith('sqlite'):
-    engine = create_engine(
-        DATABASE_URL, 
-        connect_args={"check_same_thread": False}
+def pool_options(url: str) -> dict:
+    options = {}
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        if SQLITE_POOL == "static" or ":memory:" in url or url.split("://", 1)[1] in ("", "/"):
+            options["poolclass"] = StaticPool
+            return options
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
     )
-else:
-    engine = create_engine(DATABASE_URL)
+    return options
+
+def pool_status(engine) -> dict:
+    pool = engine.pool
+    status = {"class": type(pool).__name__}
+    # QueuePool exposes live counters; StaticPool/NullPool do not
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            status[name] = getattr(pool, name)()
+    if hasattr(pool, "timeout"):
+        status["max_overflow"] = pool._max_overflow
+        status["timeout"] = pool.timeout()
+    return status
+
+@contextmanager
+def timed_checkout():
+    """Record how long acquiring a pooled connection took, and pool timeouts"""
+    started = time.perf_counter()
+    try:
+        yield
+    except exc.TimeoutError:
+        metrics.POOL_TIMEOUTS.inc()
+        raise
+    metrics.POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
+# ============ SQLITE PRAGMAS ============
+
+# "tuned" (default) applies the profile below to every new SQLite connection;
+# "default" leaves SQLite's own settings (rollback journal, synchronous=FULL)
+SQLITE_PRAGMA_PROFILE = os.getenv("SQLITE_PRAGMA_PROFILE", "tuned").lower()
+
+SQLITE_PRAGMAS = {
+    # Readers keep reading the last committed snapshot while a writer commits
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    # Safe with WAL: a power cut can lose the last commits but never corrupts
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)),
+    # Negative values are KiB, so -65536 is a 64 MiB page cache per connection
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    # Wait for a competing writer instead of failing with "database is locked"
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT", "5000"),
+}
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        if value:
+            cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def install_sqlite_pragmas(engine):
+    if engine.url.get_backend_name() == "sqlite" and SQLITE_PRAGMA_PROFILE == "tuned":
+        event.listen(engine, "connect", apply_sqlite_pragmas)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def get_db():
+    init()
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+# ============ ASYNC ENGINE ============
+
+# DATABASE_ASYNC=false keeps request handlers on the blocking engine, run in the threadpool
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "true").lower() in ("1", "true", "yes")
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def async_url(url: str) -> str:
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql+psycopg2://... -> postgresql+asyncpg://..."""
+    scheme, rest = url.split("://", 1)
+    dialect = scheme.split("+", 1)[0]
+    return f"{ASYNC_DRIVERS.get(dialect, scheme)}://{rest}"
+
+# ============ ENGINES ============
+
+# engine, SessionLocal, async_engine and AsyncSessionLocal are created on first
+# use (or by the app lifespan), not on import: importing models or a CLI module
+# does not build pools or load the async driver, and a worker pays for it once.
+ENGINE_NAMES = ("engine", "SessionLocal", "async_engine", "AsyncSessionLocal")
+init_lock = threading.Lock()
+
+def init():
+    """Create the engines and session factories; does nothing after the first call"""
+    if "engine" in globals():
+        return
+    with init_lock:
+        if "engine" not in globals():
+            create_engines()
+
+def build_engines(url: str) -> tuple:
+    """(engine, SessionLocal, async_engine, AsyncSessionLocal) for one database URL"""
+    sync_engine = create_engine(url, **pool_options(url))
+    install_sqlite_pragmas(sync_engine)
+    if DATABASE_ASYNC:
+        # Needs greenlet plus aiosqlite or asyncpg, so only imported when enabled
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        async_sql_engine = create_async_engine(async_url(url), **pool_options(url))
+        install_sqlite_pragmas(async_sql_engine.sync_engine)
+        async_sessions = async_sessionmaker(bind=async_sql_engine, autoflush=False)
+    else:
+        async_sql_engine = None
+        async_sessions = None
+    return sync_engine, sessionmaker(autocommit=False, autoflush=False, bind=sync_engine), async_sql_engine, async_sessions
+
+def create_engines():
+    global engine, SessionLocal, async_engine, AsyncSessionLocal
+    sync_engine, SessionLocal, async_engine, AsyncSessionLocal = build_engines(DATABASE_URL)
+    replicas[:] = [Replica(f"replica-{i}", url) for i, url in enumerate(DATABASE_REPLICA_URLS, 1)]
+    # Set last: its presence is what marks the module as initialised
+    engine = sync_engine
+
+async def dispose():
+    """Close every pooled connection (app shutdown)"""
+    if "engine" not in globals():
+        return
+    for sync_engine, async_sql_engine in [(engine, async_engine)] + [(r.engine, r.async_engine) for r in replicas]:
+        sync_engine.dispose()
+        if async_sql_engine is not None:
+            await async_sql_engine.dispose()
+
+def __getattr__(name):
+    if name in ENGINE_NAMES:
+        init()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ============ READ REPLICAS ============
+
+# Comma-separated read replica URLs: Postgres streaming replicas, or copies of
+# a SQLite file to try it locally (benchmark.py replicas). GET and HEAD
+# requests read from one of them; writes, and reads by a client that has just
+# written, stay on DATABASE_URL.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# "round_robin" or "least_connections" (fewest queries in flight)
+REPLICA_SELECTION = os.getenv("REPLICA_SELECTION", "round_robin").lower()
+REPLICA_HEALTH_SECONDS = float(os.getenv("REPLICA_HEALTH_SECONDS", "5"))
+# Replicas further behind than this leave the rotation; it is also how long a
+# client's reads stay on the primary after it writes
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+PRIMARY_COOKIE = "db_primary_until"
+
+# Postgres standby replay lag in seconds: 0 when it has replayed all it received
+# (an idle primary sends nothing), NULL when the server is not a standby
+POSTGRES_LAG_SQL = """SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"""
+
+replicas = []  # filled by init()
+replica_turns = itertools.count()
+# "primary" or "replica": where the current request's reads go (ReadRoutingMiddleware)
+read_target = contextvars.ContextVar("read_target", default="primary")
+
+class Replica:
+    """One read replica: its engines, queries in flight and health"""
+    
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine, self.SessionLocal, self.async_engine, self.AsyncSessionLocal = build_engines(url)
+        self.in_flight = 0
+        self.reads = 0
+        self.healthy = True
+        self.lag_seconds = None
+        self.error = None
+    
+    def eject(self, error):
+        if self.healthy:
+            print(f"⚠️  {self.name} out of rotation: {error}")
+        self.healthy = False
+        self.error = str(error).splitlines()[0][:200]
+    
+    def check(self, revision):
+        """Probe with the schema revision the primary is at; eject or restore accordingly"""
+        try:
+            with self.engine.connect() as conn:
+                if revision is not None:
+                    found = schema_revision(conn)
+                    if found != revision:
+                        raise RuntimeError(f"schema at revision {found}, primary at {revision}")
+                if conn.dialect.name == "postgresql":
+                    lag = conn.exec_driver_sql(POSTGRES_LAG_SQL).scalar()
+                    self.lag_seconds = float(lag or 0)
+                    if self.lag_seconds > REPLICA_MAX_LAG_SECONDS:
+                        raise RuntimeError(f"{self.lag_seconds:.1f}s behind the primary")
+        except Exception as e:
+            self.eject(e)
+            return
+        if not self.healthy:
+            print(f"✅ {self.name} back in rotation")
+        self.healthy = True
+        self.error = None
+    
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "reads": self.reads,
+            "lag_seconds": self.lag_seconds,
+            "error": self.error,
+        }
+
+def schema_revision(conn):
+    """alembic_version of a database, or None when it has none"""
+    if not inspect(conn).has_table("alembic_version"):
+        return None
+    return conn.exec_driver_sql("SELECT version_num FROM alembic_version").scalar()
+
+def check_replicas():
+    """Health-check every replica against the primary (blocking; run in a thread)"""
+    init()
+    if not replicas:
+        return
+    with engine.connect() as conn:
+        revision = schema_revision(conn)
+    for replica in replicas:
+        replica.check(revision)
+
+def pick_replica():
+    """A healthy replica for the next read, or None to read from the primary"""
+    healthy = [replica for replica in replicas if replica.healthy]
+    if not healthy:
+        return None
+    # Rotating first also spreads least_connections ties instead of piling onto the first
+    turn = next(replica_turns) % len(healthy)
+    healthy = healthy[turn:] + healthy[:turn]
+    if REPLICA_SELECTION == "least_connections":
+        return min(healthy, key=lambda replica: replica.in_flight)
+    return healthy[0]
+
+def read_engine():
+    """The engine for a streaming read outside SessionRunner (exports)"""
+    init()
+    replica = pick_replica() if read_target.get() == "replica" else None
+    return engine if replica is None else replica.engine
+
+def new_session(replica=None):
+    if replica is not None:
+        return (replica.AsyncSessionLocal or replica.SessionLocal)()
+    return (AsyncSessionLocal or SessionLocal)()
+
+class ReadRoutingMiddleware:
+    """Routes GET/HEAD reads to replicas and everything else to the primary.
+    
+    A successful write sets a short-lived cookie (REPLICA_MAX_LAG_SECONDS) so
+    the same client's next reads come from the primary and see the write.
+    Clients without cookies can send "X-Read-Consistency: primary" instead.
+    Pure ASGI, so the choice reaches the handler's dependencies through a contextvar.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not DATABASE_REPLICA_URLS:
+            return await self.app(scope, receive, send)
+        if scope["method"] in ("GET", "HEAD"):
+            target = "primary" if self.pinned(scope) else "replica"
+            token = read_target.set(target)
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                read_target.reset(token)
+        
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = int(time.time() + REPLICA_MAX_LAG_SECONDS)
+                cookie = f"{PRIMARY_COOKIE}={until}; Max-Age={math.ceil(REPLICA_MAX_LAG_SECONDS)}; Path=/; HttpOnly; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+        
+        await self.app(scope, receive, send_with_pin)
+    
+    @staticmethod
+    def pinned(scope) -> bool:
+        for name, value in scope["headers"]:
+            if name == b"x-read-consistency" and value.strip().lower() == b"primary":
+                return True
+            if name == b"cookie":
+                for pair in value.decode("latin-1").split(";"):
+                    key, _, until = pair.strip().partition("=")
+                    if key == PRIMARY_COOKIE:
+                        try:
+                            return float(until) > time.time()
+                        except ValueError:
+                            return False
+        return False
+
+class SessionRunner:
+    """Runs Session-based query code for an async handler without blocking the event loop.
+    
+    On the async engine the function runs through AsyncSession.run_sync, so its
+    IO awaits the aiosqlite/asyncpg driver; on the sync engine it runs in a worker thread.
+    Each run is one unit of work: the connection goes back to the pool as soon as
+    fn returns, so it is never held across the handler's other awaits.
+    A replica that fails a run is taken out of rotation and the run is repeated
+    on the primary (only reads are routed to replicas, so repeating is safe).
+    """
+    
+    def __init__(self, session, replica=None):
+        self.session = session
+        self.replica = replica
+    
+    async def run(self, fn, *args):
+        replica = self.replica
+        if replica is None:
+            return await self._run(fn, *args)
+        replica.in_flight += 1
+        replica.reads += 1
+        try:
+            return await self._run(fn, *args)
+        except (exc.OperationalError, exc.InterfaceError) as e:
+            replica.eject(e)
+            self.session = new_session()
+            self.replica = None
+        finally:
+            replica.in_flight -= 1
+        return await self._run(fn, *args)
+    
+    async def _run(self, fn, *args):
+        if hasattr(self.session, "run_sync"):
+            try:
+                with timed_checkout():
+                    await self.session.connection()
+                return await self.session.run_sync(fn, *args)
+            finally:
+                await self.session.close()
+        return await anyio.to_thread.run_sync(self._run_sync, fn, *args)
+    
+    def _run_sync(self, fn, *args):
+        try:
+            with timed_checkout():
+                self.session.connection()
+            return fn(self.session, *args)
+        finally:
+            self.session.close()
+    
+    async def close(self):
+        if hasattr(self.session, "run_sync"):
+            await self.session.close()
+        else:
+            self.session.close()
+
+async def get_session():
+    init()
+    replica = pick_replica() if read_target.get() == "replica" else None
+    runner = SessionRunner(new_session(replica), replica)
+    try:
+        yield runner
+    finally:
+        await runner.close()
+
+# ============ WRITE GATE ============
+
+# SQLite allows one writer at a time. Contending connections wait in its busy
+# handler, which sleeps in growing steps (up to 100ms), so hundreds of
+# concurrent writers collapse throughput. Hot write paths queue here instead;
+# Postgres takes row locks and skips the gate.
+sqlite_writer = asyncio.Lock()
+
+@asynccontextmanager
+async def serialized_writes():
+    init()
+    if engine.dialect.name == "sqlite":
+        async with sqlite_writer:
+            yield
+    else:
+        yield
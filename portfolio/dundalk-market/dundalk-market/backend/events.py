@@ -0,0 +1,413 @@
+"""Change feed: compact delta events for catalogue writes, pushed to clients.
+
+Write endpoints publish an event once their transaction has committed, e.g.
+
+    {"id": "1760781923000-0", "type": "product.stock", "product_id": 12, "store_id": 3, "stock_quantity": 4}
+
+and GET /events (Server-Sent Events) or the /events/ws WebSocket push them to
+every connected client, so pages update in place instead of re-fetching.
+
+Each worker runs one Hub: a ring buffer of the last EVENTS_HISTORY events and
+the set of connected subscribers. An event is encoded once, as the SSE frame
+and the WebSocket text every subscriber gets. An idle client costs a waiting
+coroutine and its socket, and one hub-wide timer sends keepalives.
+
+Backpressure is per client: each subscriber queues at most
+EVENTS_CLIENT_BUFFER events. A client that falls that far behind (its socket
+is not draining) is dropped from the feed rather than buffered without limit:
+its stream ends as soon as it reads again, or is cut at the next keepalive if
+it stays stuck (uvicorn logs "ASGI callable returned without completing
+response" for each client cut that way). Clients resume with Last-Event-ID
+(SSE) or ?last_event_id= and get what they missed from the ring buffer. If
+the gap is older than the buffer they get a "reset" event, meaning re-fetch.
+
+Ids look like Redis stream ids ("<ms>-<seq>") and increase across restarts.
+With EVENTS_REDIS_URL set, events go through a Redis stream instead (XADD)
+and every worker reads it (XREAD) into its own hub, so clients see writes made
+on any worker. Redis, Valkey or any server speaking the stream commands will
+do; the redis package is optional. Functions in stream_listeners see every
+event read from the stream, which is how each worker drops the cached
+responses a write on another worker made stale.
+"""
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import deque
+from typing import Optional
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "10000"))
+EVENTS_CLIENT_BUFFER = int(os.getenv("EVENTS_CLIENT_BUFFER", "1000"))
+EVENTS_MAX_CLIENTS = int(os.getenv("EVENTS_MAX_CLIENTS", "10000"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+# Sent to SSE clients as the reconnect delay
+EVENTS_RETRY_MS = int(os.getenv("EVENTS_RETRY_MS", "2000"))
+EVENTS_REDIS_URL = os.getenv("EVENTS_REDIS_URL", "")
+EVENTS_REDIS_STREAM = os.getenv("EVENTS_REDIS_STREAM", "dundalk_market:events")
+
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+def dumps(payload: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+
+def parse_id(event_id: Optional[str]) -> Optional[tuple]:
+    """"<ms>-<seq>" as a comparable (ms, seq), or None if it is not one"""
+    try:
+        ms, seq = event_id.split("-")
+        return int(ms), int(seq)
+    except (AttributeError, ValueError):
+        return None
+
+def format_id(key: tuple) -> str:
+    return f"{key[0]}-{key[1]}"
+
+class Event:
+    """One published change, encoded once for every subscriber"""
+    __slots__ = ("id", "key", "text", "frame")
+
+    def __init__(self, event_id: str, payload: bytes):
+        self.id = event_id
+        self.key = parse_id(event_id)
+        # payload is a JSON object without the id; put the id first
+        data = b'{"id":"' + event_id.encode() + b'",' + payload[1:]
+        self.text = data.decode()
+        self.frame = b"id: " + event_id.encode() + b"\ndata: " + data + b"\n\n"
+
+def reset_event(latest: str) -> Event:
+    """Tells a client it missed more than the history holds; the id lets it resume from now"""
+    return Event(latest, dumps({"type": "reset"}))
+
+class SlowConsumer(Exception):
+    """The client fell EVENTS_CLIENT_BUFFER events behind"""
+
+# ============ HUB ============
+
+class Subscriber:
+    __slots__ = ("queue", "limit", "wakeup", "overflowed", "closed", "writer")
+
+    def __init__(self, limit: int):
+        self.queue = deque()
+        self.limit = limit
+        self.wakeup = asyncio.Event()
+        self.overflowed = False
+        self.closed = False
+        # The task writing to this client, cancelled if its socket stays stuck
+        self.writer = None
+
+    def offer(self, event: Event) -> bool:
+        """Queue event; False once the client is EVENTS_CLIENT_BUFFER events behind"""
+        if len(self.queue) >= self.limit:
+            self.overflowed = True
+            self.queue.clear()
+        else:
+            self.queue.append(event)
+        self.wakeup.set()
+        return not self.overflowed
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+
+    async def next_batch(self) -> Optional[list]:
+        """Events queued since the last call, [] on a keepalive tick, None once closed"""
+        await self.wakeup.wait()
+        self.wakeup.clear()
+        if self.overflowed:
+            raise SlowConsumer()
+        if self.closed:
+            return None
+        batch = list(self.queue)
+        self.queue.clear()
+        return batch
+
+class Hub:
+    """This worker's recent events and connected subscribers; only touched from the event loop"""
+
+    def __init__(self, history: int = EVENTS_HISTORY):
+        self.history = deque(maxlen=history)
+        self.subscribers = set()
+        # Overflowed subscribers whose writer has not finished yet -> keepalive tick they overflowed at
+        self.stalled = {}
+        self.ticks = 0
+        self._last = (int(time.time() * 1000), 0)
+        # Newest event known to be missing from history: resuming from before it leaves a gap
+        self.floor = self._last
+        self.published = 0
+        self.slow_disconnects = 0
+
+    def next_id(self) -> str:
+        ms = int(time.time() * 1000)
+        self._last = (ms, 0) if ms > self._last[0] else (self._last[0], self._last[1] + 1)
+        return format_id(self._last)
+
+    def latest_id(self) -> str:
+        return self.history[-1].id if self.history else format_id(self.floor)
+
+    def dispatch(self, event: Event):
+        if len(self.history) == self.history.maxlen:
+            self.floor = self.history[0].key
+        self.history.append(event)
+        self.published += 1
+        lagging = [subscriber for subscriber in self.subscribers if not subscriber.offer(event)]
+        for subscriber in lagging:
+            # Stop queueing for it: it resumes from Last-Event-ID once it reconnects
+            self.subscribers.discard(subscriber)
+            self.stalled[subscriber] = self.ticks
+            self.slow_disconnects += 1
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> tuple:
+        """(subscriber, backlog): backlog is what the client missed since last_event_id.
+
+        Registering and reading the history happen in one step of the event
+        loop, so no event can fall between the two.
+        """
+        subscriber = Subscriber(EVENTS_CLIENT_BUFFER)
+        backlog = []
+        if last_event_id:
+            last = parse_id(last_event_id)
+            if last is None or last < self.floor:
+                backlog.append(reset_event(self.latest_id()))
+            else:
+                backlog += [event for event in self.history if event.key > last]
+        self.subscribers.add(subscriber)
+        return subscriber, backlog
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+        self.stalled.pop(subscriber, None)
+
+    def tick(self):
+        """Wake every subscriber for a keepalive; cut writers stuck since before the previous tick"""
+        self.ticks += 1
+        for subscriber in self.subscribers:
+            subscriber.wakeup.set()
+        for subscriber, overflowed_at in list(self.stalled.items()):
+            if overflowed_at < self.ticks - 1 and subscriber.writer is not None:
+                subscriber.writer.cancel()
+
+    def close(self):
+        for subscriber in list(self.subscribers):
+            subscriber.close()
+        for subscriber in list(self.stalled):
+            if subscriber.writer is not None:
+                subscriber.writer.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "stalled": len(self.stalled),
+            "published": self.published,
+            "slow_disconnects": self.slow_disconnects,
+            "history": len(self.history),
+            "backend": "redis" if redis_client is not None else "local",
+        }
+
+hub = Hub()
+
+# ============ PUBLISHING ============
+
+redis_client = None
+outbox: Optional[asyncio.Queue] = None
+# Called with the fields of each new event read from the shared stream, this
+# worker's own included (startup history is not replayed to them)
+stream_listeners = []
+
+def publish(event_type: str, **fields):
+    """Publish a change after it has committed; call from the event loop"""
+    payload = dumps({"type": event_type, **fields})
+    if outbox is not None:
+        outbox.put_nowait(payload)
+    else:
+        hub.dispatch(Event(hub.next_id(), payload))
+
+async def relay_outbox():
+    """XADD published events in batches; every worker, this one included, reads them back"""
+    while True:
+        payloads = [await outbox.get()]
+        while not outbox.empty():
+            payloads.append(outbox.get_nowait())
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for payload in payloads:
+                    pipe.xadd(EVENTS_REDIS_STREAM, {"data": payload}, maxlen=EVENTS_HISTORY, approximate=True)
+                await pipe.execute()
+        except Exception as e:
+            print(f"⚠️  Could not publish {len(payloads)} events to Redis: {e}")
+
+async def read_stream():
+    """Feed the hub from the shared stream, starting with the history it already holds"""
+    entries = await redis_client.xrevrange(EVENTS_REDIS_STREAM, count=EVENTS_HISTORY + 1)
+    entries.reverse()
+    if len(entries) > EVENTS_HISTORY:
+        # The stream goes back further than the hub will: resuming from before here is a gap
+        hub.floor = parse_id(entries.pop(0)[0].decode())
+    else:
+        hub.floor = (0, 0)
+    for entry_id, fields in entries:
+        hub.dispatch(Event(entry_id.decode(), fields[b"data"]))
+    # "0-0" rather than "$" on an empty stream: nothing published in between is skipped
+    last = entries[-1][0].decode() if entries else "0-0"
+    while True:
+        try:
+            response = await redis_client.xread({EVENTS_REDIS_STREAM: last}, block=5000, count=1000)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️  Reading events from Redis failed: {e}")
+            await asyncio.sleep(1)
+            continue
+        for _, stream_entries in response:
+            for entry_id, fields in stream_entries:
+                last = entry_id.decode()
+                hub.dispatch(Event(last, fields[b"data"]))
+                notify_listeners(fields[b"data"])
+
+def notify_listeners(data: bytes):
+    if not stream_listeners:
+        return
+    try:
+        change = json.loads(data)
+        for listener in stream_listeners:
+            listener(change)
+    except Exception as e:
+        print(f"⚠️  Event listener failed: {e}")
+
+async def keepalive_forever():
+    while True:
+        await asyncio.sleep(EVENTS_KEEPALIVE_SECONDS)
+        hub.tick()
+
+def close_on_exit():
+    """End open streams when the server is told to stop.
+
+    Servers shut down gracefully by waiting for responses to finish, and an
+    event stream never does: chain onto the server's SIGINT/SIGTERM handlers
+    to close the subscribers first.
+    """
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(signum)
+        if not callable(previous):
+            continue
+        def handle(sig, frame, previous=previous):
+            hub.close()
+            previous(sig, frame)
+        signal.signal(signum, handle)
+
+async def start() -> list:
+    """Start this worker's feed; returns the background tasks to cancel at shutdown"""
+    global redis_client, outbox
+    tasks = [asyncio.create_task(keepalive_forever())]
+    if EVENTS_REDIS_URL:
+        # Imported here, not at the top: the client costs a cold start ~60 ms
+        # and only workers sharing a stream need it
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            print("⚠️  EVENTS_REDIS_URL is set but the redis package is not installed; events stay in this worker")
+        else:
+            redis_client = redis.from_url(EVENTS_REDIS_URL)
+            outbox = asyncio.Queue()
+            tasks += [asyncio.create_task(read_stream()), asyncio.create_task(relay_outbox())]
+    try:
+        close_on_exit()
+    except ValueError:
+        # Not the main thread (e.g. a test client): nothing to chain onto
+        pass
+    return tasks
+
+async def stop():
+    global redis_client, outbox
+    hub.close()
+    if redis_client is not None:
+        await redis_client.aclose()
+    redis_client, outbox = None, None
+
+# ============ STREAMS ============
+
+async def wait_for_disconnect(receive):
+    while (await receive())["type"] not in ("http.disconnect", "websocket.disconnect"):
+        pass
+
+class EventStream(Response):
+    """ASGI response for GET /events: the SSE feed for one client.
+
+    Frames go out from a task of their own so the hub can cancel it when the
+    client's socket stays full; a StreamingResponse would wait in send()
+    forever. Everything queued since the last write goes out as one chunk.
+    """
+    media_type = "text/event-stream"
+
+    def __init__(self, last_event_id: Optional[str] = None, headers: dict = None):
+        self.last_event_id = last_event_id
+        self.status_code = 200
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        subscriber, backlog = hub.subscribe(self.last_event_id)
+        subscriber.writer = asyncio.create_task(self.write(send, subscriber, backlog))
+        reader = asyncio.create_task(wait_for_disconnect(receive))
+        try:
+            await asyncio.wait((subscriber.writer, reader), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            subscriber.writer.cancel()
+            reader.cancel()
+            hub.unsubscribe(subscriber)
+
+    async def write(self, send, subscriber: Subscriber, backlog: list):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        chunk = b"retry: " + str(EVENTS_RETRY_MS).encode() + b"\n\n" + b"".join(event.frame for event in backlog)
+        try:
+            while True:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                batch = await subscriber.next_batch()
+                if batch is None:
+                    break
+                chunk = b"".join(event.frame for event in batch) if batch else KEEPALIVE_FRAME
+        except SlowConsumer:
+            # Reading again, but too late: end the stream and let it resume from Last-Event-ID
+            pass
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+async def websocket_feed(websocket, last_event_id: Optional[str] = None):
+    """Send events as text messages on an accepted WebSocket until the client goes away or falls behind.
+
+    A reader task notices the client closing while the feed is idle; the
+    client is not expected to send anything.
+    """
+    subscriber, backlog = hub.subscribe(last_event_id)
+
+    async def send_events():
+        for event in backlog:
+            await websocket.send_text(event.text)
+        while True:
+            batch = await subscriber.next_batch()
+            if batch is None:
+                # 1001: going away
+                await websocket.close(code=1001)
+                return
+            for event in batch:
+                await websocket.send_text(event.text)
+
+    subscriber.writer = asyncio.create_task(send_events())
+    reader = asyncio.create_task(wait_for_disconnect(websocket.receive))
+    try:
+        done, _ = await asyncio.wait((subscriber.writer, reader), return_when=asyncio.FIRST_COMPLETED)
+        writer = subscriber.writer
+        if writer in done and not writer.cancelled() and isinstance(writer.exception(), SlowConsumer):
+            # 1013: try again later, resuming from the last id received
+            await websocket.close(code=1013)
+    finally:
+        subscriber.writer.cancel()
+        reader.cancel()
+        hub.unsubscribe(subscriber)
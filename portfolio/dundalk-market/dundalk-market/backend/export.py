@@ -0,0 +1,64 @@
+"""Streaming catalogue exports.
+
+Rows are read through a server-side cursor (stream_results + yield_per) and
+encoded one partition at a time, so memory stays flat whatever the table size
+and the first bytes go out before the query has finished. The generators are
+synchronous; StreamingResponse pulls them from the threadpool.
+"""
+import csv
+import io
+import os
+import zlib
+from datetime import datetime
+
+import compression
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    qualities = compression.accepted(accept_encoding)
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+def encode_ndjson(fields, rows) -> bytes:
+    if orjson is not None:
+        return b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+    return "".join(
+        json.dumps(dict(zip(fields, row)), default=datetime.isoformat, separators=(",", ":"), ensure_ascii=False) + "\n"
+        for row in rows
+    ).encode()
+
+def encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows(
+        [value.isoformat() if isinstance(value, datetime) else value for value in row]
+        for row in rows
+    )
+    return buffer.getvalue().encode()
+
+def stream_rows(engine, statement, fields, fmt: str, batch_size: int = EXPORT_BATCH_SIZE):
+    """Yield the encoded result of statement, one partition of rows per chunk"""
+    if fmt == "csv":
+        yield encode_csv([fields])
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for partition in result.partitions():
+            yield encode_ndjson(fields, partition) if fmt == "ndjson" else encode_csv(partition)
+
+def gzipped(chunks, level: int = GZIP_LEVEL):
+    """gzip a chunk stream, flushing after every chunk so the client never stalls"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,226 @@
+"""Store locations: offline geocoding and "stores near a point" queries.
+
+Addresses are geocoded against gazetteer.csv, a bundled list of towns and
+Dundalk/Drogheda streets, so no request ever leaves the server. A street in a
+known town resolves to the street, otherwise to the town; anything else stays
+unlocated (latitude/longitude NULL) and never appears in /stores/near.
+
+Radius queries first take the bounding box of the circle through a spatial
+index, then compute exact great-circle distances for those candidates only:
+
+- SQLite: an R*Tree (stores_rtree) kept in step with stores by triggers, like
+  the search index and aggregates.
+- Postgres: a GiST index on point(longitude, latitude), queried with <@ box.
+- Anything else: the same bounding box on the plain columns.
+"""
+import csv
+import math
+import os
+import re
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import select, text
+
+import models
+
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv"))
+# /stores/near starts from a circle this size and widens it until it has enough stores
+INITIAL_SEARCH_KM = float(os.getenv("NEAR_INITIAL_SEARCH_KM", "0.25"))
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# ============ GEOCODING ============
+
+def normalise(part: str) -> str:
+    return " ".join(part.lower().replace(".", "").split())
+
+@lru_cache(maxsize=1)
+def gazetteer() -> tuple:
+    """(towns, streets): town name -> [(county, lat, lon)], (town, street) -> (lat, lon)"""
+    towns = {}
+    streets = {}
+    with open(GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+        rows = csv.DictReader(line for line in f if not line.startswith("#"))
+        for row in rows:
+            point = (float(row["latitude"]), float(row["longitude"]))
+            if row["town"]:
+                streets[(normalise(row["town"]), normalise(row["name"]))] = point
+            else:
+                towns.setdefault(normalise(row["name"]), []).append((normalise(row["county"]), *point))
+    return towns, streets
+
+HOUSE_NUMBER = re.compile(r"^(unit |no )?\d+[a-z]?\s+")
+
+def geocode(address: Optional[str]) -> Optional[tuple]:
+    """(latitude, longitude) for an address like "12 Park Street, Dundalk, Co. Louth", or None"""
+    if not address:
+        return None
+    towns, streets = gazetteer()
+    parts = [normalise(part) for part in address.split(",")]
+    counties = {part[3:] if part.startswith("co ") else part for part in parts}
+    for position, part in enumerate(parts):
+        candidates = towns.get(part)
+        if not candidates:
+            continue
+        # Prefer the street, e.g. "Market Square" before "Dundalk"
+        for earlier in parts[:position]:
+            street = streets.get((part, HOUSE_NUMBER.sub("", earlier)))
+            if street is not None:
+                return street
+        # Same-named towns ("Blackrock") are told apart by the county
+        county, latitude, longitude = next((town for town in candidates if town[0] in counties), candidates[0])
+        return latitude, longitude
+    return None
+
+# ============ DISTANCE ============
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> tuple:
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle"""
+    delta_lat = radius_km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(89.9, abs(latitude) + delta_lat)))
+    delta_lon = min(180.0, radius_km / (KM_PER_DEGREE * cos_lat))
+    return latitude - delta_lat, latitude + delta_lat, longitude - delta_lon, longitude + delta_lon
+
+# ============ SPATIAL INDEX ============
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS stores_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    "DROP TRIGGER IF EXISTS stores_rtree_insert",
+    """CREATE TRIGGER stores_rtree_insert AFTER INSERT ON stores WHEN new.latitude IS NOT NULL BEGIN
+        INSERT INTO stores_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END""",
+    "DROP TRIGGER IF EXISTS stores_rtree_update",
+    """CREATE TRIGGER stores_rtree_update AFTER UPDATE OF latitude, longitude ON stores BEGIN
+        DELETE FROM stores_rtree WHERE id = old.id;
+        INSERT INTO stores_rtree SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END""",
+    "DROP TRIGGER IF EXISTS stores_rtree_delete",
+    """CREATE TRIGGER stores_rtree_delete AFTER DELETE ON stores BEGIN
+        DELETE FROM stores_rtree WHERE id = old.id;
+    END""",
+]
+
+SQLITE_BACKFILL = [
+    "DELETE FROM stores_rtree",
+    """INSERT INTO stores_rtree SELECT id, latitude, latitude, longitude, longitude
+        FROM stores WHERE latitude IS NOT NULL AND longitude IS NOT NULL""",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS stores_rtree_insert",
+    "DROP TRIGGER IF EXISTS stores_rtree_update",
+    "DROP TRIGGER IF EXISTS stores_rtree_delete",
+]
+
+POSTGRES_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_stores_location ON stores USING gist (point(longitude, latitude))",
+]
+
+def install_schema(conn):
+    """Create the spatial index for this database and fill it (idempotent)"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_DDL + SQLITE_BACKFILL:
+            conn.exec_driver_sql(statement)
+    elif dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            conn.exec_driver_sql(statement)
+
+def drop_schema(conn):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_DROP:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("DROP TABLE IF EXISTS stores_rtree")
+    elif dialect == "postgresql":
+        conn.exec_driver_sql("DROP INDEX IF EXISTS ix_stores_location")
+
+@contextmanager
+def bulk_load(session):
+    """Suspend the R*Tree triggers around a bulk rewrite of stores and refill it afterwards"""
+    conn = session.connection()
+    if conn.dialect.name != "sqlite":
+        yield
+        return
+    for statement in SQLITE_DROP:
+        conn.exec_driver_sql(statement)
+    session.commit()
+    try:
+        yield
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        install_schema(session.connection())
+        session.commit()
+
+def geocode_missing(conn) -> int:
+    """Fill latitude/longitude for stores that have an address but no location yet"""
+    rows = conn.execute(text(
+        "SELECT id, address FROM stores WHERE latitude IS NULL AND address IS NOT NULL AND address != ''"
+    )).all()
+    located = []
+    for store_id, address in rows:
+        point = geocode(address)
+        if point is not None:
+            located.append({"id": store_id, "latitude": point[0], "longitude": point[1]})
+    if located:
+        conn.execute(text("UPDATE stores SET latitude = :latitude, longitude = :longitude WHERE id = :id"), located)
+    return len(located)
+
+# ============ QUERIES ============
+
+def candidate_filter(dialect: str) -> str:
+    """SQL restricting stores to the bounding box, through the spatial index"""
+    if dialect == "sqlite":
+        return """stores.id IN (SELECT id FROM stores_rtree
+            WHERE min_lat <= :max_lat AND max_lat >= :min_lat AND min_lon <= :max_lon AND max_lon >= :min_lon)"""
+    if dialect == "postgresql":
+        return "point(stores.longitude, stores.latitude) <@ box(point(:min_lon, :min_lat), point(:max_lon, :max_lat))"
+    return "stores.latitude BETWEEN :min_lat AND :max_lat AND stores.longitude BETWEEN :min_lon AND :max_lon"
+
+def within(session, columns: list, latitude: float, longitude: float, radius_km: float) -> list:
+    """(distance_km, row of columns) for approved stores within radius_km, unordered.
+
+    columns are Store attributes, so values come back typed (bools, datetimes)
+    on every backend.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    rows = session.execute(
+        select(models.Store.latitude, models.Store.longitude, *columns)
+        .where(text(candidate_filter(session.get_bind().dialect.name)), models.Store.is_approved == True),
+        {"min_lat": min_lat, "max_lat": max_lat, "min_lon": min_lon, "max_lon": max_lon}
+    ).all()
+    found = []
+    for row in rows:
+        distance = haversine_km(latitude, longitude, row[0], row[1])
+        if distance <= radius_km:
+            found.append((distance, row[2:]))
+    return found
+
+def near(session, columns: list, latitude: float, longitude: float, radius_km: float, limit: int) -> list:
+    """The limit nearest approved stores within radius_km, as (distance_km, row of columns).
+
+    Searches a small circle first and widens it, sized from the density seen
+    so far, until it holds limit stores or reaches radius_km: anything outside
+    the circle is farther than everything inside, so a dense town centre costs
+    about as much as open country.
+    """
+    search_km = min(radius_km, INITIAL_SEARCH_KM)
+    while True:
+        found = within(session, columns, latitude, longitude, search_km)
+        if len(found) >= limit or search_km >= radius_km:
+            break
+        # Stores per area so far predicts the radius that holds limit of them
+        growth = max(1.5, math.sqrt(limit / len(found)) * 1.25) if found else 4.0
+        search_km = min(radius_km, search_km * growth)
+    found.sort(key=lambda item: item[0])
+    return found[:limit]
@@ -0,0 +1,259 @@
+"""Idempotency-Key support for POST endpoints.
+
+The first POST carrying a given Idempotency-Key runs normally and its response
+(status, headers, body) is kept for IDEMPOTENCY_TTL_SECONDS. Retries with the
+same key and body get that response back without touching the handler or the
+database (marked Idempotent-Replayed: true). A retry that arrives while the
+first request is still running waits for it instead of running again. Reusing
+a key with a different body is a 422.
+
+Keys are scoped to method + path. 5xx responses (and handlers that raised)
+are not kept, so those can be retried. With IDEMPOTENCY_BACKEND=database the keys are also claimed in the
+idempotency_keys table, so duplicates landing on other workers are caught;
+the in-process store still answers repeat hits locally.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+import anyio
+from sqlalchemy import delete, exc, select, update
+
+import database
+import models
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory").lower()
+# How long a duplicate waits for the first request before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+MAX_KEY_LENGTH = 255
+
+# Per-response headers that should not be replayed
+SKIP_HEADERS = {b"server-timing", b"date", b"server"}
+
+class StoredResponse(NamedTuple):
+    fingerprint: Optional[str]
+    status: int
+    headers: list
+    body: bytes
+
+# ============ IN-PROCESS STORE ============
+
+class MemoryStore:
+    """TTL + LRU map of key -> StoredResponse, plus the keys currently in flight.
+
+    Only touched from the event loop, so it needs no lock.
+    """
+
+    def __init__(self, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._entries = OrderedDict()
+        self.in_flight = {}
+        self.replays = 0
+
+    def get(self, key: str) -> Optional[StoredResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, stored = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return stored
+
+    def set(self, key: str, stored: StoredResponse):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, stored)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._entries), "in_flight": len(self.in_flight), "replays": self.replays}
+
+store = MemoryStore()
+
+# ============ DATABASE STORE ============
+
+def db_claim(key: str):
+    """Insert a placeholder row for key; returns None if claimed, else the existing row.
+
+    Sync: run it in a worker thread.
+    """
+    now = datetime.utcnow()
+    with database.SessionLocal() as session:
+        session.execute(delete(models.IdempotencyKey).where(
+            models.IdempotencyKey.key == key, models.IdempotencyKey.expires_at <= now
+        ))
+        # Now and then, clear out everything that has expired
+        if random.random() < 0.01:
+            session.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.expires_at <= now))
+        session.add(models.IdempotencyKey(key=key, expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)))
+        try:
+            session.commit()
+            return None
+        except exc.IntegrityError:
+            session.rollback()
+        return session.execute(
+            select(models.IdempotencyKey.status_code, models.IdempotencyKey.fingerprint,
+                   models.IdempotencyKey.headers, models.IdempotencyKey.body)
+            .where(models.IdempotencyKey.key == key)
+        ).first()
+
+def db_complete(key: str, stored: Optional[StoredResponse]):
+    """Record the response for a claimed key, or drop the claim when there is nothing to keep"""
+    with database.SessionLocal() as session:
+        if stored is None:
+            session.execute(delete(models.IdempotencyKey).where(
+                models.IdempotencyKey.key == key, models.IdempotencyKey.status_code.is_(None)
+            ))
+        else:
+            session.execute(
+                update(models.IdempotencyKey)
+                .where(models.IdempotencyKey.key == key)
+                .values(
+                    fingerprint=stored.fingerprint,
+                    status_code=stored.status,
+                    headers=json.dumps([[name.decode("latin-1"), value.decode("latin-1")] for name, value in stored.headers]),
+                    body=stored.body,
+                )
+            )
+        session.commit()
+
+def stored_from_row(row) -> StoredResponse:
+    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(row.headers)]
+    return StoredResponse(row.fingerprint, row.status_code, headers, row.body)
+
+# ============ MIDDLEWARE ============
+
+async def send_json(send, status: int, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+async def body_fingerprint(receive) -> str:
+    """sha256 of a request body we are not going to run, read to the end"""
+    digest = hashlib.sha256()
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        digest.update(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return digest.hexdigest()
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        header = dict(scope["headers"]).get(b"idempotency-key")
+        if header is None:
+            return await self.app(scope, receive, send)
+        if not header or len(header) > MAX_KEY_LENGTH:
+            return await send_json(send, 400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+        key = f"{scope['method']} {scope['path']} {header.decode('latin-1')}"
+
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            stored = store.get(key)
+            if stored is not None:
+                return await self.replay(stored, receive, send)
+            first = store.in_flight.get(key)
+            if first is None:
+                break
+            # Same key already running in this process: wait for its response
+            try:
+                await asyncio.wait_for(first.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                return await send_json(send, 409, "A request with this Idempotency-Key is still in progress")
+
+        done = asyncio.Event()
+        store.in_flight[key] = done
+        claimed = False
+        stored = None
+        try:
+            if IDEMPOTENCY_BACKEND == "database":
+                existing = await self.claim_across_workers(key, deadline)
+                if isinstance(existing, StoredResponse):
+                    store.set(key, existing)
+                    return await self.replay(existing, receive, send)
+                if existing == "busy":
+                    return await send_json(send, 409, "A request with this Idempotency-Key is still in progress")
+                claimed = True
+            stored = await self.run_and_capture(scope, receive, send)
+            if stored is not None:
+                store.set(key, stored)
+        finally:
+            del store.in_flight[key]
+            done.set()
+            if claimed:
+                # Also when the handler raised or the request was cancelled: a claim
+                # left without a response would turn every retry into a 409 until it expired
+                with anyio.CancelScope(shield=True):
+                    await anyio.to_thread.run_sync(db_complete, key, stored)
+
+    async def claim_across_workers(self, key: str, deadline: float):
+        """None once this worker owns the key, a StoredResponse to replay, or "busy" on timeout"""
+        while True:
+            row = await anyio.to_thread.run_sync(db_claim, key)
+            if row is None:
+                return None
+            if row.status_code is not None:
+                return stored_from_row(row)
+            if time.monotonic() >= deadline:
+                return "busy"
+            # Another worker is running it; poll until it records a response or gives up
+            await asyncio.sleep(0.05)
+
+    async def run_and_capture(self, scope, receive, send) -> Optional[StoredResponse]:
+        digest = hashlib.sha256()
+        body_complete = False
+        status = None
+        headers = []
+        chunks = []
+
+        async def hashing_receive():
+            nonlocal body_complete
+            message = await receive()
+            if message["type"] == "http.request":
+                digest.update(message.get("body", b""))
+                body_complete = not message.get("more_body")
+            return message
+
+        async def capturing_send(message):
+            nonlocal status, headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = [(name, value) for name, value in message.get("headers", []) if name.lower() not in SKIP_HEADERS]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, hashing_receive, capturing_send)
+        if status is None or status >= 500:
+            return None
+        # A handler that stopped reading early leaves nothing to compare bodies against
+        fingerprint = digest.hexdigest() if body_complete else None
+        return StoredResponse(fingerprint, status, headers, b"".join(chunks))
+
+    async def replay(self, stored: StoredResponse, receive, send):
+        fingerprint = await body_fingerprint(receive)
+        if stored.fingerprint is not None and fingerprint != stored.fingerprint:
+            return await send_json(send, 422, "Idempotency-Key was already used with a different request body")
+        store.replays += 1
+        await send({"type": "http.response.start", "status": stored.status,
+                    "headers": stored.headers + [(b"idempotent-replayed", b"true")]})
+        await send({"type": "http.response.body", "body": stored.body})
@@ -0,0 +1,198 @@
+"""Product image storage and thumbnails.
+
+Uploads are streamed to disk while being hashed and stored content-addressed:
+
+    IMAGE_DIR/originals/ab/abcdef....jpg
+    IMAGE_DIR/thumbs/480/ab/abcdef....webp
+
+so the same picture uploaded twice is kept once, and a URL never changes
+meaning, which lets every image be served with an immutable, year-long
+Cache-Control. WebP thumbnails at THUMBNAIL_SIZES are made in a process pool
+(Pillow is CPU-bound and holds the GIL) right after upload, or on first
+request if they are missing. Without Pillow installed, uploads still work and
+thumbnail URLs fall back to the original.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import os
+import re
+import tempfile
+from typing import AsyncIterator, Optional
+
+import anyio
+from fastapi import HTTPException
+
+# Pillow is only imported by the pool processes that render thumbnails
+PILLOW = importlib.util.find_spec("PIL") is not None
+
+IMAGE_DIR = os.getenv("IMAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "images"))
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv("THUMBNAIL_SIZES", "160,480").split(","))
+# The size product listings link to through image_url
+LISTING_SIZE = int(os.getenv("LISTING_THUMBNAIL_SIZE", str(THUMBNAIL_SIZES[-1])))
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "80"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Leading bytes -> extension; anything else is refused
+SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+MEDIA_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def sniff(head: bytes) -> Optional[str]:
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+def original_path(digest: str, ext: str) -> str:
+    return os.path.join(IMAGE_DIR, "originals", digest[:2], f"{digest}.{ext}")
+
+def thumbnail_path(digest: str, size: int) -> str:
+    return os.path.join(IMAGE_DIR, "thumbs", str(size), digest[:2], f"{digest}.webp")
+
+def original_url(digest: str, ext: str) -> str:
+    return f"/images/{digest}.{ext}"
+
+def thumbnail_url(digest: str, size: int) -> str:
+    return f"/images/{size}/{digest}.webp"
+
+def find_original(digest: str) -> Optional[str]:
+    if not DIGEST_PATTERN.match(digest):
+        return None
+    for ext in MEDIA_TYPES:
+        path = original_path(digest, ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+# ============ UPLOAD ============
+
+async def save_upload(chunks: AsyncIterator[bytes]) -> tuple:
+    """Stream a request body to disk; returns (digest, ext, created).
+
+    The body goes to a temp file in IMAGE_DIR while it is hashed, then is
+    renamed into place, or dropped if that content is already stored.
+    Raises HTTPException 413 for oversized bodies and 415 for anything that
+    is not a JPEG, PNG, GIF or WebP image.
+    """
+    tmp_dir = os.path.join(IMAGE_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    digest = hashlib.sha256()
+    head = b""
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > MAX_IMAGE_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+                if len(head) < 16:
+                    head += chunk[:16]
+                digest.update(chunk)
+                await anyio.to_thread.run_sync(tmp.write, chunk)
+        ext = sniff(head)
+        if ext is None:
+            raise HTTPException(status_code=415, detail="Upload a JPEG, PNG, GIF or WebP image")
+        digest = digest.hexdigest()
+        path = original_path(digest, ext)
+        if os.path.exists(path):
+            return digest, ext, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return digest, ext, True
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+# ============ THUMBNAILS ============
+
+def render_thumbnails(source: str, digest: str, sizes) -> list:
+    """Write a WebP thumbnail per size (runs in a pool process); returns the sizes written"""
+    from PIL import Image, ImageOps
+    written = []
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+        for size in sizes:
+            path = thumbnail_path(digest, size)
+            if os.path.exists(path):
+                continue
+            thumb = image.copy()
+            thumb.thumbnail((size, size))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a reader never sees half a file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            thumb.save(tmp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+            os.replace(tmp_path, path)
+            written.append(size)
+    return written
+
+pool = None
+pending = {}
+
+def get_pool():
+    global pool
+    if pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn, not fork: a forked child would inherit this process's pooled connections
+        pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return pool
+
+def shutdown():
+    global pool
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        pool = None
+
+def generate_thumbnails(digest: str, source: str) -> Optional[asyncio.Future]:
+    """Queue thumbnail rendering for an original; one job per digest at a time"""
+    if not PILLOW:
+        return None
+    job = pending.get(digest)
+    if job is None:
+        job = asyncio.wrap_future(get_pool().submit(render_thumbnails, source, digest, THUMBNAIL_SIZES))
+        pending[digest] = job
+        job.add_done_callback(lambda done: finished(digest, done))
+    return job
+
+def finished(digest: str, job: asyncio.Future):
+    pending.pop(digest, None)
+    if not job.cancelled() and job.exception() is not None:
+        print(f"⚠️  Thumbnails failed for {digest}: {job.exception()}")
+
+async def thumbnail(digest: str, size: int) -> Optional[str]:
+    """Path to the size thumbnail, rendering it first if needed; None if there is no such image.
+
+    Falls back to the original when thumbnails cannot be made (no Pillow, or
+    an image Pillow cannot read); check the extension of the returned path.
+    """
+    if size not in THUMBNAIL_SIZES or not DIGEST_PATTERN.match(digest):
+        return None
+    path = thumbnail_path(digest, size)
+    if os.path.exists(path):
+        return path
+    source = find_original(digest)
+    if source is None:
+        return None
+    job = generate_thumbnails(digest, source)
+    if job is None:
+        return source
+    try:
+        await asyncio.shield(job)
+    except Exception:
+        return source
+    return path
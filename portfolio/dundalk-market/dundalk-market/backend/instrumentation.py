@@ -0,0 +1,151 @@
+"""Per-request SQL, serialization and compression timing.
+
+Cursor events on the engines add every statement to the current request's
+RequestStats (held in a contextvar, so the threadpool and greenlet paths see
+it too). The middleware turns the totals into a Server-Timing header and one
+structured log line per request, and statements slower than SLOW_QUERY_MS are
+logged with their route.
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+import metrics
+from database import env_flag
+
+REQUEST_LOG = env_flag("REQUEST_LOG", "true")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+logger = logging.getLogger("dundalk_market")
+if not logger.handlers:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    logger.propagate = False
+
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_seconds", "serialize_seconds", "compress_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.compress_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        """The matched path template once routing has happened, else the raw path"""
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path", "")
+
+    @property
+    def route_label(self) -> str:
+        """Route template for metric labels; unmatched paths share one label"""
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+current = contextvars.ContextVar("request_stats", default=None)
+
+# ============ SQL ============
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    stats = current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning(json.dumps({
+            "event": "slow_query",
+            "route": stats.route if stats else None,
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": " ".join(statement.split()),
+        }))
+
+def instrument(engine):
+    """Attach the timing listeners to a sync Engine (pass async_engine.sync_engine for async)"""
+    if event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+@contextmanager
+def serializing():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current.get()
+        if stats is not None:
+            stats.serialize_seconds += time.perf_counter() - started
+
+@contextmanager
+def compressing():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current.get()
+        if stats is not None:
+            stats.compress_seconds += time.perf_counter() - started
+
+# ============ MIDDLEWARE ============
+
+class RequestTimingMiddleware:
+    """Server-Timing header, request metrics and a JSON log line for every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats(scope)
+        token = current.set(stats)
+        started = time.perf_counter()
+        status = None
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                total_ms = (time.perf_counter() - started) * 1000
+                timing = (
+                    f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries", '
+                    f"serialize;dur={stats.serialize_seconds * 1000:.2f}, "
+                    f"compress;dur={stats.compress_seconds * 1000:.2f}, "
+                    f"app;dur={total_ms:.2f}"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current.reset(token)
+            # No response started means the app raised; the server answers 500
+            metrics.observe_request(scope["method"], stats.route_label, status or 500, time.perf_counter() - started)
+            if REQUEST_LOG:
+                logger.info(json.dumps({
+                    "event": "request",
+                    "method": scope["method"],
+                    "route": stats.route,
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "queries": stats.queries,
+                    "db_ms": round(stats.db_seconds * 1000, 2),
+                    "serialize_ms": round(stats.serialize_seconds * 1000, 2),
+                    "compress_ms": round(stats.compress_seconds * 1000, 2),
+                }))
@@ -0,0 +1,419 @@
+"""Durable background jobs: reseeding, bulk imports and aggregate rebuilds.
+
+POST endpoints add a row to the jobs table and answer 202 with its id, and
+GET /jobs/{id} reports progress. Every API worker runs a claim loop
+(JOBS_WORKER=false leaves a process out), so queued jobs survive restarts and
+are shared between workers:
+
+- Each job type has a concurrency limit counted in the database, so two
+  reseeds never overlap however many workers there are. Types registered
+  with the same exclusive group never run at the same time either (a reseed
+  and an aggregate rebuild both rewrite whole tables).
+- Handlers run on a small dedicated thread pool, or a process pool for
+  CPU-bound work, never on the event loop or the request threadpool.
+- A failed attempt is retried with exponential backoff up to max_attempts.
+- A worker that dies stops heartbeating; its jobs are requeued by the others.
+- Cancelling a queued job stops it at once; a running one stops at its next
+  progress report (JobContext.progress raises JobCancelled).
+
+A handler is fn(ctx, **params) returning a JSON-serializable result. Process
+pool handlers must be module-level functions, since they are pickled by name.
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple, Optional
+
+import anyio
+from sqlalchemy import case, create_engine, exc, func, select, text, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.pool import NullPool
+
+import database
+import models
+
+JOBS_WORKER = database.env_flag("JOBS_WORKER", "true")
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "1"))
+JOBS_THREADS = int(os.getenv("JOBS_THREADS", "2"))
+JOBS_PROCESSES = int(os.getenv("JOBS_PROCESSES", "1"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+# Wait before the first retry; doubled after each further failure
+JOBS_RETRY_SECONDS = float(os.getenv("JOBS_RETRY_SECONDS", "5"))
+# A running job whose heartbeat is older than this belongs to a dead worker
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+# Progress is written at most this often per job
+JOBS_PROGRESS_SECONDS = float(os.getenv("JOBS_PROGRESS_SECONDS", "0.5"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+FINISHED = ("succeeded", "failed", "cancelled")
+
+class JobCancelled(Exception):
+    pass
+
+class JobType(NamedTuple):
+    name: str
+    fn: Callable
+    concurrency: int
+    max_attempts: int
+    process: bool
+    # Called in the worker's own process with the result of a successful run;
+    # anything other workers must hear about has to go through events.publish
+    after: Optional[Callable]
+    # Called with the params once the job will not run again
+    cleanup: Optional[Callable]
+    # Job types sharing a group run one at a time between them
+    exclusive: Optional[str]
+
+JOB_TYPES = {}
+
+def register(name: str, fn: Callable, concurrency: int = 1, max_attempts: int = JOBS_MAX_ATTEMPTS,
+             process: bool = False, after: Callable = None, cleanup: Callable = None, exclusive: str = None):
+    JOB_TYPES[name] = JobType(name, fn, concurrency, max_attempts, process, after, cleanup, exclusive)
+
+def exclusive_with(job_type: JobType) -> list:
+    """The other job types that may not run alongside job_type"""
+    if job_type.exclusive is None:
+        return []
+    return [other.name for other in JOB_TYPES.values() if other.exclusive == job_type.exclusive and other.name != job_type.name]
+
+# ============ QUEUE ============
+
+def describe(job: models.Job) -> dict:
+    return {
+        "id": job.id,
+        "type": job.type,
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "params": json.loads(job.params or "{}"),
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+def enqueue(session, name: str, params: dict) -> dict:
+    job = models.Job(
+        type=name,
+        params=json.dumps(params),
+        max_attempts=JOB_TYPES[name].max_attempts,
+        run_after=datetime.utcnow(),
+    )
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return describe(job)
+
+def get(session, job_id: int) -> Optional[dict]:
+    job = session.get(models.Job, job_id)
+    return describe(job) if job is not None else None
+
+def recent(session, limit: int, job_type: Optional[str] = None, status: Optional[str] = None) -> list:
+    query = select(models.Job).order_by(models.Job.id.desc()).limit(limit)
+    if job_type:
+        query = query.where(models.Job.type == job_type)
+    if status:
+        query = query.where(models.Job.status == status)
+    return [describe(job) for job in session.scalars(query)]
+
+def cancel(session, job_id: int) -> tuple:
+    """(job, stopped): a queued job is cancelled outright, a running one is asked to stop"""
+    now = datetime.utcnow()
+    stopped = session.execute(
+        update(models.Job)
+        .where(models.Job.id == job_id, models.Job.status == "queued")
+        .values(status="cancelled", finished_at=now, message="cancelled before it started")
+    ).rowcount
+    if not stopped:
+        session.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, models.Job.status == "running")
+            .values(cancel_requested=True)
+        )
+    session.commit()
+    return get(session, job_id), bool(stopped)
+
+# ============ CLAIMING ============
+
+def claim(job_type: JobType) -> Optional[tuple]:
+    """Mark the oldest due job of this type running, if the type is under its limit
+    and nothing in its exclusive group is running.
+
+    Returns (id, params, attempts, max_attempts) or None. A single UPDATE, so
+    two workers cannot claim the same job; on Postgres an advisory lock per
+    type (per group for exclusive types) also keeps the running counts from racing.
+    """
+    now = datetime.utcnow()
+    due = aliased(models.Job)
+    running = aliased(models.Job)
+    next_id = (
+        select(due.id)
+        .where(due.type == job_type.name, due.status == "queued", due.run_after <= now)
+        .order_by(due.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    running_count = select(func.count()).where(running.type == job_type.name, running.status == "running").scalar_subquery()
+    conditions = [models.Job.id == next_id, running_count < job_type.concurrency]
+    others = exclusive_with(job_type)
+    if others:
+        blocking = aliased(models.Job)
+        conditions.append(~select(blocking.id).where(blocking.type.in_(others), blocking.status == "running").exists())
+    with database.SessionLocal() as session:
+        if session.get_bind().dialect.name == "postgresql":
+            session.execute(text("SELECT pg_advisory_xact_lock(hashtext(:lock))"), {"lock": job_type.exclusive or job_type.name})
+        row = session.execute(
+            update(models.Job)
+            .where(*conditions)
+            .values(status="running", attempts=models.Job.attempts + 1, worker=WORKER_ID,
+                    started_at=now, heartbeat_at=now, message=None)
+            .returning(models.Job.id, models.Job.params, models.Job.attempts, models.Job.max_attempts)
+        ).first()
+        session.commit()
+    return tuple(row) if row is not None else None
+
+def heartbeat(job_ids: list):
+    if not job_ids:
+        return
+    with database.SessionLocal() as session:
+        session.execute(
+            update(models.Job)
+            .where(models.Job.id.in_(job_ids), models.Job.worker == WORKER_ID, models.Job.status == "running")
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        session.commit()
+
+def recover_stale() -> list:
+    """Requeue (or fail, when out of attempts) running jobs whose worker stopped heartbeating.
+
+    Returns (type, params, status) of each recovered job.
+    """
+    now = datetime.utcnow()
+    out_of_attempts = models.Job.attempts >= models.Job.max_attempts
+    with database.SessionLocal() as session:
+        rows = session.execute(
+            update(models.Job)
+            .where(
+                models.Job.status == "running",
+                models.Job.heartbeat_at < now - timedelta(seconds=JOBS_LEASE_SECONDS),
+                # This worker knows its own jobs are alive, even if a heartbeat was held up
+                models.Job.worker != WORKER_ID,
+            )
+            .values(
+                status=case((out_of_attempts, "failed"), else_="queued"),
+                finished_at=case((out_of_attempts, now), else_=None),
+                error="worker stopped responding",
+                worker=None,
+                run_after=now,
+            )
+            .returning(models.Job.type, models.Job.params, models.Job.status)
+        ).all()
+        session.commit()
+    return [tuple(row) for row in rows]
+
+def release():
+    """Put this worker's running jobs back in the queue without using up an attempt (shutdown)"""
+    with database.SessionLocal() as session:
+        session.execute(
+            update(models.Job)
+            .where(models.Job.worker == WORKER_ID, models.Job.status == "running")
+            .values(status="queued", worker=None, attempts=models.Job.attempts - 1, run_after=datetime.utcnow())
+        )
+        session.commit()
+
+def finish(job_id: int, status: str, result=None, error: Optional[str] = None):
+    """Record the outcome of an attempt, unless the job was taken away from this worker meanwhile"""
+    values = {"status": status, "finished_at": datetime.utcnow(), "heartbeat_at": None, "error": error}
+    if status == "succeeded":
+        values.update(progress=1.0, result=json.dumps(result))
+    with database.SessionLocal() as session:
+        session.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, models.Job.worker == WORKER_ID, models.Job.status == "running")
+            .values(**values)
+        )
+        session.commit()
+
+def retry(job_id: int, attempts: int, error: str):
+    delay = JOBS_RETRY_SECONDS * 2 ** (attempts - 1)
+    with database.SessionLocal() as session:
+        session.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, models.Job.worker == WORKER_ID, models.Job.status == "running")
+            .values(status="queued", worker=None, error=error, run_after=datetime.utcnow() + timedelta(seconds=delay),
+                    message=f"attempt {attempts} failed, retrying in {delay:g}s")
+        )
+        session.commit()
+
+# ============ RUNNING ============
+
+class JobContext:
+    """Passed to a handler (in a worker thread or pool process) to report progress"""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.reported_at = 0.0
+
+    def progress(self, fraction: float, message: Optional[str] = None):
+        """Record how far the job is (0..1); raises JobCancelled once cancellation was asked for.
+        
+        Best effort: while SQLite's write lock is held elsewhere (a reseed, or
+        another import's chunk) the write is skipped, but cancellation is
+        still checked with a read.
+        """
+        now = time.monotonic()
+        if now - self.reported_at < JOBS_PROGRESS_SECONDS:
+            return
+        self.reported_at = now
+        engine = progress_engine()
+        try:
+            with engine.begin() as conn:
+                cancel_requested = conn.execute(
+                    update(models.Job)
+                    .where(models.Job.id == self.job_id)
+                    .values(progress=min(1.0, max(0.0, fraction)), message=message, heartbeat_at=datetime.utcnow())
+                    .returning(models.Job.cancel_requested)
+                ).scalar()
+        except exc.OperationalError:
+            try:
+                with engine.connect() as conn:
+                    cancel_requested = conn.execute(
+                        select(models.Job.cancel_requested).where(models.Job.id == self.job_id)
+                    ).scalar()
+            except exc.OperationalError:
+                return
+        if cancel_requested:
+            raise JobCancelled()
+
+progress_engine_ = None
+
+def progress_engine():
+    """database.engine, except on SQLite: a connection that fails at once when the database is locked"""
+    global progress_engine_
+    if progress_engine_ is None:
+        database.init()
+        if database.engine.dialect.name == "sqlite":
+            progress_engine_ = create_engine(
+                database.engine.url,
+                connect_args={"check_same_thread": False, "timeout": 0},
+                poolclass=NullPool,
+            )
+        else:
+            progress_engine_ = database.engine
+    return progress_engine_
+
+def execute(fn: Callable, job_id: int, params: dict):
+    """One attempt of a job, in a worker thread or pool process"""
+    return fn(JobContext(job_id), **params)
+
+threads = None
+processes = None
+
+def executor(job_type: JobType):
+    global threads, processes
+    if not job_type.process:
+        if threads is None:
+            threads = ThreadPoolExecutor(max_workers=JOBS_THREADS, thread_name_prefix="job")
+        return threads
+    if processes is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn, not fork: a forked child would inherit this process's pooled connections
+        processes = ProcessPoolExecutor(max_workers=JOBS_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+    return processes
+
+def has_capacity(job_type: JobType) -> bool:
+    same_pool = [name for name in running.values() if JOB_TYPES[name].process == job_type.process]
+    return len(same_pool) < (JOBS_PROCESSES if job_type.process else JOBS_THREADS)
+
+running = {}  # job id -> type name, for jobs this worker is running
+tasks = set()
+wakeup = None
+
+def notify():
+    """Start looking for work now rather than at the next poll (after an enqueue)"""
+    if wakeup is not None:
+        wakeup.set()
+
+async def run(job_type: JobType, job_id: int, params_json: str, attempts: int, max_attempts: int):
+    global processes
+    params = json.loads(params_json or "{}")
+    finished = True
+    try:
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(executor(job_type), execute, job_type.fn, job_id, params)
+    except JobCancelled:
+        await anyio.to_thread.run_sync(finish, job_id, "cancelled", None, None)
+    except Exception as e:
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        print(f"⚠️  Job {job_id} ({job_type.name}) attempt {attempts} failed: {error}")
+        if type(e).__name__ == "BrokenProcessPool":
+            processes = None
+        if attempts < max_attempts:
+            finished = False
+            await anyio.to_thread.run_sync(retry, job_id, attempts, error)
+        else:
+            await anyio.to_thread.run_sync(finish, job_id, "failed", None, error)
+    else:
+        await anyio.to_thread.run_sync(finish, job_id, "succeeded", result, None)
+        if job_type.after is not None:
+            job_type.after(result)
+    finally:
+        running.pop(job_id, None)
+        notify()
+    if finished and job_type.cleanup is not None:
+        job_type.cleanup(params)
+
+async def work_once():
+    """Heartbeat our jobs, recover abandoned ones, then claim what this worker has room for"""
+    await anyio.to_thread.run_sync(heartbeat, list(running))
+    for name, params_json, status in await anyio.to_thread.run_sync(recover_stale):
+        if status == "failed" and JOB_TYPES.get(name) and JOB_TYPES[name].cleanup:
+            JOB_TYPES[name].cleanup(json.loads(params_json or "{}"))
+    for job_type in JOB_TYPES.values():
+        while has_capacity(job_type):
+            claimed = await anyio.to_thread.run_sync(claim, job_type)
+            if claimed is None:
+                break
+            running[claimed[0]] = job_type.name
+            task = asyncio.create_task(run(job_type, *claimed))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+async def work_forever():
+    global wakeup
+    wakeup = asyncio.Event()
+    while True:
+        wakeup.clear()
+        try:
+            await work_once()
+        except Exception as e:
+            print(f"⚠️  Job worker error: {e}")
+        try:
+            await asyncio.wait_for(wakeup.wait(), JOBS_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+async def shutdown():
+    """Stop running jobs and hand them back to the queue for another worker"""
+    global threads, processes
+    busy = bool(running)
+    for task in tasks:
+        task.cancel()
+    if busy:
+        await anyio.to_thread.run_sync(release)
+        running.clear()
+    for pool in (threads, processes):
+        if pool is not None:
+            # Don't hold up shutdown for a job that is still running; it has been requeued
+            pool.shutdown(wait=not busy, cancel_futures=True)
+    threads = processes = None
@@ -1,11 +1,43 @@
-﻿from fastapi import FastAPI, Depends, HTTPException
+﻿from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import func, select, text, true
+from sqlalchemy.orm import Session, selectinload
+from typing import Iterator, List, Optional
+from contextlib import asynccontextmanager
+import anyio
+import asyncio
+import json
+import os
+import base64
+import binascii
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
 import models
 import database
-from pydantic import BaseModel
-from datetime import datetime
+import cache
+import metrics
+import instrumentation
+import bulk_import
+import search
+import export
+import stats
+import orders
+import seed_data
+import idempotency
+import jobs
+import images
+import geo
+import compression
+import events
+import migrate
+from pydantic import BaseModel, Field, ValidationError
+from datetime import datetime, timezone
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback; same output, slower
+    orjson = None
 
 # Pydantic models
 class ProductBase(BaseModel):
@@ -14,6 +46,19 @@ class ProductBase(BaseModel):
     description: str = ""
     category: str = ""
     stock_quantity: int = 1
+    image_url: Optional[str] = ""
+
+class ProductCreate(ProductBase):
+    store_id: int
+
+class ProductUpdate(BaseModel):
+    """Fields to change; is_active=false takes the product off the listings"""
+    name: Optional[str] = None
+    price: Optional[float] = None
+    description: Optional[str] = None
+    category: Optional[str] = None
+    stock_quantity: Optional[int] = Field(None, ge=0)
+    is_active: Optional[bool] = None
 
 class ProductResponse(ProductBase):
     id: int
@@ -29,20 +74,154 @@ class StoreBase(BaseModel):
     email: str = ""
     phone: str = ""
     address: str = ""
+    # Left out on create, these are geocoded from the address when it names a known place
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
     description: str = ""
     category: str = ""
 
-class StoreResponse(StoreBase):
+class StoreCreate(StoreBase):
+    pass
+
+class StoreSummary(StoreBase):
     id: int
     is_approved: bool
     created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class StoreResponse(StoreSummary):
     products: List[ProductResponse] = []
+
+class ProductPage(BaseModel):
+    items: List[ProductResponse]
+    next_cursor: Optional[str] = None
+
+class StorePage(BaseModel):
+    items: List[StoreResponse]
+    next_cursor: Optional[str] = None
+
+class StoreSummaryPage(BaseModel):
+    items: List[StoreSummary]
+    next_cursor: Optional[str] = None
+
+class StoreNear(StoreSummary):
+    distance_km: float
+
+class StoreNearPage(BaseModel):
+    items: List[StoreNear]
+
+class BulkRowError(BaseModel):
+    row: int
+    errors: List[str]
+
+class BulkImportResponse(BaseModel):
+    store_id: int
+    inserted: int
+    failed: int
+    errors: List[BulkRowError] = []
+
+class AggregateStats(BaseModel):
+    product_count: int
+    min_price: Optional[float] = None
+    avg_price: Optional[float] = None
+    max_price: Optional[float] = None
+    total_stock: int
+    updated_at: Optional[datetime] = None
+
+class StoreStatsResponse(AggregateStats):
+    store_id: int
+    store_name: str
+
+class StoreStatsPage(BaseModel):
+    items: List[StoreStatsResponse]
+    next_cursor: Optional[str] = None
+
+class CategoryStatsResponse(AggregateStats):
+    category: str
+
+class OrderItemCreate(BaseModel):
+    product_id: int
+    quantity: int = Field(1, ge=1)
+
+class OrderCreate(BaseModel):
+    items: List[OrderItemCreate] = Field(..., min_length=1)
+    customer_email: Optional[str] = None
+
+class OrderItemResponse(BaseModel):
+    product_id: int
+    quantity: int
+    unit_price: float
+    
+    class Config:
+        from_attributes = True
+
+class OrderResponse(BaseModel):
+    id: int
+    status: str
+    customer_email: Optional[str] = None
+    total: float
+    expires_at: datetime
+    created_at: datetime
+    items: List[OrderItemResponse] = []
     
     class Config:
         from_attributes = True
 
+class JobResponse(BaseModel):
+    id: int
+    type: str
+    # queued, running, succeeded, failed or cancelled
+    status: str
+    progress: float
+    message: Optional[str] = None
+    params: dict = {}
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    attempts: int
+    max_attempts: int
+    cancel_requested: bool
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+# ============ LIFESPAN ============
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-worker startup and shutdown.
+    
+    Nothing touches the database at import time: engines are built here, and
+    schema changes are a separate step (python migrate.py) unless
+    DB_AUTO_MIGRATE is set.
+    """
+    database.init()
+    # Query count, DB time and serialization time per request
+    for sync_engine, async_engine in [(database.engine, database.async_engine)] + [(r.engine, r.async_engine) for r in database.replicas]:
+        instrumentation.instrument(sync_engine)
+        if async_engine is not None:
+            instrumentation.instrument(async_engine.sync_engine)
+    if migrate.AUTO_MIGRATE:
+        await anyio.to_thread.run_sync(migrate.upgrade)
+    elif await anyio.to_thread.run_sync(migrate.current_revision) is None:
+        print("⚠️  Database schema is not migrated: run `python migrate.py` (or set DB_AUTO_MIGRATE=true)")
+    await start_entity_counts()
+    await start_order_sweeper()
+    await start_replica_checks()
+    if jobs.JOBS_WORKER:
+        background_tasks.add(asyncio.create_task(jobs.work_forever()))
+    background_tasks.update(await events.start())
+    yield
+    await stop_background_tasks()
+    await database.dispose()
+
 # Initialize FastAPI
-app = FastAPI(title="Dundalk Market API", version="2.0.0")
+app = FastAPI(title="Dundalk Market API", version="2.0.0", lifespan=lifespan)
+
+# Replays the stored response for retried POSTs that carry an Idempotency-Key
+# (inside CORS, so replays get fresh CORS headers)
+app.add_middleware(idempotency.IdempotencyMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -51,126 +230,975 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "Idempotent-Replayed"],
 )
 
-# Create tables
-try:
-    models.Base.metadata.create_all(bind=database.engine)
-    print("✅ Database tables created successfully!")
-except Exception as e:
-    print(f"❌ Error creating tables: {e}")
+# GET/HEAD reads go to DATABASE_REPLICA_URLS when set; writes and read-your-writes to the primary
+app.add_middleware(database.ReadRoutingMiddleware)
+
+# gzip/br/zstd for large text responses, per Accept-Encoding (cached listings arrive pre-compressed)
+app.add_middleware(compression.CompressionMiddleware)
+
+# Server-Timing header, request metrics and logs
+app.add_middleware(instrumentation.RequestTimingMiddleware)
+
+# ============ PAGINATION ============
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_NEAR_RADIUS_KM = 100
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+def decode_cursor(cursor: Optional[str]) -> Optional[int]:
+    if cursor is None:
+        return None
+    try:
+        value = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Ids and offsets are never negative, and Postgres rejects a negative OFFSET
+    if value < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+def paginate(query, id_column, cursor: Optional[str], limit: int):
+    """Keyset pagination on the primary key: WHERE id > :cursor ORDER BY id LIMIT n"""
+    after_id = decode_cursor(cursor)
+    if after_id is not None:
+        query = query.filter(id_column > after_id)
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = encode_cursor(getattr(rows[limit - 1], id_column.key)) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def product_filters(store_id: Optional[int], category: Optional[str], min_price: Optional[float], max_price: Optional[float]):
+    criteria = [models.Product.is_active == True]
+    if store_id is not None:
+        criteria.append(models.Product.store_id == store_id)
+    if category:
+        criteria.append(models.Product.category == category)
+    if min_price is not None:
+        criteria.append(models.Product.price >= min_price)
+    if max_price is not None:
+        criteria.append(models.Product.price <= max_price)
+    return criteria
+
+def store_filters(category: Optional[str]):
+    criteria = [models.Store.is_approved == True]
+    if category:
+        criteria.append(models.Store.category == category)
+    return criteria
+
+# ============ RESPONSE CACHE ============
+
+async def cached_response(request: Request, tags: List[str], db: database.SessionRunner, build) -> Response:
+    """Serve the cached JSON body for this route + query, or build and cache it.
+    
+    build(session) returns the serialized body, so hits skip both SQLite and pydantic.
+    A body read from a replica soon after a write may predate that write, so it
+    is served but not cached.
+    """
+    key = cache.cache_key(request.url.path, request.query_params)
+    body = cache.response_cache.get(key)
+    if body is None:
+        generation = cache.response_cache.generation()
+        body = await db.run(build)
+        if db.replica is None or cache.response_cache.seconds_since_invalidation() > database.REPLICA_MAX_LAG_SECONDS:
+            cache.response_cache.set(key, body, tags, generation)
+    return await compressed_response(request, key, body)
+
+async def compressed_response(request: Request, key: str, body: bytes) -> Response:
+    """body in the client's preferred coding, compressed once per cache entry and coding"""
+    coding = compression.negotiate(request.headers.get("accept-encoding"))
+    if coding is None or len(body) < compression.COMPRESSION_MIN_BYTES:
+        # CompressionMiddleware adds Vary to the bodies large enough to compress
+        return Response(content=body, media_type="application/json")
+    encoded = cache.response_cache.get_variant(key, coding)
+    if encoded is None:
+        encoded = await compression.compress(body, coding)
+        cache.response_cache.set_variant(key, body, coding, encoded)
+    return Response(
+        content=encoded,
+        media_type="application/json",
+        headers={"Content-Encoding": coding, "Vary": "Accept-Encoding"},
+    )
+
+def to_json(schema, data) -> bytes:
+    with instrumentation.serializing():
+        return schema.model_validate(data).model_dump_json().encode()
+
+# ============ FAST SERIALIZATION ============
+# List endpoints select plain column tuples in the response schema's field
+# order and dump them with orjson. The rows come straight from our own tables,
+# so re-validating them through pydantic only costs CPU; the schemas still
+# document the responses in OpenAPI.
+
+def schema_columns(schema, model) -> list:
+    """The model column behind each (non-nested) field of schema, in field order"""
+    return [getattr(model, name) for name in schema.model_fields if hasattr(model, name) and name != "products"]
+
+PRODUCT_COLUMNS = schema_columns(ProductResponse, models.Product)
+PRODUCT_FIELDS = [column.key for column in PRODUCT_COLUMNS]
+STORE_COLUMNS = schema_columns(StoreSummary, models.Store)
+STORE_FIELDS = [column.key for column in STORE_COLUMNS]
+
+def records(fields, rows) -> list:
+    return [dict(zip(fields, row)) for row in rows]
+
+def dump_json(payload) -> bytes:
+    with instrumentation.serializing():
+        if orjson is not None:
+            return orjson.dumps(payload)
+        # Match pydantic's output: compact, UTF-8, ISO datetimes
+        return json.dumps(payload, default=datetime.isoformat, separators=(",", ":"), ensure_ascii=False).encode()
+
+def stores_with_products(session: Session, store_rows) -> list:
+    """Store records with their active products, loaded by one IN (...) query like ACTIVE_PRODUCTS"""
+    stores = records(STORE_FIELDS, store_rows)
+    by_id = {}
+    for store in stores:
+        store["products"] = []
+        by_id[store["id"]] = store["products"]
+    if by_id:
+        product_rows = session.execute(
+            select(*PRODUCT_COLUMNS)
+            .where(models.Product.store_id.in_(by_id), models.Product.is_active == True)
+            # Sorting by store first lets (store_id, is_active, id) serve the ORDER BY;
+            # each store's list still comes out in id order
+            .order_by(models.Product.store_id, models.Product.id)
+        )
+        for product in records(PRODUCT_FIELDS, product_rows):
+            by_id[product["store_id"]].append(product)
+    return stores
+
+# ============ CONDITIONAL REQUESTS ============
+
+def entity_rows(model, criteria):
+    """The (id, updated_at) of every row matching criteria; for a single entity and its children"""
+    return select(model.id, model.updated_at).where(*criteria).subquery()
+
+def page_rows(model, criteria, cursor: Optional[str], limit: int):
+    """The (id, updated_at) of the rows paginate() reads for this page, look-ahead row included"""
+    after_id = decode_cursor(cursor)
+    if after_id is not None:
+        criteria = [*criteria, model.id > after_id]
+    return select(model.id, model.updated_at).where(*criteria).order_by(model.id).limit(limit + 1).subquery()
+
+def freshness(session: Session, *sources):
+    """ETag and Last-Modified for the rows in each source (from entity_rows or page_rows).
+    
+    max(updated_at) catches edits, count(*) and sum(id) catch rows leaving or
+    joining. Listings only look at the rows on the page, so the check costs
+    about what reading the page does however large the collection grows. All
+    sources are answered by one SELECT, without loading any rows.
+    """
+    aggregates = [
+        select(func.max(rows.c.updated_at), func.count(), func.sum(rows.c.id)).select_from(rows).subquery()
+        for rows in sources
+    ]
+    # Each aggregate is one row, so joining them on true gives a single row
+    joined = aggregates[0]
+    for aggregate in aggregates[1:]:
+        joined = joined.join(aggregate, true())
+    row = session.execute(select(*[column for aggregate in aggregates for column in aggregate.c]).select_from(joined)).one()
+    etag = '"%s"' % hashlib.sha1(repr(tuple(row)).encode()).hexdigest()[:20]
+    timestamps = [value for value in row[0::3] if value is not None]
+    last_modified = max(timestamps).replace(tzinfo=timezone.utc, microsecond=0) if timestamps else None
+    return etag, last_modified
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match wins over If-Modified-Since when both are sent
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def conditional_response(request: Request, validators, respond) -> Response:
+    """Answer 304 when the client's copy is current, otherwise call respond()"""
+    etag, last_modified = validators
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    response = await respond()
+    if "content-encoding" in response.headers:
+        headers["ETag"] = compression.weak_etag(etag)
+    response.headers.update(headers)
+    return response
+
+# ============ LOADING STRATEGIES ============
+
+# Load a page of stores' active products in one extra SELECT ... WHERE store_id IN (...)
+# instead of one lazy load per store, and keep inactive products out of the response
+ACTIVE_PRODUCTS = selectinload(models.Store.products.and_(models.Product.is_active == True))
+
+# ============ ENTITY COUNTS ============
+
+# /health and /metrics report these from memory; writes bump them in between
+ENTITY_COUNT_REFRESH_SECONDS = float(os.getenv("ENTITY_COUNT_REFRESH_SECONDS", "60"))
+
+def count_entities(session: Session) -> dict:
+    """Row counts per table: planner estimates on Postgres, count(*) elsewhere"""
+    if session.get_bind().dialect.name == "postgresql":
+        rows = session.execute(text(
+            "SELECT relname, reltuples FROM pg_class WHERE relname IN ('stores', 'products')"
+        )).all()
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        estimates = {name: int(estimate) for name, estimate in rows if estimate >= 0}
+        if len(estimates) == 2:
+            return estimates
+    return {
+        "stores": session.scalar(select(func.count()).select_from(models.Store)),
+        "products": session.scalar(select(func.count()).select_from(models.Product)),
+    }
+
+async def refresh_entity_counts():
+    async with asynccontextmanager(database.get_session)() as db:
+        metrics.ENTITY_COUNTS.set(await db.run(count_entities))
+
+async def refresh_entity_counts_forever():
+    while True:
+        await asyncio.sleep(ENTITY_COUNT_REFRESH_SECONDS)
+        try:
+            await refresh_entity_counts()
+        except Exception as e:
+            print(f"⚠️  Entity count refresh failed: {e}")
+
+background_tasks = set()
+
+async def start_entity_counts():
+    try:
+        await refresh_entity_counts()
+    except Exception as e:
+        print(f"⚠️  Entity count refresh failed: {e}")
+    background_tasks.add(asyncio.create_task(refresh_entity_counts_forever()))
+
+async def sweep_expired_orders_forever():
+    while True:
+        await asyncio.sleep(orders.ORDER_SWEEP_SECONDS)
+        try:
+            async with asynccontextmanager(database.get_session)() as db, database.serialized_writes():
+                stock = await db.run(orders.expire_due)
+            if stock:
+                stock_changed(stock)
+        except Exception as e:
+            print(f"⚠️  Order expiry sweep failed: {e}")
+
+async def start_order_sweeper():
+    background_tasks.add(asyncio.create_task(sweep_expired_orders_forever()))
+
+async def check_replicas_forever():
+    while True:
+        await asyncio.sleep(database.REPLICA_HEALTH_SECONDS)
+        try:
+            await anyio.to_thread.run_sync(database.check_replicas)
+        except Exception as e:
+            print(f"⚠️  Replica health check failed: {e}")
+
+async def start_replica_checks():
+    if database.replicas:
+        await anyio.to_thread.run_sync(database.check_replicas)
+        background_tasks.add(asyncio.create_task(check_replicas_forever()))
+
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await jobs.shutdown()
+    images.shutdown()
+    await events.stop()
+
+# ============ STORE ENDPOINTS ============
 
 @app.get("/")
 def root():
     return {
         "message": "🏪 Dundalk Market API v2.0",
         "database": "SQLite (development)",
-        "endpoints": ["/health", "/stores", "/products", "/seed (POST)"]
+        "endpoints": ["/health", "/stores", "/stores/summary", "/stores/near?lat=&lon=&radius=", "/products", "/search?q=", "/products/{id} (PATCH)", "/products/{id}/image (PUT)", "/stores/{id}/approve (POST)", "/orders (POST)", "/stats/stores", "/stats/categories", "/export/products", "/export/stores", "/metrics", "/metrics/pool", "/seed (POST)", "/jobs/{id}", "/events (SSE)", "/events/ws"]
     }
 
 @app.get("/health")
-def health_check(db: Session = Depends(database.get_db)):
-    store_count = db.query(models.Store).count()
-    product_count = db.query(models.Product).count()
+async def health_check(db: database.SessionRunner = Depends(database.get_session)):
+    """Liveness: one SELECT 1; the counts come from memory, not a table scan"""
+    await db.run(lambda session: session.execute(text("SELECT 1")))
     return {
         "status": "healthy",
         "database": "connected",
-        "stores": store_count,
-        "products": product_count
+        "stores": metrics.ENTITY_COUNTS.get("stores"),
+        "products": metrics.ENTITY_COUNTS.get("products"),
+        "cache": cache.response_cache.stats()
     }
 
-@app.get("/stores", response_model=List[StoreResponse])
-def get_stores(db: Session = Depends(database.get_db)):
-    stores = db.query(models.Store).filter(models.Store.is_approved == True).all()
-    return stores
+def pool_statuses() -> dict:
+    pools = {"sync": database.pool_status(database.engine)}
+    if database.async_engine is not None:
+        pools["async"] = database.pool_status(database.async_engine.sync_engine)
+    for replica in database.replicas:
+        pools[f"{replica.name}-sync"] = database.pool_status(replica.engine)
+        if replica.async_engine is not None:
+            pools[f"{replica.name}-async"] = database.pool_status(replica.async_engine.sync_engine)
+    return pools
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Request, pool, cache and entity metrics in the Prometheus text format"""
+    return PlainTextResponse(
+        metrics.render(pool_statuses(), cache.response_cache.stats(), [replica.status() for replica in database.replicas], events.hub.stats()),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/metrics/pool")
+def pool_metrics():
+    """Live connection pool state and checkout wait times"""
+    return {
+        "pools": pool_statuses(),
+        "wait_seconds": metrics.POOL_WAIT_SECONDS.snapshot(),
+        "timeouts": metrics.POOL_TIMEOUTS.value,
+        "replicas": [replica.status() for replica in database.replicas]
+    }
+
+@app.get("/stores", response_model=StorePage)
+async def get_stores(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    criteria = store_filters(category)
+    def build(session):
+        query = session.query(*STORE_COLUMNS).filter(*criteria)
+        stores, next_cursor = paginate(query, models.Store.id, cursor, limit)
+        return dump_json({"items": stores_with_products(session, stores), "next_cursor": next_cursor})
+    # Nested products are part of the payload, so the page's stores' products feed the validator too
+    stores_page = page_rows(models.Store, criteria, cursor, limit)
+    nested = entity_rows(models.Product, [models.Product.store_id.in_(select(stores_page.c.id)), models.Product.is_active == True])
+    validators = await db.run(freshness, stores_page, nested)
+    return await conditional_response(request, validators, lambda: cached_response(request, [cache.LISTINGS], db, build))
+
+@app.get("/stores/summary", response_model=StoreSummaryPage)
+async def get_store_summaries(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    """Store listing without nested products - a single SELECT per page"""
+    criteria = store_filters(category)
+    def build(session):
+        query = session.query(*STORE_COLUMNS).filter(*criteria)
+        stores, next_cursor = paginate(query, models.Store.id, cursor, limit)
+        return dump_json({"items": records(STORE_FIELDS, stores), "next_cursor": next_cursor})
+    validators = await db.run(freshness, page_rows(models.Store, criteria, cursor, limit))
+    return await conditional_response(request, validators, lambda: cached_response(request, [cache.LISTINGS], db, build))
+
+@app.get("/stores/near", response_model=StoreNearPage)
+async def get_stores_near(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(5.0, gt=0, le=MAX_NEAR_RADIUS_KM, description="kilometres"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    """Approved stores within radius km of (lat, lon), nearest first, via the spatial index"""
+    def build(session):
+        found = geo.near(session, STORE_COLUMNS, lat, lon, radius, limit)
+        items = [{**dict(zip(STORE_FIELDS, row)), "distance_km": round(distance, 3)} for distance, row in found]
+        return dump_json({"items": items})
+    return await cached_response(request, [cache.LISTINGS], db, build)
 
 @app.get("/stores/{store_id}", response_model=StoreResponse)
-def get_store(store_id: int, db: Session = Depends(database.get_db)):
-    store = db.query(models.Store).filter(models.Store.id == store_id).first()
-    if not store:
-        raise HTTPException(status_code=404, detail="Store not found")
+async def get_store(store_id: int, request: Request, db: database.SessionRunner = Depends(database.get_session)):
+    def build(session):
+        store = session.query(models.Store).options(ACTIVE_PRODUCTS).filter(models.Store.id == store_id).first()
+        if not store:
+            raise HTTPException(status_code=404, detail="Store not found")
+        return to_json(StoreResponse, store)
+    validators = await db.run(
+        freshness,
+        entity_rows(models.Store, [models.Store.id == store_id]),
+        entity_rows(models.Product, [models.Product.store_id == store_id])
+    )
+    return await conditional_response(request, validators, lambda: cached_response(request, [cache.store_tag(store_id)], db, build))
+
+@app.post("/stores", response_model=StoreResponse)
+async def create_store(store: StoreCreate, db: database.SessionRunner = Depends(database.get_session)):
+    def insert(session):
+        # Check if email already exists
+        existing_store = session.query(models.Store).filter(models.Store.email == store.email).first()
+        if existing_store:
+            raise HTTPException(status_code=400, detail="Email already registered")
+        
+        db_store = models.Store(**store.dict())
+        if db_store.latitude is None and db_store.longitude is None:
+            db_store.latitude, db_store.longitude = geo.geocode(store.address) or (None, None)
+        session.add(db_store)
+        session.commit()
+        session.refresh(db_store)
+        # Serialize while the session can still lazy-load
+        return StoreResponse.model_validate(db_store)
+    created = await db.run(insert)
+    cache.response_cache.invalidate(cache.LISTINGS)
+    metrics.ENTITY_COUNTS.add("stores")
+    return created
+
+@app.post("/stores/{store_id}/approve", response_model=StoreSummary)
+async def approve_store(store_id: int, db: database.SessionRunner = Depends(database.get_session)):
+    """Put a store on the public listings (idempotent)"""
+    def approve(session):
+        store = session.get(models.Store, store_id)
+        if store is None:
+            raise HTTPException(status_code=404, detail="Store not found")
+        approved = not store.is_approved
+        store.is_approved = True
+        session.commit()
+        session.refresh(store)
+        return StoreSummary.model_validate(store), approved
+    store, approved = await db.run(approve)
+    if approved:
+        cache.response_cache.invalidate(cache.LISTINGS, cache.store_tag(store_id))
+        events.publish("store.approved", store_id=store.id, name=store.name, category=store.category)
     return store
 
-@app.post("/seed")
-def seed_database(db: Session = Depends(database.get_db)):
-    """Seed the database with sample Dundalk data"""
-    
-    # Clear existing data
-    db.query(models.Product).delete()
-    db.query(models.Store).delete()
-    db.commit()
-    
-    # Create sample stores
-    stores_data = [
-        {
-            "name": "DPL Engineering",
-            "owner_name": "John Smith",
-            "email": "dpl@example.com",
-            "phone": "042 123 4567",
-            "address": "Dundalk Industrial Estate, Dundalk, Co. Louth",
-            "description": "Precision engineering and industrial supplies for over 20 years",
-            "category": "Industrial",
-            "is_approved": True
-        },
-        {
-            "name": "Dundalk Bookshop",
-            "owner_name": "Mary O'Connor",
-            "email": "bookshop@example.com",
-            "phone": "042 987 6543",
-            "address": "Market Square, Dundalk, Co. Louth",
-            "description": "Independent bookshop specializing in local authors and history",
-            "category": "Retail",
-            "is_approved": True
-        },
-        {
-            "name": "The Square Bakery",
-            "owner_name": "Peter Brown",
-            "email": "bakery@example.com",
-            "phone": "042 555 1234",
-            "address": "The Square, Dundalk, Co. Louth",
-            "description": "Artisan bakery using traditional methods and local ingredients",
-            "category": "Food",
-            "is_approved": True
-        }
-    ]
+# ============ PRODUCT ENDPOINTS ============
+
+@app.get("/products", response_model=ProductPage)
+async def get_products(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    store_id: Optional[int] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    criteria = product_filters(store_id, category, min_price, max_price)
+    def build(session):
+        query = session.query(*PRODUCT_COLUMNS).filter(*criteria)
+        products, next_cursor = paginate(query, models.Product.id, cursor, limit)
+        return dump_json({"items": records(PRODUCT_FIELDS, products), "next_cursor": next_cursor})
+    validators = await db.run(freshness, page_rows(models.Product, criteria, cursor, limit))
+    return await conditional_response(request, validators, lambda: cached_response(request, [cache.LISTINGS], db, build))
+
+@app.get("/stores/{store_id}/products", response_model=ProductPage)
+async def get_store_products(
+    store_id: int,
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    criteria = product_filters(store_id, category, min_price, max_price)
+    def build(session):
+        query = session.query(*PRODUCT_COLUMNS).filter(*criteria)
+        products, next_cursor = paginate(query, models.Product.id, cursor, limit)
+        return dump_json({"items": records(PRODUCT_FIELDS, products), "next_cursor": next_cursor})
+    validators = await db.run(freshness, page_rows(models.Product, criteria, cursor, limit))
+    return await conditional_response(request, validators, lambda: cached_response(request, [cache.store_tag(store_id)], db, build))
+
+@app.post("/products", response_model=ProductResponse)
+async def create_product(product: ProductCreate, db: database.SessionRunner = Depends(database.get_session)):
+    def insert(session):
+        # Check if store exists
+        store = session.query(models.Store).filter(models.Store.id == product.store_id).first()
+        if not store:
+            raise HTTPException(status_code=404, detail="Store not found")
+        
+        db_product = models.Product(**product.dict())
+        session.add(db_product)
+        session.commit()
+        session.refresh(db_product)
+        return ProductResponse.model_validate(db_product)
+    created = await db.run(insert)
+    cache.response_cache.invalidate(cache.LISTINGS, cache.store_tag(product.store_id))
+    metrics.ENTITY_COUNTS.add("products")
+    events.publish(
+        "product.created", product_id=created.id, store_id=created.store_id, name=created.name,
+        price=created.price, category=created.category, stock_quantity=created.stock_quantity,
+    )
+    return created
+
+@app.patch("/products/{product_id}", response_model=ProductResponse)
+async def update_product(product_id: int, changes: ProductUpdate, db: database.SessionRunner = Depends(database.get_session)):
+    """Change a product's details, stock or active flag; pushes the delta to /events"""
+    fields = changes.model_dump(exclude_unset=True)
+    def apply(session):
+        product = session.get(models.Product, product_id)
+        if product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        changed = {name: value for name, value in fields.items() if getattr(product, name) != value}
+        for name, value in changed.items():
+            setattr(product, name, value)
+        session.commit()
+        session.refresh(product)
+        return ProductResponse.model_validate(product), changed
+    updated, changed = await db.run(apply)
+    if changed:
+        cache.response_cache.invalidate(cache.LISTINGS, cache.store_tag(updated.store_id))
+        product_changed(updated, changed)
+    return updated
+
+def product_changed(product: ProductResponse, changed: dict):
+    """The smallest event that describes the change"""
+    if changed.get("is_active") is False:
+        events.publish("product.deactivated", product_id=product.id, store_id=product.store_id)
+    elif changed.keys() == {"stock_quantity"}:
+        events.publish("product.stock", product_id=product.id, store_id=product.store_id, stock_quantity=product.stock_quantity)
+    else:
+        events.publish("product.updated", product_id=product.id, store_id=product.store_id, **changed)
+
+@app.post("/stores/{store_id}/products/bulk", response_model=BulkImportResponse)
+async def bulk_create_products(
+    store_id: int,
+    request: Request,
+    import_format: Optional[str] = Query(None, alias="format", description="ndjson or csv; defaults to the Content-Type"),
+    background: bool = Query(False, description="spool the body and import it as a job; answers 202 with the job"),
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    """Import a store's inventory from an NDJSON or CSV body.
     
-    stores = []
-    for store_data in stores_data:
-        db_store = models.Store(**store_data)
-        db.add(db_store)
-        db.commit()
-        db.refresh(db_store)
-        stores.append(db_store)
-    
-    # Create sample products
-    products_data = [
-        {"store_id": stores[0].id, "name": "Steel Bolts (Pack of 50)", "price": 24.99, "description": "High-quality steel bolts", "category": "Hardware"},
-        {"store_id": stores[0].id, "name": "Aluminum Brackets", "price": 15.50, "description": "Lightweight aluminum brackets", "category": "Hardware"},
-        {"store_id": stores[0].id, "name": "Custom CNC Machining", "price": 199.99, "description": "Custom machining services", "category": "Services"},
-        {"store_id": stores[1].id, "name": "Local History of Dundalk", "price": 19.99, "description": "Comprehensive history of Dundalk", "category": "Books"},
-        {"store_id": stores[1].id, "name": "Irish Poetry Collection", "price": 12.99, "description": "Collection of Irish poetry", "category": "Books"},
-        {"store_id": stores[1].id, "name": "Gift Card €20", "price": 20.00, "description": "€20 gift card for the bookshop", "category": "Gifts"},
-        {"store_id": stores[2].id, "name": "Sourdough Loaf", "price": 4.50, "description": "Traditional sourdough bread", "category": "Bread"},
-        {"store_id": stores[2].id, "name": "Danish Pastries (Pack of 4)", "price": 8.99, "description": "Fresh danish pastries", "category": "Pastries"},
-        {"store_id": stores[2].id, "name": "Coffee Beans (250g)", "price": 12.99, "description": "Premium coffee beans", "category": "Drinks"},
-    ]
+    The body is spooled to disk first, so a slow upload holds no database
+    lock. Rows are then validated against ProductCreate; invalid rows are
+    reported and skipped, and the valid ones are inserted in chunked
+    executemany batches, each committed on its own under the write lock, so
+    memory stays at one chunk whatever the upload size. A failure part way
+    keeps the batches already committed. With background=true the same import
+    runs as a job (poll GET /jobs/{id}; the result is this response).
+    """
+    fmt = bulk_import.detect_format(request.headers.get("content-type", ""), import_format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send NDJSON (application/x-ndjson) or CSV (text/csv)")
+    
+    def store_exists(session):
+        return session.query(models.Store.id).filter(models.Store.id == store_id).first() is not None
+    if not await db.run(store_exists):
+        raise HTTPException(status_code=404, detail="Store not found")
+    
+    path = await bulk_import.spool(request.stream())
+    if background:
+        job = await db.run(jobs.enqueue, "import", {"store_id": store_id, "path": path, "fmt": fmt})
+        return job_accepted(job)
+    
+    report = ImportReport(store_id)
+    inserted = 0
+    try:
+        with open(path, "rb") as f:
+            rows = report.valid_rows(bulk_import.read_records(f, fmt))
+            # Parsing and validating happen in a worker thread, outside the write lock
+            while chunk := await anyio.to_thread.run_sync(bulk_import.next_chunk, rows):
+                async with database.serialized_writes():
+                    await db.run(bulk_import.insert_chunk, models.Product, chunk)
+                inserted += len(chunk)
+    finally:
+        bulk_import.remove_spooled(path)
+        # Committed batches stay even if a later one failed: drop what they made stale
+        result = report.result(inserted)
+        imported(result)
+    return result
+
+class ImportReport:
+    """Validates bulk import rows against ProductCreate, counting the failures and keeping their errors"""
     
-    for product_data in products_data:
-        db_product = models.Product(**product_data)
-        db.add(db_product)
+    def __init__(self, store_id: int):
+        self.store_id = store_id
+        self.errors = []
+        self.failed = 0
     
-    db.commit()
+    def validate(self, row_number: int, record: Optional[dict], error: Optional[str]) -> Optional[dict]:
+        """The row ready to insert, or None after recording why it was rejected"""
+        if error is None:
+            try:
+                # The path decides the store, whatever the row says
+                return ProductCreate.model_validate({**record, "store_id": self.store_id}).model_dump()
+            except ValidationError as e:
+                messages = [f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()]
+        else:
+            messages = [error]
+        self.failed += 1
+        if len(self.errors) < bulk_import.MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "errors": messages})
+        return None
     
+    def valid_rows(self, records: Iterator[tuple]) -> Iterator[dict]:
+        for row_number, record, error in records:
+            row = self.validate(row_number, record, error)
+            if row is not None:
+                yield row
+    
+    def result(self, inserted: int) -> dict:
+        return {"store_id": self.store_id, "inserted": inserted, "failed": self.failed, "errors": self.errors}
+
+def imported(result: dict):
+    if result["inserted"]:
+        cache.response_cache.invalidate(cache.LISTINGS, cache.store_tag(result["store_id"]))
+        metrics.ENTITY_COUNTS.add("products", result["inserted"])
+        # Too many rows for one event each: clients re-fetch the store's products
+        events.publish("products.imported", store_id=result["store_id"], count=result["inserted"])
+
+def import_products_job(ctx, store_id: int, path: str, fmt: str) -> dict:
+    """jobs handler for background bulk imports: validate the spooled body and insert it chunk by chunk"""
+    report = ImportReport(store_id)
+    size = max(1, os.path.getsize(path))
+    with open(path, "rb") as f, database.SessionLocal() as session:
+        inserted = bulk_import.insert_in_chunks(
+            session, models.Product, report.valid_rows(bulk_import.read_records(f, fmt)),
+            on_chunk=lambda done: ctx.progress(f.tell() / size, f"inserted {done:,} rows"),
+        )
+    return report.result(inserted)
+
+# ============ IMAGES ============
+
+@app.put("/products/{product_id}/image")
+async def upload_product_image(product_id: int, request: Request, db: database.SessionRunner = Depends(database.get_session)):
+    """Store the raw request body as the product's image and point image_url at its listing thumbnail.
+    
+    Send the image bytes as the body (any image/* Content-Type). Identical
+    images are stored once; thumbnails are rendered in the background.
+    """
+    def product_store(session):
+        return session.query(models.Product.store_id).filter(models.Product.id == product_id).scalar()
+    store_id = await db.run(product_store)
+    if store_id is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    digest, ext, created = await images.save_upload(request.stream())
+    source = images.original_path(digest, ext)
+    thumbnails = images.generate_thumbnails(digest, source)
+    image_url = images.thumbnail_url(digest, images.LISTING_SIZE) if thumbnails is not None else images.original_url(digest, ext)
+    
+    def set_image(session):
+        product = session.get(models.Product, product_id)
+        if product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        product.image_url = image_url
+        session.commit()
+    await db.run(set_image)
+    cache.response_cache.invalidate(cache.LISTINGS, cache.store_tag(store_id))
+    events.publish("product.updated", product_id=product_id, store_id=store_id, image_url=image_url)
     return {
-        "message": "Database seeded successfully",
-        "stores_created": len(stores),
-        "products_created": len(products_data)
+        "product_id": product_id,
+        "digest": digest,
+        "deduplicated": not created,
+        "image_url": image_url,
+        "original": images.original_url(digest, ext),
+        "thumbnails": {size: images.thumbnail_url(digest, size) for size in images.THUMBNAIL_SIZES} if thumbnails is not None else {},
     }
 
-@app.get("/products", response_model=List[ProductResponse])
-def get_products(db: Session = Depends(database.get_db)):
-    products = db.query(models.Product).filter(models.Product.is_active == True).all()
-    return products
+def image_response(path: str, immutable: bool = True) -> FileResponse:
+    """A file response (sendfile/pathsend where the server supports it) that browsers and CDNs keep for a year"""
+    ext = path.rsplit(".", 1)[-1]
+    cache_control = images.IMMUTABLE if immutable else "public, max-age=300"
+    return FileResponse(path, media_type=images.MEDIA_TYPES[ext], headers={"Cache-Control": cache_control})
+
+@app.get("/images/{size:int}/{digest}.webp")
+async def get_thumbnail(size: int, digest: str):
+    path = await images.thumbnail(digest, size)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # A fallback to the original must not be cached forever under the thumbnail URL
+    return image_response(path, immutable=path == images.thumbnail_path(digest, size))
+
+@app.get("/images/{digest}.{ext}")
+async def get_original(digest: str, ext: str):
+    path = images.find_original(digest)
+    if path is None or not path.endswith(f".{ext}"):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return image_response(path)
+
+# ============ SEARCH ============
+
+@app.get("/search", response_model=ProductPage)
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    """Ranked full-text search over product name, description, category and store name.
+    
+    Every word must match; the last one also matches as a prefix ("sour" finds
+    "Sourdough"). Results are relevance-ordered, so the cursor is an offset.
+    """
+    def build(session):
+        offset = decode_cursor(cursor) or 0
+        products = search.search_products(session, q, limit + 1, offset)
+        next_cursor = encode_cursor(offset + limit) if len(products) > limit else None
+        return to_json(ProductPage, {"items": products[:limit], "next_cursor": next_cursor})
+    return await cached_response(request, [cache.LISTINGS], db, build)
+
+# ============ ORDERS ============
+
+def stock_changed(stock: dict):
+    """Drop the listings of the stores touched and push each product's new stock level"""
+    cache.response_cache.invalidate(cache.LISTINGS, *{cache.store_tag(store_id) for store_id, _ in stock.values()})
+    for product_id, (store_id, quantity) in stock.items():
+        events.publish("product.stock", product_id=product_id, store_id=store_id, stock_quantity=quantity)
+
+@app.post("/orders", response_model=OrderResponse, status_code=201)
+async def create_order(order: OrderCreate, db: database.SessionRunner = Depends(database.get_session)):
+    """Reserve stock for every line atomically; 404 for an unknown product, 409 if any is inactive or short"""
+    def place(session):
+        lines = [(item.product_id, item.quantity) for item in order.items]
+        placed, stock = orders.place(session, lines, order.customer_email)
+        return OrderResponse.model_validate(placed), stock
+    async with database.serialized_writes():
+        created, stock = await db.run(place)
+    stock_changed(stock)
+    return created
+
+@app.get("/orders/{order_id}", response_model=OrderResponse)
+async def get_order(order_id: int, db: database.SessionRunner = Depends(database.get_session)):
+    return await db.run(lambda session: OrderResponse.model_validate(orders.get(session, order_id)))
+
+@app.post("/orders/{order_id}/confirm", response_model=OrderResponse)
+async def confirm_order(order_id: int, db: database.SessionRunner = Depends(database.get_session)):
+    """Keep the reserved stock for good, e.g. after payment; 409 once the reservation has lapsed"""
+    async with database.serialized_writes():
+        return await db.run(lambda session: OrderResponse.model_validate(orders.confirm(session, order_id)))
+
+@app.post("/orders/{order_id}/cancel", response_model=OrderResponse)
+async def cancel_order(order_id: int, db: database.SessionRunner = Depends(database.get_session)):
+    """Release a reservation's stock"""
+    def cancel(session):
+        cancelled, stock = orders.cancel(session, order_id)
+        return OrderResponse.model_validate(cancelled), stock
+    async with database.serialized_writes():
+        cancelled, stock = await db.run(cancel)
+    stock_changed(stock)
+    return cancelled
+
+# ============ STATS ============
+
+AGGREGATE_COLUMNS = ["product_count", "price_sum", "min_price", "max_price", "total_stock", "updated_at"]
+
+def aggregate_records(key_fields, rows) -> list:
+    """Rows of (*keys, *AGGREGATE_COLUMNS) as response records with the average price"""
+    items = []
+    for row in rows:
+        item = dict(zip(key_fields, row))
+        count, price_sum, min_price, max_price, total_stock, updated_at = row[len(key_fields):]
+        item.update(
+            product_count=count,
+            min_price=min_price,
+            avg_price=round(price_sum / count, 2) if count else None,
+            max_price=max_price,
+            total_stock=total_stock,
+            updated_at=updated_at,
+        )
+        items.append(item)
+    return items
+
+@app.get("/stats/stores", response_model=StoreStatsPage)
+async def get_store_stats(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    """Product count, price range and stock per approved store, read from store_stats"""
+    def build(session):
+        query = (
+            session.query(
+                models.StoreStats.store_id,
+                models.Store.name,
+                *(getattr(models.StoreStats, name) for name in AGGREGATE_COLUMNS)
+            )
+            .join(models.Store, models.Store.id == models.StoreStats.store_id)
+            .filter(models.Store.is_approved == True)
+        )
+        rows, next_cursor = paginate(query, models.StoreStats.store_id, cursor, limit)
+        return dump_json({"items": aggregate_records(["store_id", "store_name"], rows), "next_cursor": next_cursor})
+    return await cached_response(request, [cache.LISTINGS], db, build)
+
+@app.get("/stats/categories", response_model=List[CategoryStatsResponse])
+async def get_category_stats(request: Request, db: database.SessionRunner = Depends(database.get_session)):
+    """Product count, price range and stock per product category, read from category_stats"""
+    def build(session):
+        rows = session.query(
+            models.CategoryStats.category,
+            *(getattr(models.CategoryStats, name) for name in AGGREGATE_COLUMNS)
+        ).order_by(models.CategoryStats.category)
+        return dump_json(aggregate_records(["category"], rows))
+    return await cached_response(request, [cache.LISTINGS], db, build)
+
+@app.post("/stats/rebuild", response_model=JobResponse, status_code=202)
+async def rebuild_stats(db: database.SessionRunner = Depends(database.get_session)):
+    """Queue a recompute of the aggregate tables from products (they are normally maintained by triggers)"""
+    return job_accepted(await db.run(jobs.enqueue, "stats.rebuild", {}))
+
+# ============ EXPORT ============
+
+def export_response(request: Request, name: str, statement, fields: List[str], fmt: str, gzip: Optional[bool]):
+    """Stream statement's rows as NDJSON or CSV, gzipped when asked for or accepted"""
+    chunks = export.stream_rows(database.read_engine(), statement, fields, fmt)
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{fmt}"', "Vary": "Accept-Encoding"}
+    if gzip is None:
+        gzip = export.accepts_gzip(request.headers.get("accept-encoding", ""))
+    if gzip:
+        chunks = export.gzipped(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=export.MEDIA_TYPES[fmt], headers=headers)
+
+@app.get("/export/products")
+async def export_products(
+    request: Request,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    gzip: Optional[bool] = Query(None, description="Defaults to the Accept-Encoding header"),
+):
+    """Every active product, streamed with flat memory"""
+    statement = select(*PRODUCT_COLUMNS).where(models.Product.is_active == True).order_by(models.Product.id)
+    return export_response(request, "products", statement, PRODUCT_FIELDS, export_format, gzip)
+
+@app.get("/export/stores")
+async def export_stores(
+    request: Request,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    gzip: Optional[bool] = Query(None, description="Defaults to the Accept-Encoding header"),
+):
+    """Every approved store, streamed with flat memory"""
+    statement = select(*STORE_COLUMNS).where(models.Store.is_approved == True).order_by(models.Store.id)
+    return export_response(request, "stores", statement, STORE_FIELDS, export_format, gzip)
+
+# ============ CHANGE FEED ============
+
+def feed_full() -> bool:
+    return len(events.hub.subscribers) >= events.EVENTS_MAX_CLIENTS
+
+@app.get("/events")
+async def event_stream(
+    request: Request,
+    last_event_id: Optional[str] = Query(None, description="resume after this event id; the Last-Event-ID header wins"),
+):
+    """Server-Sent Events: one JSON object per catalogue change, pushed as it commits.
+    
+    EventSource reconnects by itself with Last-Event-ID, so nothing is missed
+    across drops; a "reset" event means the gap was too long and the client
+    should re-fetch. See events.py for the event types.
+    """
+    if feed_full():
+        raise HTTPException(status_code=503, detail="Too many event subscribers", headers={"Retry-After": "5"})
+    return events.EventStream(
+        request.headers.get("last-event-id") or last_event_id,
+        # no-transform keeps proxies (and CompressionMiddleware) from buffering the stream
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/events/ws")
+async def event_socket(websocket: WebSocket, last_event_id: Optional[str] = None):
+    """The GET /events feed over a WebSocket, one JSON text message per event"""
+    if feed_full():
+        await websocket.close(code=1013)
+        return
+    await websocket.accept()
+    await events.websocket_feed(websocket, last_event_id)
+
+# ============ SEED DATA ENDPOINT (for development) ============
+
+@app.post("/seed", response_model=JobResponse, status_code=202)
+async def seed_database(
+    stores: Optional[int] = Query(None, ge=1, le=100_000),
+    products: Optional[int] = Query(None, ge=0, le=5_000_000),
+    seed: int = 42,
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    """Queue a reseed with sample Dundalk data, or a synthetic catalogue of the given size.
+    
+    Poll GET /jobs/{id}; the finished job's result has the row counts.
+    """
+    params = {} if stores is None and products is None else {"stores": stores, "products": products, "seed": seed}
+    return job_accepted(await db.run(jobs.enqueue, "seed", params))
+
+# ============ JOBS ============
+
+def seeded(result: dict):
+    cache.response_cache.clear()
+    metrics.ENTITY_COUNTS.set({"stores": result["stores_created"], "products": result["products_created"]})
+    events.publish("catalogue.reset", stores=result["stores_created"], products=result["products_created"])
+
+def stats_rebuilt(counts: dict):
+    cache.response_cache.invalidate(cache.LISTINGS)
+    events.publish("stats.rebuilt", **counts)
+
+def apply_shared_change(change: dict):
+    """Drop what a write on any worker made stale here (events from the EVENTS_REDIS_URL stream).
+
+    The worker that made the write has already done this; doing it twice is harmless.
+    """
+    if change["type"] == "catalogue.reset":
+        cache.response_cache.clear()
+        metrics.ENTITY_COUNTS.set({"stores": change["stores"], "products": change["products"]})
+    elif "store_id" in change:
+        cache.response_cache.invalidate(cache.LISTINGS, cache.store_tag(change["store_id"]))
+    else:
+        cache.response_cache.invalidate(cache.LISTINGS)
+
+events.stream_listeners.append(apply_shared_change)
+
+# Reseeds and rebuilds rewrite whole tables, so one at a time across all workers
+jobs.register("seed", seed_data.seed_job, process=True, after=seeded, exclusive="catalogue")
+jobs.register("stats.rebuild", stats.rebuild_job, after=stats_rebuilt, exclusive="catalogue")
+jobs.register(
+    "import", import_products_job,
+    concurrency=int(os.getenv("JOBS_IMPORT_CONCURRENCY", "2")),
+    after=imported,
+    cleanup=lambda params: bulk_import.remove_spooled(params["path"]),
+)
+
+def job_accepted(job: dict) -> Response:
+    jobs.notify()
+    return Response(
+        content=to_json(JobResponse, job),
+        status_code=202,
+        media_type="application/json",
+        headers={"Location": f"/jobs/{job['id']}"},
+    )
+
+@app.get("/jobs", response_model=List[JobResponse])
+async def list_jobs(
+    job_type: Optional[str] = Query(None, alias="type"),
+    status: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: database.SessionRunner = Depends(database.get_session)
+):
+    """Most recent jobs first"""
+    return await db.run(jobs.recent, limit, job_type, status)
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: int, db: database.SessionRunner = Depends(database.get_session)):
+    job = await db.run(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel", response_model=JobResponse)
+async def cancel_job(job_id: int, db: database.SessionRunner = Depends(database.get_session)):
+    """Cancel a queued job now, or ask a running one to stop at its next progress report"""
+    job, stopped = await db.run(jobs.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] in jobs.FINISHED and not stopped:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    if stopped and jobs.JOB_TYPES[job["type"]].cleanup is not None:
+        jobs.JOB_TYPES[job["type"]].cleanup(job["params"])
+    return job
 
 if __name__ == "__main__":
     import uvicorn
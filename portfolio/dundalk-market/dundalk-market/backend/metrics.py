@@ -0,0 +1,233 @@
+import bisect
+import threading
+
+class Histogram:
+    """Cumulative bucket histogram in the Prometheus style (le = upper bound)"""
+
+    def __init__(self, buckets):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets + ["+Inf"], counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "count": running, "sum": round(total, 6)}
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+# ============ CONNECTION POOL ============
+
+# Time spent waiting for a pooled connection, in seconds
+POOL_WAIT_SECONDS = Histogram([0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30])
+POOL_TIMEOUTS = Counter()
+
+class Family:
+    """One child metric per tuple of label values, created on first use"""
+
+    def __init__(self, label_names, factory):
+        self.label_names = label_names
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._factory())
+        return child
+
+    def items(self):
+        with self._lock:
+            return list(self._children.items())
+
+class EntityCounts:
+    """Row counts served from memory: refreshed in the background, bumped by writes in between"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, values: dict):
+        with self._lock:
+            self._values = dict(values)
+
+    def add(self, name: str, amount: int = 1):
+        with self._lock:
+            if name in self._values:
+                self._values[name] += amount
+
+    def get(self, name: str):
+        return self._values.get(name)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+# ============ REQUESTS ============
+
+REQUEST_SECONDS = Family(("method", "route"), lambda: Histogram([0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]))
+REQUESTS = Family(("method", "route", "status"), Counter)
+REQUEST_ERRORS = Family(("method", "route"), Counter)
+ENTITY_COUNTS = EntityCounts()
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    REQUEST_SECONDS.labels(method, route).observe(seconds)
+    REQUESTS.labels(method, route, str(status)).inc()
+    if status >= 500:
+        REQUEST_ERRORS.labels(method, route).inc()
+
+# ============ COMPRESSION ============
+
+# Bytes in and out of each codec; cached variants are only counted when built
+COMPRESSION_INPUT_BYTES = Family(("coding",), Counter)
+COMPRESSION_OUTPUT_BYTES = Family(("coding",), Counter)
+
+def observe_compression(coding: str, input_bytes: int, output_bytes: int):
+    COMPRESSION_INPUT_BYTES.labels(coding).inc(input_bytes)
+    COMPRESSION_OUTPUT_BYTES.labels(coding).inc(output_bytes)
+
+# ============ PROMETHEUS TEXT FORMAT ============
+
+def label_text(names, values) -> str:
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def render_histogram(lines, name, names, values, snapshot):
+    for bound, count in snapshot["buckets"].items():
+        lines.append(f"{name}_bucket{label_text(names + ('le',), values + (bound,))} {count}")
+    lines.append(f"{name}_sum{label_text(names, values)} {snapshot['sum']}")
+    lines.append(f"{name}_count{label_text(names, values)} {snapshot['count']}")
+
+def render(pools: dict, cache_stats: dict, replicas: list = (), feed: dict = None) -> str:
+    """Everything above in the Prometheus text exposition format.
+    
+    pools maps a pool name to database.pool_status(); cache_stats is
+    ResponseCache.stats(); replicas are database.Replica.status() dicts;
+    feed is events.Hub.stats().
+    """
+    lines = [
+        "# HELP http_requests_total HTTP requests by route and status.",
+        "# TYPE http_requests_total counter",
+    ]
+    for values, counter in REQUESTS.items():
+        lines.append(f"http_requests_total{label_text(REQUESTS.label_names, values)} {counter.value}")
+    lines += [
+        "# HELP http_request_errors_total HTTP requests that ended in a 5xx or an unhandled exception.",
+        "# TYPE http_request_errors_total counter",
+    ]
+    for values, counter in REQUEST_ERRORS.items():
+        lines.append(f"http_request_errors_total{label_text(REQUEST_ERRORS.label_names, values)} {counter.value}")
+    lines += [
+        "# HELP http_request_duration_seconds Time from request start to the end of the response body.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for values, histogram in REQUEST_SECONDS.items():
+        render_histogram(lines, "http_request_duration_seconds", REQUEST_SECONDS.label_names, values, histogram.snapshot())
+    for name, family, help_text in (
+        ("http_compression_input_bytes_total", COMPRESSION_INPUT_BYTES, "Response bytes fed to a codec."),
+        ("http_compression_output_bytes_total", COMPRESSION_OUTPUT_BYTES, "Compressed bytes produced by a codec."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for values, counter in family.items():
+            lines.append(f"{name}{label_text(family.label_names, values)} {counter.value}")
+
+    for field, help_text in (
+        ("size", "Configured pool size."),
+        ("checkedout", "Connections currently checked out."),
+        ("checkedin", "Idle connections in the pool."),
+        ("overflow", "Connections open beyond the pool size."),
+    ):
+        lines += [f"# HELP db_pool_{field} {help_text}", f"# TYPE db_pool_{field} gauge"]
+        for pool, status in pools.items():
+            if field in status:
+                lines.append(f"db_pool_{field}{label_text(('pool',), (pool,))} {status[field]}")
+    lines += [
+        "# HELP db_pool_wait_seconds Time spent waiting to check out a connection.",
+        "# TYPE db_pool_wait_seconds histogram",
+    ]
+    render_histogram(lines, "db_pool_wait_seconds", (), (), POOL_WAIT_SECONDS.snapshot())
+    lines += [
+        "# HELP db_pool_timeouts_total Checkouts that gave up waiting for a connection.",
+        "# TYPE db_pool_timeouts_total counter",
+        f"db_pool_timeouts_total {POOL_TIMEOUTS.value}",
+    ]
+
+    lines += [
+        "# HELP db_replica_healthy Whether a read replica is in rotation.",
+        "# TYPE db_replica_healthy gauge",
+    ]
+    for replica in replicas:
+        lines.append(f"db_replica_healthy{label_text(('replica',), (replica['name'],))} {int(replica['healthy'])}")
+    lines += [
+        "# HELP db_replica_reads_total Session runs sent to a read replica.",
+        "# TYPE db_replica_reads_total counter",
+    ]
+    for replica in replicas:
+        lines.append(f"db_replica_reads_total{label_text(('replica',), (replica['name'],))} {replica['reads']}")
+    lines += [
+        "# HELP db_replica_lag_seconds Replay lag of a Postgres replica at the last health check.",
+        "# TYPE db_replica_lag_seconds gauge",
+    ]
+    for replica in replicas:
+        if replica["lag_seconds"] is not None:
+            lines.append(f"db_replica_lag_seconds{label_text(('replica',), (replica['name'],))} {replica['lag_seconds']}")
+
+    lines += [
+        "# HELP response_cache_hits_total Response cache hits.",
+        "# TYPE response_cache_hits_total counter",
+        f"response_cache_hits_total {cache_stats['hits']}",
+        "# HELP response_cache_misses_total Response cache misses.",
+        "# TYPE response_cache_misses_total counter",
+        f"response_cache_misses_total {cache_stats['misses']}",
+        "# HELP response_cache_entries Responses currently cached.",
+        "# TYPE response_cache_entries gauge",
+        f"response_cache_entries {cache_stats['entries']}",
+    ]
+
+    if feed is not None:
+        lines += [
+            "# HELP events_subscribers Clients connected to the change feed (SSE and WebSocket).",
+            "# TYPE events_subscribers gauge",
+            f"events_subscribers {feed['subscribers']}",
+            "# HELP events_stalled_subscribers Dropped subscribers whose socket has not drained yet; cut at the next keepalive.",
+            "# TYPE events_stalled_subscribers gauge",
+            f"events_stalled_subscribers {feed['stalled']}",
+            "# HELP events_published_total Change events dispatched to this worker's subscribers.",
+            "# TYPE events_published_total counter",
+            f"events_published_total {feed['published']}",
+            "# HELP events_slow_disconnects_total Subscribers dropped for falling too far behind.",
+            "# TYPE events_slow_disconnects_total counter",
+            f"events_slow_disconnects_total {feed['slow_disconnects']}",
+        ]
+
+    lines += [
+        "# HELP dundalk_market_entities Approximate row counts, refreshed in the background.",
+        "# TYPE dundalk_market_entities gauge",
+    ]
+    for name, value in ENTITY_COUNTS.snapshot().items():
+        lines.append(f"dundalk_market_entities{label_text(('entity',), (name,))} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,79 @@
+"""Schema migrations, run as a deploy step rather than on every worker boot.
+
+    python migrate.py              # upgrade to the latest revision
+    python migrate.py --revision 0001
+
+Wraps `alembic upgrade` (alembic.ini, migrations/) so it runs on the app's own
+engine. Databases created by the old create_all-at-startup code have tables
+but no alembic_version; they are brought up to the baseline and stamped
+before upgrading. DB_AUTO_MIGRATE=true makes the app lifespan do this at
+startup instead, which suits a single-process dev server or throwaway
+benchmark databases.
+"""
+import argparse
+import os
+
+from sqlalchemy import inspect
+
+import database
+
+AUTO_MIGRATE = database.env_flag("DB_AUTO_MIGRATE", "false")
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE = "0001"
+# What create_all used to make; only these are created when adopting an old database
+BASELINE_TABLES = [
+    "stores", "products", "store_stats", "category_stats",
+    "orders", "order_items", "idempotency_keys",
+]
+
+def alembic_config():
+    from alembic.config import Config
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    return config
+
+def current_revision(conn=None):
+    """The database's alembic revision, or None if it has never been migrated"""
+    if conn is None:
+        with database.engine.connect() as conn:
+            return database.schema_revision(conn)
+    return database.schema_revision(conn)
+
+def adopt_legacy(conn, config):
+    """Fill in and stamp a database that create_all built before migrations existed"""
+    import models
+    import search
+    import stats
+    from alembic import command
+
+    tables = [models.Base.metadata.tables[name] for name in BASELINE_TABLES]
+    models.Base.metadata.create_all(bind=conn, tables=tables)
+    # create_all skips indexes on tables that already exist
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+    search.install_schema(conn)
+    stats.install_schema(conn)
+    command.stamp(config, BASELINE)
+    print(f"✅ Adopted existing database at revision {BASELINE}")
+
+def upgrade(revision: str = "head"):
+    from alembic import command
+
+    config = alembic_config()
+    with database.engine.begin() as conn:
+        config.attributes["connection"] = conn
+        if current_revision(conn) is None and inspect(conn).has_table("stores"):
+            adopt_legacy(conn, config)
+        command.upgrade(config, revision)
+
+def main():
+    parser = argparse.ArgumentParser(description="Dundalk Market schema migrations")
+    parser.add_argument("--revision", default="head")
+    args = parser.parse_args()
+    upgrade(args.revision)
+    print(f"✅ Database at revision {current_revision()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Alembic environment: runs against the app's own engine (pool settings, SQLite pragmas)"""
+from alembic import context
+
+import database
+import models
+
+config = context.config
+target_metadata = models.Base.metadata
+
+# Created by the raw DDL in search.py and geo.py, not the models; autogenerate must not drop them
+RAW_DDL_OBJECTS = {"search_vector", "ix_products_search_vector", "ix_stores_location"}
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and name.startswith(("products_fts", "stores_rtree")):
+        return False
+    return name not in RAW_DDL_OBJECTS
+
+def run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite cannot ALTER most columns; batch mode rebuilds the table instead
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    # migrate.upgrade() hands over a connection; the alembic CLI does not
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations(connection)
+        return
+    with database.engine.connect() as connection:
+        run_migrations(connection)
+        connection.commit()
+
+if context.is_offline_mode():
+    context.configure(url=database.DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+else:
+    run_migrations_online()
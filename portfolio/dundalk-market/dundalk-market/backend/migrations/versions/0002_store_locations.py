@@ -0,0 +1,38 @@
+"""store locations
+
+Latitude/longitude on stores, geocoded offline from the existing addresses,
+plus the spatial index behind GET /stores/near (see geo.py).
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:20:41
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import geo
+import search
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('stores', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+    geo.geocode_missing(op.get_bind())
+    geo.install_schema(op.get_bind())
+
+
+def downgrade():
+    geo.drop_schema(op.get_bind())
+    # SQLite rebuilds stores to drop columns; the search triggers refer to it
+    search.drop_schema(op.get_bind())
+    with op.batch_alter_table('stores', schema=None) as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
+    search.install_schema(op.get_bind())
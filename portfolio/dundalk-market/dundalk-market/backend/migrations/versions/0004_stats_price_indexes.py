@@ -0,0 +1,45 @@
+"""stats price indexes
+
+(store_id, is_active, price) and (category, is_active, price) on products, so
+the stats triggers read a group's new min/max price off an index instead of
+scanning the group, and the triggers recreated with the stock-only path (see
+stats.py).
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:41:05
+"""
+from alembic import op
+from sqlalchemy import inspect
+
+import stats
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+PRICE_INDEXES = {
+    'ix_products_store_active_price': ['store_id', 'is_active', 'price'],
+    'ix_products_category_active_price': ['category', 'is_active', 'price'],
+}
+
+
+def upgrade():
+    # migrate.adopt_legacy builds a pre-migrations database from the current
+    # models, so these indexes may already be there
+    existing = {index['name'] for index in inspect(op.get_bind()).get_indexes('products')}
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        for name, columns in PRICE_INDEXES.items():
+            if name not in existing:
+                batch_op.create_index(name, columns, unique=False)
+
+    stats.create_triggers(op.get_bind())
+
+
+def downgrade():
+    # The triggers stay: they are correct without the indexes, only slower
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_category_active_price')
+        batch_op.drop_index('ix_products_store_active_price')
@@ -0,0 +1,160 @@
+"""Order placement with atomic stock reservation.
+
+Each order line takes its stock with one conditional UPDATE:
+
+    UPDATE products SET stock_quantity = stock_quantity - :n
+    WHERE id = :id AND is_active AND stock_quantity >= :n
+
+so the check and the decrement are a single statement and concurrent buyers
+can never drive stock below zero, on SQLite (writers serialize) or Postgres
+(the row lock is held until commit and the WHERE is re-checked). Lines are
+reserved in product id order so two multi-line orders cannot deadlock. If any
+line falls short, the transaction rolls back and nothing is reserved.
+
+A reservation holds the stock until it is confirmed, cancelled or it expires.
+Releasing flips the status with a guarded UPDATE first, so stock is returned
+at most once even if the sweeper and a cancel race.
+"""
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+
+import models
+
+ORDER_RESERVATION_SECONDS = int(os.getenv("ORDER_RESERVATION_SECONDS", "900"))
+ORDER_SWEEP_SECONDS = float(os.getenv("ORDER_SWEEP_SECONDS", "30"))
+ORDER_SWEEP_BATCH = int(os.getenv("ORDER_SWEEP_BATCH", "500"))
+
+def place(session, lines, customer_email=None):
+    """Reserve stock for every (product_id, quantity) line and create the order.
+
+    Returns (order, stock): stock maps each product touched to its
+    (store_id, new stock_quantity). Raises HTTPException 404 for a product
+    that does not exist and 409 for one that is inactive or short of stock.
+    """
+    quantities = Counter()
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+
+    items = []
+    stock = {}
+    try:
+        for product_id in sorted(quantities):
+            quantity = quantities[product_id]
+            reserved = session.execute(
+                update(models.Product)
+                .where(
+                    models.Product.id == product_id,
+                    models.Product.is_active == True,
+                    models.Product.stock_quantity >= quantity
+                )
+                .values(stock_quantity=models.Product.stock_quantity - quantity)
+                .returning(models.Product.price, models.Product.store_id, models.Product.stock_quantity)
+            ).first()
+            if reserved is None:
+                raise unavailable(session, product_id)
+            items.append(models.OrderItem(product_id=product_id, quantity=quantity, unit_price=reserved.price))
+            stock[product_id] = (reserved.store_id, reserved.stock_quantity)
+
+        now = datetime.utcnow()
+        order = models.Order(
+            status="reserved",
+            customer_email=customer_email,
+            total=round(sum(item.quantity * item.unit_price for item in items), 2),
+            expires_at=now + timedelta(seconds=ORDER_RESERVATION_SECONDS),
+            items=items,
+        )
+        session.add(order)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    session.refresh(order)
+    return order, stock
+
+def unavailable(session, product_id: int) -> HTTPException:
+    """Why a reservation matched no row: the product is missing, inactive or short"""
+    is_active = session.scalar(select(models.Product.is_active).where(models.Product.id == product_id))
+    if is_active is None:
+        return HTTPException(status_code=404, detail=f"Product {product_id} not found")
+    if not is_active:
+        return HTTPException(status_code=409, detail=f"Product {product_id} is not available")
+    return HTTPException(status_code=409, detail=f"Insufficient stock for product {product_id}")
+
+def get(session, order_id: int):
+    order = session.get(models.Order, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+def confirm(session, order_id: int):
+    """Turn a live reservation into a sale (e.g. once payment succeeds)"""
+    confirmed = session.execute(
+        update(models.Order)
+        .where(
+            models.Order.id == order_id,
+            models.Order.status == "reserved",
+            models.Order.expires_at > datetime.utcnow()
+        )
+        .values(status="confirmed")
+    ).rowcount
+    session.commit()
+    order = get(session, order_id)
+    if not confirmed:
+        raise HTTPException(status_code=409, detail=f"Order is {order.status}, not an active reservation")
+    return order
+
+def release(session, order_id: int, status: str) -> dict:
+    """Move a reserved order to status and put its stock back; returns {product_id: (store_id, stock_quantity)}.
+
+    Does nothing (returns None) if the order was no longer reserved.
+    """
+    released = session.execute(
+        update(models.Order)
+        .where(models.Order.id == order_id, models.Order.status == "reserved")
+        .values(status=status)
+    ).rowcount
+    if not released:
+        return None
+    stock = {}
+    items = session.execute(
+        select(models.OrderItem.product_id, models.OrderItem.quantity)
+        .where(models.OrderItem.order_id == order_id)
+    ).all()
+    for product_id, quantity in items:
+        restocked = session.execute(
+            update(models.Product)
+            .where(models.Product.id == product_id)
+            .values(stock_quantity=models.Product.stock_quantity + quantity)
+            .returning(models.Product.store_id, models.Product.stock_quantity)
+        ).first()
+        # The product may be gone (a reseed or a hard delete); there is nothing to put back
+        if restocked is not None:
+            stock[product_id] = tuple(restocked)
+    return stock
+
+def cancel(session, order_id: int):
+    stock = release(session, order_id, "cancelled")
+    session.commit()
+    order = get(session, order_id)
+    if stock is None:
+        raise HTTPException(status_code=409, detail=f"Order is {order.status}, not an active reservation")
+    return order, stock
+
+def expire_due(session, limit: int = ORDER_SWEEP_BATCH) -> dict:
+    """Release up to limit reservations past their deadline; returns the stock levels touched, as release does"""
+    due = session.scalars(
+        select(models.Order.id)
+        .where(models.Order.status == "reserved", models.Order.expires_at <= datetime.utcnow())
+        .order_by(models.Order.expires_at)
+        .limit(limit)
+    ).all()
+    stock = {}
+    for order_id in due:
+        stock.update(release(session, order_id, "expired") or {})
+        # One short transaction per order keeps the write lock brief
+        session.commit()
+    return stock
@@ -0,0 +1,193 @@
+"""Full-text product search.
+
+SQLite: an FTS5 table (products_fts, rowid = product id) of active products,
+kept in sync by triggers.
+Postgres: a weighted products.search_vector tsvector with a GIN index, kept in
+sync by a trigger. Either way every write path, bulk imports included, updates
+the index in the same transaction without the handlers doing anything.
+"""
+import re
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import inspect, text
+
+import models
+
+# Relative column weights: name, description, category, store name
+BM25_WEIGHTS = "10.0, 2.0, 5.0, 3.0"
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, category, store_name,
+        tokenize = 'porter unicode61', prefix = '2 3'
+    )""",
+    # ORDER BY rank uses this, so ranking and LIMIT happen inside FTS5
+    f"INSERT INTO products_fts(products_fts, rank) VALUES ('rank', 'bm25({BM25_WEIGHTS})')",
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    """CREATE TRIGGER products_fts_insert AFTER INSERT ON products WHEN new.is_active BEGIN
+        INSERT INTO products_fts(rowid, name, description, category, store_name)
+        VALUES (new.id, new.name, new.description, new.category,
+                (SELECT name FROM stores WHERE id = new.store_id));
+    END""",
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    """CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+    END""",
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    """CREATE TRIGGER products_fts_update
+    AFTER UPDATE OF name, description, category, store_id, is_active ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+        INSERT INTO products_fts(rowid, name, description, category, store_name)
+        SELECT new.id, new.name, new.description, new.category,
+               (SELECT name FROM stores WHERE id = new.store_id)
+        WHERE new.is_active;
+    END""",
+    "DROP TRIGGER IF EXISTS stores_fts_rename",
+    """CREATE TRIGGER stores_fts_rename AFTER UPDATE OF name ON stores BEGIN
+        UPDATE products_fts SET store_name = new.name
+        WHERE rowid IN (SELECT id FROM products WHERE store_id = new.id);
+    END""",
+]
+
+SQLITE_BACKFILL = """
+    INSERT INTO products_fts(rowid, name, description, category, store_name)
+    SELECT p.id, p.name, p.description, p.category, s.name
+    FROM products p LEFT JOIN stores s ON s.id = p.store_id
+    WHERE p.is_active
+"""
+
+POSTGRES_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+    """CREATE OR REPLACE FUNCTION products_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.category, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce((SELECT name FROM stores WHERE id = NEW.store_id), '')), 'C') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'D');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS products_search_vector ON products",
+    """CREATE TRIGGER products_search_vector
+        BEFORE INSERT OR UPDATE OF name, description, category, store_id ON products
+        FOR EACH ROW EXECUTE FUNCTION products_search_vector_update()""",
+    """CREATE OR REPLACE FUNCTION stores_search_vector_rename() RETURNS trigger AS $$
+    BEGIN
+        -- Touching name re-runs the products trigger with the new store name
+        UPDATE products SET name = name WHERE store_id = NEW.id;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS stores_search_vector_rename ON stores",
+    """CREATE TRIGGER stores_search_vector_rename
+        AFTER UPDATE OF name ON stores
+        FOR EACH ROW EXECUTE FUNCTION stores_search_vector_rename()""",
+    # Set-based backfill; writing only search_vector does not fire the trigger
+    """UPDATE products p SET search_vector =
+            setweight(to_tsvector('english', coalesce(p.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(p.category, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(s.name, '')), 'C') ||
+            setweight(to_tsvector('english', coalesce(p.description, '')), 'D')
+        FROM stores s
+        WHERE s.id = p.store_id AND p.search_vector IS NULL""",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS products_fts_insert",
+    "DROP TRIGGER IF EXISTS products_fts_delete",
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    "DROP TRIGGER IF EXISTS stores_fts_rename",
+    "DROP TABLE IF EXISTS products_fts",
+]
+
+POSTGRES_DROP = [
+    "DROP TRIGGER IF EXISTS products_search_vector ON products",
+    "DROP TRIGGER IF EXISTS stores_search_vector_rename ON stores",
+    "DROP INDEX IF EXISTS ix_products_search_vector",
+    "UPDATE products SET search_vector = NULL",
+]
+
+def install(engine):
+    """Create the search index for this database if it is missing (idempotent)"""
+    with engine.begin() as conn:
+        install_schema(conn)
+
+def install_schema(conn):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        exists = inspect(conn).has_table("products_fts")
+        for statement in SQLITE_DDL:
+            conn.exec_driver_sql(statement)
+        if not exists:
+            conn.exec_driver_sql(SQLITE_BACKFILL)
+    elif dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            conn.exec_driver_sql(statement)
+
+def drop_schema(conn):
+    statements = {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}.get(conn.dialect.name, [])
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+
+@contextmanager
+def bulk_load(session):
+    """Drop the search index around a bulk rewrite and rebuild it in one pass.
+    
+    Maintaining it row by row through the triggers costs more than the inserts.
+    The index is rebuilt even when the load fails or is cancelled partway.
+    """
+    drop_schema(session.connection())
+    session.commit()
+    try:
+        yield
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        install_schema(session.connection())
+        session.commit()
+
+def terms(q: str) -> List[str]:
+    return re.findall(r"\w+", q.lower())
+
+def search_products(session, q: str, limit: int, offset: int):
+    """Active products matching every term of q (last term as a prefix), best first"""
+    words = terms(q)
+    if not words:
+        return []
+    columns = ", ".join(f"p.{column.name}" for column in models.Product.__table__.columns)
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        # Quoted terms so user input is never FTS5 syntax; prefix-match the last one
+        match = " ".join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+        # Only active products are indexed, so the page is cut inside FTS5
+        # before touching the products table
+        statement = text(f"""
+            SELECT {columns} FROM (
+                SELECT rowid, rank FROM products_fts
+                WHERE products_fts MATCH :match
+                ORDER BY rank
+                LIMIT :limit OFFSET :offset
+            ) AS hits
+            JOIN products p ON p.id = hits.rowid
+            ORDER BY hits.rank
+        """)
+    elif dialect == "postgresql":
+        match = " & ".join(words[:-1] + [f"{words[-1]}:*"])
+        statement = text(f"""
+            SELECT {columns} FROM products p
+            WHERE p.search_vector @@ to_tsquery('english', :match) AND p.is_active
+            ORDER BY ts_rank(p.search_vector, to_tsquery('english', :match)) DESC, p.id
+            LIMIT :limit OFFSET :offset
+        """)
+    else:
+        raise NotImplementedError(f"Full-text search is not available on {dialect}")
+    return (
+        session.query(models.Product)
+        .from_statement(statement)
+        .params(match=match, limit=limit, offset=offset)
+        .all()
+    )
@@ -0,0 +1,269 @@
+"""Sample and synthetic data for the Dundalk Market database.
+
+The sample set is the three Dundalk businesses shown in the frontend. The
+synthetic generator builds any number of stores and products from a fixed
+random seed, so a load-test database can be rebuilt identically.
+"""
+import math
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+
+import geo
+import models
+import search
+import stats
+
+SEED_BATCH_SIZE = 20000
+
+# ============ SAMPLE DATA ============
+
+SAMPLE_STORES = [
+    {
+        "name": "DPL Engineering",
+        "owner_name": "John Smith",
+        "email": "dpl@example.com",
+        "phone": "042 123 4567",
+        "address": "Dundalk Industrial Estate, Dundalk, Co. Louth",
+        "description": "Precision engineering and industrial supplies for over 20 years",
+        "category": "Industrial",
+        "is_approved": True
+    },
+    {
+        "name": "Dundalk Bookshop",
+        "owner_name": "Mary O'Connor",
+        "email": "bookshop@example.com",
+        "phone": "042 987 6543",
+        "address": "Market Square, Dundalk, Co. Louth",
+        "description": "Independent bookshop specializing in local authors and history",
+        "category": "Retail",
+        "is_approved": True
+    },
+    {
+        "name": "The Square Bakery",
+        "owner_name": "Peter Brown",
+        "email": "bakery@example.com",
+        "phone": "042 555 1234",
+        "address": "The Square, Dundalk, Co. Louth",
+        "description": "Artisan bakery using traditional methods and local ingredients",
+        "category": "Food",
+        "is_approved": True
+    }
+]
+
+# Products per sample store, in the same order as SAMPLE_STORES
+SAMPLE_PRODUCTS = [
+    [
+        {"name": "Steel Bolts (Pack of 50)", "price": 24.99, "description": "High-quality steel bolts", "category": "Hardware"},
+        {"name": "Aluminum Brackets", "price": 15.50, "description": "Lightweight aluminum brackets", "category": "Hardware"},
+        {"name": "Custom CNC Machining", "price": 199.99, "description": "Custom machining services", "category": "Services"},
+    ],
+    [
+        {"name": "Local History of Dundalk", "price": 19.99, "description": "Comprehensive history of Dundalk", "category": "Books"},
+        {"name": "Irish Poetry Collection", "price": 12.99, "description": "Collection of Irish poetry", "category": "Books"},
+        {"name": "Gift Card €20", "price": 20.00, "description": "€20 gift card for the bookshop", "category": "Gifts"},
+    ],
+    [
+        {"name": "Sourdough Loaf", "price": 4.50, "description": "Traditional sourdough bread", "category": "Bread"},
+        {"name": "Danish Pastries (Pack of 4)", "price": 8.99, "description": "Fresh danish pastries", "category": "Pastries"},
+        {"name": "Coffee Beans (250g)", "price": 12.99, "description": "Premium coffee beans", "category": "Drinks"},
+    ],
+]
+
+# ============ SYNTHETIC DATA ============
+
+# store category -> (share of stores, {product category: (median price, spread, nouns)})
+CATALOGUE = {
+    "Food": (0.30, {
+        "Bread": (4.0, 0.35, ["Sourdough Loaf", "Soda Bread", "Brown Bread", "Bagels", "Baguette"]),
+        "Pastries": (6.5, 0.40, ["Croissants", "Scones", "Danish Pastries", "Apple Tart", "Brownies"]),
+        "Drinks": (9.0, 0.50, ["Coffee Beans", "Loose Leaf Tea", "Apple Juice", "Craft Cider", "Hot Chocolate"]),
+        "Deli": (7.5, 0.50, ["Smoked Salmon", "Farmhouse Cheese", "Chutney", "Black Pudding", "Honey"]),
+    }),
+    "Retail": (0.25, {
+        "Books": (14.0, 0.45, ["Local History", "Poetry Collection", "Cookbook", "Novel", "Walking Guide"]),
+        "Gifts": (22.0, 0.60, ["Gift Card", "Candle Set", "Greeting Cards", "Photo Frame", "Keyring"]),
+        "Toys": (18.0, 0.55, ["Jigsaw Puzzle", "Board Game", "Teddy Bear", "Building Blocks", "Kite"]),
+    }),
+    "Fashion": (0.15, {
+        "Clothing": (45.0, 0.55, ["Wool Jumper", "Rain Jacket", "Linen Shirt", "Tweed Cap", "Scarf"]),
+        "Accessories": (25.0, 0.60, ["Leather Belt", "Tote Bag", "Silver Bracelet", "Wallet", "Sunglasses"]),
+    }),
+    "Home": (0.15, {
+        "Homeware": (30.0, 0.60, ["Ceramic Mug", "Table Runner", "Throw Blanket", "Vase", "Cushion"]),
+        "Garden": (20.0, 0.70, ["Seed Pack", "Plant Pot", "Garden Gloves", "Bird Feeder", "Trowel"]),
+    }),
+    "Industrial": (0.10, {
+        "Hardware": (18.0, 0.70, ["Steel Bolts", "Aluminum Brackets", "Hinges", "Wood Screws", "Wall Plugs"]),
+        "Services": (180.0, 0.60, ["CNC Machining", "Welding Repair", "Tool Hire", "Installation", "Consultation"]),
+    }),
+    "Health": (0.05, {
+        "Wellbeing": (16.0, 0.50, ["Hand Cream", "Herbal Tea", "Bath Salts", "Vitamin D", "Lip Balm"]),
+    }),
+}
+
+ADJECTIVES = ["Handmade", "Organic", "Local", "Classic", "Premium", "Traditional", "Small-Batch", "Irish", "Rustic", "Deluxe"]
+SIZES = ["", " (Small)", " (Large)", " (Pack of 4)", " (250g)", " (Gift Box)"]
+SURNAMES = ["Murphy", "Kelly", "O'Brien", "Byrne", "Ryan", "Walsh", "McArdle", "Quinn", "Duffy", "Callan", "Sheridan", "Carroll"]
+STORE_TYPES = {
+    "Food": ["Bakery", "Deli", "Café", "Grocer"],
+    "Retail": ["Books", "Gift Shop", "Toy Shop"],
+    "Fashion": ["Boutique", "Outfitters"],
+    "Home": ["Home & Garden", "Interiors"],
+    "Industrial": ["Engineering", "Supplies"],
+    "Health": ["Pharmacy", "Wellness"],
+}
+STREETS = ["Clanbrassil Street", "Park Street", "Earl Street", "Market Square", "The Square", "Bridge Street", "Francis Street", "Dublin Road"]
+OTHER_STREETS = ["Main Street", "Church Street", "Market Street", "Castle Street", "Chapel Lane"]
+# About a third of synthetic stores are in Dundalk; the rest spread over the gazetteer towns
+DUNDALK_SHARE = 0.35
+# Stores scatter around their street or town centre by this much (standard deviation)
+LOCATION_SPREAD_KM = 1.5
+
+def located(store: dict, rng: random.Random = None) -> dict:
+    """Add the geocoded latitude/longitude, scattered around the centre point when rng is given"""
+    point = geo.geocode(store.get("address"))
+    if point is None:
+        store["latitude"] = store["longitude"] = None
+        return store
+    latitude, longitude = point
+    if rng is not None:
+        latitude += rng.gauss(0, LOCATION_SPREAD_KM / geo.KM_PER_DEGREE)
+        longitude += rng.gauss(0, LOCATION_SPREAD_KM / (geo.KM_PER_DEGREE * math.cos(math.radians(latitude))))
+    store["latitude"], store["longitude"] = round(latitude, 6), round(longitude, 6)
+    return store
+
+def generate_stores(rng: random.Random, count: int):
+    categories = list(CATALOGUE)
+    shares = [CATALOGUE[category][0] for category in categories]
+    towns = [(name.title(), places[0][0].title()) for name, places in sorted(geo.gazetteer()[0].items())]
+    for i, category in enumerate(rng.choices(categories, weights=shares, k=count)):
+        surname = rng.choice(SURNAMES)
+        if rng.random() < DUNDALK_SHARE:
+            town, county, street = "Dundalk", "Louth", rng.choice(STREETS)
+        else:
+            (town, county), street = rng.choice(towns), rng.choice(OTHER_STREETS)
+        yield located({
+            "name": f"{surname}'s {rng.choice(STORE_TYPES[category])}",
+            "owner_name": f"{rng.choice(['Aoife', 'Ciara', 'Sean', 'Niamh', 'Conor', 'Orla', 'Darragh', 'Siobhan'])} {surname}",
+            "email": f"store{i + 1}@example.com",
+            "phone": f"042 {rng.randint(100, 999)} {rng.randint(1000, 9999)}",
+            "address": f"{rng.randint(1, 120)} {street}, {town}, Co. {county}",
+            "description": f"Independent {category.lower()} business serving {town}",
+            "category": category,
+            # Roughly one in ten stores is still waiting for approval
+            "is_approved": rng.random() < 0.9,
+        }, rng)
+
+def generate_products(rng: random.Random, stores: list, count: int):
+    """stores is a list of (id, category); products per store follow a long tail"""
+    weights = [rng.paretovariate(1.5) for _ in stores]
+    options = {
+        store_category: [(category, median, spread, nouns) for category, (median, spread, nouns) in product_categories.items()]
+        for store_category, (_, product_categories) in CATALOGUE.items()
+    }
+    # Bound methods hoisted out of the loop; this runs a million times
+    choice, gauss, random_, expovariate = rng.choice, rng.gauss, rng.random, rng.expovariate
+    for store_id, store_category in rng.choices(stores, weights=weights, k=count):
+        category, median, spread, nouns = choice(options[store_category])
+        noun = choice(nouns)
+        yield {
+            "store_id": store_id,
+            "name": f"{choice(ADJECTIVES)} {noun}{choice(SIZES)}",
+            # Log-normal prices around the category median, rounded to .49/.99
+            "price": max(0.99, math.floor(median * math.exp(gauss(0, spread))) + (0.49 if random_() < 0.5 else 0.99)),
+            "description": f"{noun} from a Dundalk {store_category.lower()} business",
+            "category": category,
+            "stock_quantity": int(expovariate(0.05)),
+            "is_active": random_() < 0.97,
+        }
+
+# ============ INSERTION ============
+
+def clear(session):
+    session.query(models.OrderItem).delete()
+    session.query(models.Order).delete()
+    session.query(models.Product).delete()
+    session.query(models.Store).delete()
+    session.commit()
+
+def insert_batches(session, model, rows, batch_size: int = SEED_BATCH_SIZE, on_batch=None) -> int:
+    """Core executemany INSERTs (no ORM bookkeeping), one transaction per batch.
+    
+    on_batch(rows) is called after each commit, e.g. to report progress.
+    """
+    statement = model.__table__.insert()
+    now = datetime.utcnow()
+    inserted = 0
+    batch = []
+    for row in rows:
+        row["created_at"] = row["updated_at"] = now
+        batch.append(row)
+        if len(batch) == batch_size:
+            session.execute(statement, batch)
+            session.commit()
+            inserted += len(batch)
+            if on_batch is not None:
+                on_batch(len(batch))
+            batch = []
+    if batch:
+        session.execute(statement, batch)
+        session.commit()
+        inserted += len(batch)
+        if on_batch is not None:
+            on_batch(len(batch))
+    return inserted
+
+def seed_sample(session) -> dict:
+    """Replace everything with the sample Dundalk stores and products"""
+    with search.bulk_load(session), stats.bulk_load(session), geo.bulk_load(session):
+        clear(session)
+        insert_batches(session, models.Store, [located(dict(store)) for store in SAMPLE_STORES])
+        store_ids = session.scalars(select(models.Store.id).order_by(models.Store.id)).all()
+        products = [
+            dict(product, store_id=store_id)
+            for store_id, store_products in zip(store_ids, SAMPLE_PRODUCTS)
+            for product in store_products
+        ]
+        insert_batches(session, models.Product, products)
+    return {"stores_created": len(store_ids), "products_created": len(products)}
+
+def seed_synthetic(session, stores: int, products: int, seed: int = 42, batch_size: int = SEED_BATCH_SIZE, progress=None) -> dict:
+    """Replace everything with a reproducible synthetic catalogue.
+    
+    progress(fraction, message) is called after each batch; the jobs
+    subsystem passes JobContext.progress, which can also cancel the seed.
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    total = stores + products
+    inserted = 0
+
+    def on_batch(rows: int):
+        nonlocal inserted
+        inserted += rows
+        if progress is not None:
+            progress(inserted / total, f"{inserted:,} of {total:,} rows")
+
+    with search.bulk_load(session), stats.bulk_load(session), geo.bulk_load(session):
+        clear(session)
+        stores_created = insert_batches(session, models.Store, generate_stores(rng, stores), batch_size, on_batch)
+        store_rows = session.execute(select(models.Store.id, models.Store.category).order_by(models.Store.id)).all()
+        products_created = insert_batches(session, models.Product, generate_products(rng, [tuple(row) for row in store_rows], products), batch_size, on_batch)
+    elapsed = time.perf_counter() - started
+    return {
+        "stores_created": stores_created,
+        "products_created": products_created,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round((stores_created + products_created) / elapsed) if elapsed else 0,
+    }
+
+def seed_job(ctx, stores: int = None, products: int = None, seed: int = 42) -> dict:
+    """jobs handler behind POST /seed; runs in a pool process, off the API's GIL"""
+    import database
+    with database.SessionLocal() as session:
+        if stores is None and products is None:
+            return seed_sample(session)
+        return seed_synthetic(session, stores or 1, products or 0, seed, progress=ctx.progress)
@@ -0,0 +1,233 @@
+"""Per-store and per-category aggregates over active products.
+
+store_stats and category_stats hold count, price sum/min/max and total stock,
+so dashboards read one row per store or category instead of every product.
+Like the search index, they are kept current by triggers on products, so
+every write path (single creates, bulk imports, direct SQL) updates them in
+the same transaction. Counts and sums are adjusted arithmetically; min/max are
+only recomputed when the row leaving a group held the extreme value, and then
+read off the (store_id, is_active, price) and (category, is_active, price)
+indexes. Stock-only updates (every order reservation and release) just adjust
+total_stock and never touch min/max. Products without a category are left out
+of category_stats.
+
+    python stats.py rebuild
+"""
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import text
+
+GROUPS = [("store_stats", "store_id"), ("category_stats", "category")]
+
+# ============ SQLITE ============
+
+def sqlite_add(table: str, key: str) -> str:
+    return f"""INSERT INTO {table} ({key}, product_count, price_sum, min_price, max_price, total_stock, updated_at)
+        SELECT new.{key}, 1, new.price, new.price, new.price, coalesce(new.stock_quantity, 0), CURRENT_TIMESTAMP
+        WHERE new.is_active AND new.{key} IS NOT NULL
+        ON CONFLICT ({key}) DO UPDATE SET
+            product_count = product_count + 1,
+            price_sum = price_sum + excluded.price_sum,
+            min_price = min(coalesce(min_price, excluded.min_price), excluded.min_price),
+            max_price = max(coalesce(max_price, excluded.max_price), excluded.max_price),
+            total_stock = total_stock + excluded.total_stock,
+            updated_at = excluded.updated_at;"""
+
+def sqlite_remove(table: str, key: str) -> str:
+    # "is_active = 1" rather than a bare is_active, so the price index can answer min/max
+    return f"""UPDATE {table} SET
+            product_count = product_count - 1,
+            price_sum = price_sum - old.price,
+            min_price = CASE WHEN old.price <= min_price
+                THEN (SELECT min(price) FROM products WHERE {key} = old.{key} AND is_active = 1) ELSE min_price END,
+            max_price = CASE WHEN old.price >= max_price
+                THEN (SELECT max(price) FROM products WHERE {key} = old.{key} AND is_active = 1) ELSE max_price END,
+            total_stock = total_stock - coalesce(old.stock_quantity, 0),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE {key} = old.{key} AND old.is_active;
+        DELETE FROM {table} WHERE {key} = old.{key} AND product_count <= 0;"""
+
+def sqlite_restock(table: str, key: str) -> str:
+    return f"""UPDATE {table} SET
+            total_stock = total_stock + coalesce(new.stock_quantity, 0) - coalesce(old.stock_quantity, 0),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE {key} = new.{key};"""
+
+# The row's place in its groups: when none of these change, only the stock can have
+SQLITE_SAME_GROUPS = " AND ".join(f"old.{column} IS new.{column}" for column in ("price", "category", "store_id", "is_active"))
+
+SQLITE_TRIGGERS = {
+    "products_stats_insert": "AFTER INSERT ON products BEGIN\n" + "\n".join(sqlite_add(*group) for group in GROUPS) + "\nEND",
+    "products_stats_delete": "AFTER DELETE ON products BEGIN\n" + "\n".join(sqlite_remove(*group) for group in GROUPS) + "\nEND",
+    # Take the old row out, then put the new one in
+    "products_stats_update": (
+        f"AFTER UPDATE OF price, stock_quantity, category, store_id, is_active ON products WHEN NOT ({SQLITE_SAME_GROUPS}) BEGIN\n"
+        + "\n".join(sqlite_remove(*group) for group in GROUPS) + "\n"
+        + "\n".join(sqlite_add(*group) for group in GROUPS) + "\nEND"
+    ),
+    "products_stats_stock": (
+        "AFTER UPDATE OF stock_quantity ON products "
+        f"WHEN {SQLITE_SAME_GROUPS} AND new.is_active AND old.stock_quantity IS NOT new.stock_quantity BEGIN\n"
+        + "\n".join(sqlite_restock(*group) for group in GROUPS) + "\nEND"
+    ),
+}
+
+# ============ POSTGRES ============
+
+def postgres_add(table: str, key: str) -> str:
+    return f"""IF NEW.{key} IS NOT NULL THEN
+            INSERT INTO {table} ({key}, product_count, price_sum, min_price, max_price, total_stock, updated_at)
+            VALUES (NEW.{key}, 1, NEW.price, NEW.price, NEW.price, coalesce(NEW.stock_quantity, 0), now() AT TIME ZONE 'utc')
+            ON CONFLICT ({key}) DO UPDATE SET
+                product_count = {table}.product_count + 1,
+                price_sum = {table}.price_sum + excluded.price_sum,
+                min_price = least({table}.min_price, excluded.min_price),
+                max_price = greatest({table}.max_price, excluded.max_price),
+                total_stock = {table}.total_stock + excluded.total_stock,
+                updated_at = excluded.updated_at;
+        END IF;"""
+
+def postgres_restock(table: str, key: str) -> str:
+    return f"""UPDATE {table} SET
+            total_stock = total_stock + coalesce(NEW.stock_quantity, 0) - coalesce(OLD.stock_quantity, 0),
+            updated_at = now() AT TIME ZONE 'utc'
+        WHERE {key} = NEW.{key};"""
+
+def postgres_remove(table: str, key: str) -> str:
+    return f"""UPDATE {table} SET
+            product_count = product_count - 1,
+            price_sum = price_sum - OLD.price,
+            min_price = CASE WHEN OLD.price <= min_price
+                THEN (SELECT min(price) FROM products WHERE {key} = OLD.{key} AND is_active) ELSE min_price END,
+            max_price = CASE WHEN OLD.price >= max_price
+                THEN (SELECT max(price) FROM products WHERE {key} = OLD.{key} AND is_active) ELSE max_price END,
+            total_stock = total_stock - coalesce(OLD.stock_quantity, 0),
+            updated_at = now() AT TIME ZONE 'utc'
+        WHERE {key} = OLD.{key};
+        DELETE FROM {table} WHERE {key} = OLD.{key} AND product_count <= 0;"""
+
+POSTGRES_DDL = [
+    f"""CREATE OR REPLACE FUNCTION products_stats_update() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.is_active AND NEW.is_active AND OLD.price = NEW.price
+                AND OLD.category IS NOT DISTINCT FROM NEW.category AND OLD.store_id IS NOT DISTINCT FROM NEW.store_id THEN
+            IF OLD.stock_quantity IS DISTINCT FROM NEW.stock_quantity THEN
+                {" ".join(postgres_restock(*group) for group in GROUPS)}
+            END IF;
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            IF OLD.is_active THEN
+                {" ".join(postgres_remove(*group) for group in GROUPS)}
+            END IF;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            IF NEW.is_active THEN
+                {" ".join(postgres_add(*group) for group in GROUPS)}
+            END IF;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS products_stats ON products",
+    """CREATE TRIGGER products_stats
+        AFTER INSERT OR DELETE OR UPDATE OF price, stock_quantity, category, store_id, is_active ON products
+        FOR EACH ROW EXECUTE FUNCTION products_stats_update()""",
+]
+
+# ============ INSTALL / REBUILD ============
+
+def triggers_exist(conn) -> bool:
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        return conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'products_stats_insert'"
+        ).first() is not None
+    if dialect == "postgresql":
+        return conn.exec_driver_sql("SELECT 1 FROM pg_trigger WHERE tgname = 'products_stats'").first() is not None
+    return False
+
+def install(engine):
+    """Create the maintenance triggers, filling the tables the first time (idempotent)"""
+    with engine.begin() as conn:
+        install_schema(conn)
+
+def install_schema(conn):
+    fresh = not triggers_exist(conn)
+    create_triggers(conn)
+    if fresh:
+        rebuild(conn)
+
+def create_triggers(conn):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        for name, body in SQLITE_TRIGGERS.items():
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+            conn.exec_driver_sql(f"CREATE TRIGGER {name} {body}")
+    elif dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            conn.exec_driver_sql(statement)
+
+def drop_schema(conn):
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        for name in SQLITE_TRIGGERS:
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    elif dialect == "postgresql":
+        conn.exec_driver_sql("DROP TRIGGER IF EXISTS products_stats ON products")
+
+def rebuild(conn) -> dict:
+    """Recompute both tables from products with one GROUP BY each"""
+    now = datetime.utcnow()
+    rows = {}
+    for table, key in GROUPS:
+        conn.execute(text(f"DELETE FROM {table}"))
+        result = conn.execute(text(f"""
+            INSERT INTO {table} ({key}, product_count, price_sum, min_price, max_price, total_stock, updated_at)
+            SELECT {key}, count(*), sum(price), min(price), max(price), coalesce(sum(stock_quantity), 0), :now
+            FROM products
+            WHERE is_active AND {key} IS NOT NULL
+            GROUP BY {key}
+        """), {"now": now})
+        rows[table] = result.rowcount
+    return rows
+
+@contextmanager
+def bulk_load(session):
+    """Suspend the triggers around a bulk rewrite and rebuild the tables afterwards"""
+    drop_schema(session.connection())
+    session.commit()
+    try:
+        yield
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        conn = session.connection()
+        rebuild(conn)
+        create_triggers(conn)
+        session.commit()
+
+def rebuild_job(ctx) -> dict:
+    """jobs handler behind POST /stats/rebuild"""
+    import database
+    with database.engine.begin() as conn:
+        return rebuild(conn)
+
+def main():
+    parser = argparse.ArgumentParser(description="Dundalk Market aggregate tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+
+    import database
+    import migrate
+    migrate.upgrade()
+    with database.engine.begin() as conn:
+        counts = rebuild(conn)
+        create_triggers(conn)
+    print(f"✅ Rebuilt {counts['store_stats']} store and {counts['category_stats']} category aggregates")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import json
+import os
+import subprocess
+import sys
+
+from benchmark import BACKEND_DIR, DEFERRED_MODULES
+
+def test_import_main_defers_heavy_modules(tmp_path):
+    """The budget `benchmark.py coldstart` enforces, minus the timing: importing main
+    loads none of DEFERRED_MODULES and does not touch the database"""
+    database_path = tmp_path / "cold.db"
+    completed = subprocess.run(
+        [sys.executable, "-c", "import json, sys, main; print(json.dumps(sorted(sys.modules)))"],
+        cwd=BACKEND_DIR, env=dict(os.environ, DATABASE_URL=f"sqlite:///{database_path}"),
+        capture_output=True, text=True, check=True,
+    )
+    loaded = set(json.loads(completed.stdout.splitlines()[-1]))
+    assert sorted(loaded.intersection(DEFERRED_MODULES)) == []
+    assert not database_path.exists()
@@ -0,0 +1,15 @@
+import pytest
+from fastapi import HTTPException
+
+from main import decode_cursor, encode_cursor
+
+def test_round_trip():
+    assert decode_cursor(encode_cursor(42)) == 42
+    assert decode_cursor(encode_cursor(0)) == 0
+    assert decode_cursor(None) is None
+
+@pytest.mark.parametrize("cursor", [encode_cursor(-1), "not base64!", encode_cursor("abc")])
+def test_rejects_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor(cursor)
+    assert (raised.value.status_code, raised.value.detail) == (400, "Invalid cursor")
@@ -0,0 +1,71 @@
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import database
+import idempotency
+import models
+
+@pytest.fixture
+def key_table(monkeypatch):
+    """IDEMPOTENCY_BACKEND=database on an in-memory idempotency_keys table"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    models.IdempotencyKey.__table__.create(engine)
+    # Through the module dict: reading database.SessionLocal would build the real engines
+    monkeypatch.setitem(vars(database), "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_BACKEND", "database")
+    # A claim left behind would make the retry wait this long, then 409
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 1.0)
+    monkeypatch.setattr(idempotency, "store", idempotency.MemoryStore())
+    yield vars(database)["SessionLocal"]
+    engine.dispose()
+
+def flaky_app(failures: int):
+    calls = []
+
+    async def create(request):
+        calls.append(await request.body())
+        if len(calls) <= failures:
+            raise RuntimeError("handler failed")
+        return JSONResponse({"created": len(calls)}, status_code=201)
+
+    app = Starlette(routes=[Route("/things", create, methods=["POST"])], middleware=[Middleware(idempotency.IdempotencyMiddleware)])
+    return app, calls
+
+def test_retry_runs_again_after_handler_raised(key_table):
+    app, calls = flaky_app(failures=1)
+    client = TestClient(app, raise_server_exceptions=False)
+    headers = {"Idempotency-Key": "abc"}
+
+    assert client.post("/things", content=b"{}", headers=headers).status_code == 500
+    with key_table() as session:
+        assert session.scalars(select(models.IdempotencyKey.key)).all() == []
+
+    retry = client.post("/things", content=b"{}", headers=headers)
+    assert retry.status_code == 201
+    assert "idempotent-replayed" not in retry.headers
+    assert len(calls) == 2
+
+    replay = client.post("/things", content=b"{}", headers=headers)
+    assert replay.status_code == 201
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 2
+
+def test_stored_response_replays_on_another_worker(key_table, monkeypatch):
+    app, calls = flaky_app(failures=0)
+    client = TestClient(app)
+    headers = {"Idempotency-Key": "abc"}
+
+    assert client.post("/things", content=b"{}", headers=headers).status_code == 201
+    # A fresh in-process store stands in for a second worker sharing the table
+    monkeypatch.setattr(idempotency, "store", idempotency.MemoryStore())
+    replay = client.post("/things", content=b"{}", headers=headers)
+    assert replay.status_code == 201
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 1
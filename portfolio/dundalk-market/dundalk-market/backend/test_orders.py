@@ -0,0 +1,72 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import models
+import orders
+from database import Base
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as session:
+        store = models.Store(name="Test Store", email="store@example.com", is_approved=True)
+        session.add(store)
+        session.flush()
+        session.add_all([
+            models.Product(id=1, store_id=store.id, name="Kept", price=2.0, stock_quantity=5),
+            models.Product(id=2, store_id=store.id, name="Deleted", price=3.0, stock_quantity=5),
+        ])
+        session.commit()
+        yield session
+    engine.dispose()
+
+def test_cancel_restocks(session):
+    order, stock = orders.place(session, [(1, 2)])
+    assert stock[1][1] == 3
+    cancelled, stock = orders.cancel(session, order.id)
+    assert cancelled.status == "cancelled"
+    assert stock[1][1] == 5
+
+def test_cancel_skips_deleted_product(session):
+    order, _ = orders.place(session, [(1, 2), (2, 1)])
+    session.execute(delete(models.Product).where(models.Product.id == 2))
+    session.commit()
+
+    cancelled, stock = orders.cancel(session, order.id)
+
+    assert cancelled.status == "cancelled"
+    assert list(stock) == [1]
+    assert session.get(models.Product, 1).stock_quantity == 5
+
+def test_expire_due_skips_deleted_product(session):
+    order, _ = orders.place(session, [(2, 1)])
+    order.expires_at = order.created_at
+    session.execute(delete(models.Product).where(models.Product.id == 2))
+    session.commit()
+
+    assert orders.expire_due(session) == {}
+    assert session.get(models.Order, order.id).status == "expired"
+    # Released once: the next sweep finds nothing left to do
+    assert orders.expire_due(session) == {}
+
+@pytest.mark.parametrize("product_id, status, detail", [
+    (99, 404, "Product 99 not found"),
+    (1, 409, "Insufficient stock for product 1"),
+])
+def test_place_reports_why_a_line_failed(session, product_id, status, detail):
+    with pytest.raises(HTTPException) as raised:
+        orders.place(session, [(product_id, 10)])
+    assert (raised.value.status_code, raised.value.detail) == (status, detail)
+
+def test_place_rejects_inactive_product(session):
+    session.get(models.Product, 2).is_active = False
+    session.commit()
+    with pytest.raises(HTTPException) as raised:
+        orders.place(session, [(1, 1), (2, 1)])
+    assert (raised.value.status_code, raised.value.detail) == (409, "Product 2 is not available")
+    # Nothing reserved for the line that did fit
+    assert session.get(models.Product, 1).stock_quantity == 5